@@ -3,25 +3,47 @@ Agente Coletor de Contexto
 Responsável por buscar e consolidar todos os dados do cliente no HubSpot Mock
 """
 
+import asyncio
+import os
 from hubspot_client import HubSpotClient
-from typing import Dict, Any
+from hubspot_scheduler import PRIORITY_BULK
+from ttl_cache import TTLCache
+from typing import Dict, Any, List
 
 
 class ContextCollectorAgent:
     def __init__(self):
         self.hubspot = HubSpotClient()
+        # Coletas em lote (campanhas) não competem com o bot pela cota
+        self.hubspot_bulk = HubSpotClient(priority=PRIORITY_BULK)
+        
+        # Cache (contact_id, days_back) -> contexto formatado
+        self.cache = TTLCache(
+            max_size=int(os.getenv("CONTEXT_CACHE_MAX_SIZE", "1000")),
+            ttl=float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "300")),
+            name="contact_context"
+        )
     
-    def collect(self, contact_id: str, days_back: int = 30) -> Dict[str, Any]:
+    def collect(self, contact_id: str, days_back: int = 30, use_cache: bool = True) -> Dict[str, Any]:
         """
         Coleta contexto completo de um contato do HubSpot
         
         Args:
             contact_id: ID do contato no HubSpot
             days_back: Quantos dias de histórico buscar (default: 30)
+            use_cache: Servir do cache se houver entrada válida (default: True)
             
         Returns:
-            Dict com contexto estruturado do cliente
+            Dict com contexto estruturado do cliente. Quando vem do cache, o
+            mesmo objeto é compartilhado entre chamadas: não modificar.
         """
+        cache_key = (str(contact_id), days_back)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"⚡ Contexto do cliente {contact_id} servido do cache")
+                return cached
+        
         print(f"🔍 Coletando contexto do cliente {contact_id}...")
         
         # Buscar todos os dados do contato
@@ -34,8 +56,118 @@ class ContextCollectorAgent:
               f"{len(context['tickets'])} tickets, "
               f"{len(context['emails'])} emails")
         
+        # Contexto parcial (HubSpot falhou após os retries) não entra no cache
+        if formatted_context["fontes_com_erro"]:
+            print(f"⚠️ Contexto incompleto ({', '.join(formatted_context['fontes_com_erro'])}), não será cacheado")
+            return formatted_context
+        
+        self.cache.set(cache_key, formatted_context)
         return formatted_context
     
+    async def acollect(self, contact_id: str, days_back: int = 30, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Versão async de collect: roda a coleta numa thread para não travar o event loop
+        
+        Requisições simultâneas para o mesmo contato continuam compartilhando uma
+        única busca no HubSpot (single-flight em HubSpotClient.get_contact_context).
+        """
+        return await asyncio.to_thread(self.collect, contact_id, days_back, use_cache)
+    
+    def collect_many(self, contact_ids: List[str], days_back: int = 30,
+                     use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Coleta o contexto de vários contatos de uma vez (ex: preparação de campanha)
+        
+        Contatos em cache são servidos direto; os demais vêm em poucas requisições
+        em lote (HubSpotClient.get_contexts_batch), na faixa de prioridade de lote.
+        
+        Returns:
+            Dict contact_id -> contexto formatado (mesmo formato de collect)
+        """
+        contact_ids = list(dict.fromkeys(str(contact_id) for contact_id in contact_ids))
+        results: Dict[str, Dict[str, Any]] = {}
+        
+        if use_cache:
+            for contact_id in contact_ids:
+                cached = self.cache.get((contact_id, days_back))
+                if cached is not None:
+                    results[contact_id] = cached
+        
+        missing = [contact_id for contact_id in contact_ids if contact_id not in results]
+        print(f"🔍 Coletando contexto de {len(missing)} clientes em lote "
+              f"({len(results)} servidos do cache)...")
+        
+        if missing:
+            contexts = self.hubspot_bulk.get_contexts_batch(missing, days_back)
+            for contact_id in missing:
+                formatted_context = self._format_context(contexts[contact_id])
+                if not formatted_context["fontes_com_erro"]:
+                    self.cache.set((contact_id, days_back), formatted_context)
+                results[contact_id] = formatted_context
+        
+        return {contact_id: results[contact_id] for contact_id in contact_ids}
+    
+    def invalidate(self, contact_id: str) -> int:
+        """
+        Remove do cache todos os contextos de um contato (qualquer days_back)
+        
+        Returns:
+            Quantidade de entradas removidas
+        """
+        contact_id = str(contact_id)
+        removed = self.cache.invalidate_where(lambda key, _: key[0] == contact_id)
+        return len(removed)
+    
+    def invalidate_object(self, object_id: str) -> int:
+        """
+        Remove do cache os contextos que contêm um objeto do CRM
+        (deal, ticket, email ou anotação) ou que pertencem ao contato com esse ID
+        
+        Returns:
+            Quantidade de entradas removidas
+        """
+        object_id = str(object_id)
+        
+        def contains_object(key, context: Dict[str, Any]) -> bool:
+            if key[0] == object_id:
+                return True
+            for section in ("negocios", "tickets", "emails", "anotacoes"):
+                if any(str(item.get("id")) == object_id for item in context.get(section, [])):
+                    return True
+            return False
+        
+        removed = self.cache.invalidate_where(contains_object)
+        return len(removed)
+    
+    def handle_crm_events(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Invalida o cache a partir de eventos de webhook do HubSpot
+        
+        - contact.*: invalida o contato
+        - *.associationChange: invalida os dois lados da associação
+        - demais objetos (deal, ticket, ...): invalida contextos que contêm o objeto
+        
+        Returns:
+            Quantidade de entradas removidas
+        """
+        removed = 0
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            subscription = str(event.get("subscriptionType", ""))
+            
+            if subscription.endswith("associationChange"):
+                for key in ("fromObjectId", "toObjectId"):
+                    if event.get(key) is not None:
+                        removed += self.invalidate_object(event[key])
+            elif subscription.startswith("contact."):
+                if event.get("objectId") is not None:
+                    removed += self.invalidate(event["objectId"])
+            elif event.get("objectId") is not None:
+                removed += self.invalidate_object(event["objectId"])
+        
+        return removed
+    
     def _format_context(self, context: Dict) -> Dict[str, Any]:
         """Formata o contexto em estrutura legível para outros agentes"""
         
@@ -74,7 +206,9 @@ class ContextCollectorAgent:
                 "quantidade_anotacoes": len(context.get("notes", [])),
                 "riscos_identificados": len(context.get("risks", []))
             },
-            "riscos": context.get("risks", [])
+            "riscos": context.get("risks", []),
+            # Fontes do HubSpot que falharam na coleta (vazio = contexto completo)
+            "fontes_com_erro": context.get("errors", [])
         }
         
         # Formatar deals
@@ -3,7 +3,7 @@ Gerador de Respostas Empáticas Inteligentes para NPS
 Usa TessLLM para criar respostas personalizadas baseadas no feedback do cliente
 """
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 import os
 import sys
 from pathlib import Path
@@ -80,6 +80,82 @@ Resposta:"""
             Mensagem empática personalizada e contextualizada
         """
         
+        prompt, categoria, nome = self._build_prompt(score, feedback_text, sentiment, cliente_dados)
+        
+        try:
+            # Gerar resposta com TessLLM
+            response = self.llm.invoke(prompt)
+            
+            print(f"✅ Resposta empática gerada via TessLLM (score: {score}, categoria: {categoria})")
+            return response.strip()
+            
+        except Exception as e:
+            print(f"❌ Erro ao gerar resposta empática: {e}")
+            # Fallback para resposta básica
+            return self._fallback_response(score, feedback_text, nome)
+    
+    @traceable(name="Empathetic Response Generation")
+    async def agenerate_response(
+        self, 
+        score: int, 
+        feedback_text: str = "",
+        conversation_history: List[Dict] = None,
+        sentiment: Dict[str, Any] = None,
+        cliente_dados: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Versão async de generate_response (mesmos argumentos e retorno)"""
+        prompt, categoria, nome = self._build_prompt(score, feedback_text, sentiment, cliente_dados)
+        
+        try:
+            response = await self.llm.ainvoke(prompt)
+            
+            print(f"✅ Resposta empática gerada via TessLLM (score: {score}, categoria: {categoria})")
+            return response.strip()
+            
+        except Exception as e:
+            print(f"❌ Erro ao gerar resposta empática: {e}")
+            return self._fallback_response(score, feedback_text, nome)
+    
+    async def astream_response(
+        self,
+        score: int,
+        feedback_text: str = "",
+        conversation_history: List[Dict] = None,
+        sentiment: Dict[str, Any] = None,
+        cliente_dados: Optional[Dict[str, Any]] = None,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """
+        Como agenerate_response, mas em streaming
+        
+        on_partial recebe o texto acumulado a cada trecho gerado (ex: para editar a
+        mensagem no Telegram). Retorna o texto final completo.
+        """
+        prompt, categoria, nome = self._build_prompt(score, feedback_text, sentiment, cliente_dados)
+        text = ""
+        
+        try:
+            async for chunk in self.llm.astream(prompt):
+                text += chunk
+                if on_partial is not None:
+                    await on_partial(text.strip())
+            
+            print(f"✅ Resposta empática gerada via TessLLM em streaming (score: {score}, categoria: {categoria})")
+            return text.strip()
+            
+        except Exception as e:
+            print(f"❌ Erro ao gerar resposta empática: {e}")
+            return self._fallback_response(score, feedback_text, nome)
+    
+    def _build_prompt(
+        self,
+        score: int,
+        feedback_text: str,
+        sentiment: Optional[Dict[str, Any]],
+        cliente_dados: Optional[Dict[str, Any]]
+    ) -> Tuple[str, str, str]:
+        """Monta o prompt da resposta; retorna (prompt, categoria, nome)"""
+        
         # Determinar categoria NPS
         if score <= 6:
             categoria = "DETRATOR"
@@ -91,7 +167,7 @@ Resposta:"""
         # Extrair sentimento
         sentimento_str = "NEUTRO"
         if sentiment:
-            sentimento_str = sentiment.get("sentimento", "NEUTRO")
+            sentimento_str = sentiment.get("sentimento_geral") or sentiment.get("sentimento", "NEUTRO")
         
         # Preparar contexto do cliente
         contexto_cliente = ""
@@ -154,19 +230,9 @@ PROMOTOR (9-10): Celebre e agradeça
 
 Resposta:"""
         
-        try:
-            # Gerar resposta com TessLLM
-            response = self.llm.invoke(prompt)
-            
-            print(f"✅ Resposta empática gerada via TessLLM (score: {score}, categoria: {categoria})")
-            return response.strip()
-            
-        except Exception as e:
-            print(f"❌ Erro ao gerar resposta empática: {e}")
-            # Fallback para resposta básica
-            return self._fallback_response(score, feedback_text, nome)
+        return prompt, categoria, nome
     
-    def _fallback_response(self, score: int, feedback: str, nome: str = "") -> str:
+    def _fallback_response(self, score: int, feedback_text: str, nome: str = "") -> str:
         """
         Resposta inteligente baseada em análise do feedback
         Mais sofisticada que templates fixos
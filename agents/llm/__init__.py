@@ -1,4 +1,5 @@
 # LangChain LLM module
 from .tess_llm import TessLLM
+from .response_cache import LLMResponseCache, get_response_cache
 
-__all__ = ["TessLLM"]
+__all__ = ["TessLLM", "LLMResponseCache", "get_response_cache"]
@@ -0,0 +1,185 @@
+"""
+Cache de respostas do LLM
+Prompts repetidos (mesma nota sem feedback, mesmo resumo) não voltam à Tess
+
+Dois níveis:
+    memória: LRU com TTL (ttl_cache.TTLCache)
+    disco: SQLite, sobrevive a restarts e é compartilhado entre workers do host
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from data_dir import connect_sqlite, data_path
+from ttl_cache import TTLCache
+
+load_dotenv()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class LLMResponseCache:
+    """
+    Cache determinístico chave -> resposta
+
+    Configuração (.env):
+        LLM_CACHE_MAX_SIZE: Entradas no nível de memória (default: 2000)
+        LLM_CACHE_TTL_SECONDS: Validade das respostas (default: 86400)
+        LLM_CACHE_DISK_ENABLED: Usar o nível em disco (default: true)
+        LLM_CACHE_PATH: Arquivo SQLite (default: <PARETO_DATA_DIR>/llm_cache.db),
+            aberto no primeiro acesso ao disco
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 path: Optional[str] = None, disk_enabled: Optional[bool] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+        self.memory = TTLCache(
+            max_size=max_size or int(os.getenv("LLM_CACHE_MAX_SIZE", "2000")),
+            ttl=self.ttl,
+            name="llm_response"
+        )
+
+        if disk_enabled is None:
+            disk_enabled = os.getenv("LLM_CACHE_DISK_ENABLED", "true").lower() != "false"
+        self.path = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        if disk_enabled:
+            self.path = path or os.getenv("LLM_CACHE_PATH", data_path("llm_cache.db"))
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Conexão do nível em disco (None se desligado); chamar com _lock"""
+        if self._conn is None and self.path is not None:
+            conn = connect_sqlite(self.path)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(agent_id: Optional[str], prompt: str, temperature: float, max_tokens: int) -> str:
+        """
+        Chave (agent_id, prompt normalizado, faixa de temperatura, max_tokens)
+
+        A faixa de temperatura é a mesma que o TessClient envia (0 ou 1), então
+        temperaturas que geram a mesma requisição compartilham a entrada.
+        """
+        normalized = _WHITESPACE.sub(" ", prompt).strip()
+        temperature_bucket = 1 if temperature > 0.5 else 0
+        raw = f"{agent_id or ''}\x1f{temperature_bucket}\x1f{max_tokens}\x1f{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Resposta em cache (memória, depois disco) ou None"""
+        response = self.memory.get(key)
+        if response is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return response
+
+        if self.path is not None:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT response, expires_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+            now = time.time()
+            if row and row[1] > now:
+                # Promove para a memória pelo tempo que ainda resta no disco
+                self.memory.set(key, row[0], ttl=row[1] - now)
+                with self._lock:
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str, ttl: Optional[float] = None):
+        """Armazena a resposta nos dois níveis"""
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, response, ttl=ttl)
+        with self._lock:
+            self.writes += 1
+            conn = self._connection()
+            if conn is not None:
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, response, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now + ttl)
+                )
+                conn.commit()
+
+    def purge_expired(self) -> int:
+        """Remove do disco as entradas vencidas; retorna quantas"""
+        if self.path is None:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        """Esvazia os dois níveis"""
+        self.memory.clear()
+        if self.path is not None:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("DELETE FROM llm_responses")
+                conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas do cache (hit rate por nível)"""
+        disk_size = None
+        with self._lock:
+            if self.path is not None:
+                disk_size = self._connection().execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_size": len(self.memory),
+                "disk_size": disk_size,
+                "ttl_seconds": self.ttl,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_evictions": self.memory.evictions
+            }
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """Cache padrão do processo, ou None se LLM_CACHE_ENABLED=false"""
+    global _default_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = LLMResponseCache()
+    return _default_cache
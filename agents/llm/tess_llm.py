@@ -3,11 +3,14 @@ Wrapper do TessClient para LangChain
 Permite usar TessClient com toda a infraestrutura do LangChain
 """
 
-from typing import Any, List, Optional, Dict
+from typing import Any, AsyncIterator, List, Optional, Dict
 from langchain_core.language_models.llms import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
-from tess_client import TessClient
+from langchain_core.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from tess_client import TessClient, FALLBACK_TEXT
+from agents.llm.response_cache import LLMResponseCache, get_response_cache
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -28,10 +31,16 @@ class TessLLM(LLM):
     tess_client: Optional[TessClient] = None
     temperature: float = 0.7
     max_tokens: int = 300
+    agent_id: Optional[str] = None
+    # Cache de respostas (ver response_cache.py); None usa o padrão do processo
+    response_cache: Optional[LLMResponseCache] = None
+    use_cache: bool = True
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.tess_client = TessClient()
+        if self.use_cache and self.response_cache is None:
+            self.response_cache = get_response_cache()
         logger.info("TessLLM initialized with temperature=%.2f, max_tokens=%d", 
                    self.temperature, self.max_tokens)
     
@@ -60,23 +69,133 @@ class TessLLM(LLM):
             Resposta gerada pelo LLM
             
         Raises:
-            Exception: Se houver erro na geração
+            TessUnavailableError: Se houver erro na geração
+            CircuitOpenError: Se o circuito da Tess estiver aberto (falha imediata,
+                o agente usa o fallback local sem esperar timeout)
         """
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        temperature = kwargs.get("temperature", self.temperature)
+        cache_key = self._cache_key(prompt, temperature, max_tokens)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Chamar TessClient com parâmetros configurados
             response = self.tess_client.generate(
                 prompt=prompt,
-                max_tokens=kwargs.get("max_tokens", self.max_tokens),
-                temperature=kwargs.get("temperature", self.temperature)
+                max_tokens=max_tokens,
+                temperature=temperature,
+                agent_id=self.agent_id,
+                raise_on_error=True
             )
             
             logger.debug("TessLLM generated %d characters", len(response))
-            return response.strip()
+            return self._cache_set(cache_key, response.strip())
             
         except Exception as e:
             logger.error("TessLLM error: %s", str(e))
             raise
     
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Versão async de _call (usada por ainvoke/abatch)
+        
+        Usa TessClient.agenerate sobre o httpx.AsyncClient compartilhado, sem
+        ocupar uma thread por chamada.
+        """
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        temperature = kwargs.get("temperature", self.temperature)
+        cache_key = self._cache_key(prompt, temperature, max_tokens)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self.tess_client.agenerate(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                agent_id=self.agent_id,
+                raise_on_error=True
+            )
+            
+            logger.debug("TessLLM generated %d characters", len(response))
+            return self._cache_set(cache_key, response.strip())
+            
+        except Exception as e:
+            logger.error("TessLLM error: %s", str(e))
+            raise
+    
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        """
+        Streaming de tokens via TessClient.astream (usado por llm.astream)
+        
+        Resposta em cache sai como um único trecho; a gerada é cacheada ao final.
+        """
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        temperature = kwargs.get("temperature", self.temperature)
+        cache_key = self._cache_key(prompt, temperature, max_tokens)
+        cached = self._cache_get(cache_key)
+        
+        if cached is not None:
+            stream = self._single_chunk(cached)
+        else:
+            stream = self.tess_client.astream(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                agent_id=self.agent_id,
+                raise_on_error=True
+            )
+        
+        parts: List[str] = []
+        async for text in stream:
+            parts.append(text)
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+        
+        if cached is None:
+            self._cache_set(cache_key, "".join(parts).strip())
+    
+    @staticmethod
+    async def _single_chunk(text: str) -> AsyncIterator[str]:
+        yield text
+    
+    def _cache_key(self, prompt: str, temperature: float, max_tokens: int) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        agent_id = self.agent_id or os.getenv("TESS_DEFAULT_AGENT_ID", "39004")
+        return LLMResponseCache.make_key(agent_id, prompt, temperature, max_tokens)
+    
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("TessLLM cache hit")
+        return cached
+    
+    def _cache_set(self, cache_key: Optional[str], response: str) -> str:
+        """Armazena a resposta; texto de fallback (falha da Tess) nunca é cacheado"""
+        if cache_key is not None and response and response != FALLBACK_TEXT:
+            self.response_cache.set(cache_key, response)
+        return response
+    
     @property
     def _identifying_params(self) -> Dict[str, Any]:
         """Parâmetros de identificação para logging e debugging"""
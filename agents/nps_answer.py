@@ -0,0 +1,249 @@
+"""
+Agente de Resposta NPS Combinada
+Uma única chamada à Tess devolve, em JSON, o sentimento do feedback, a resposta
+empática ao cliente e o resumo executivo da avaliação (em vez de três chamadas)
+
+Cada campo é validado separadamente: o que vier ausente ou inválido usa o
+fallback local do agente correspondente, sem nova chamada ao LLM
+"""
+
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langsmith import traceable
+
+from agents.llm.tess_llm import TessLLM
+from agents.empathetic_response import EmpatheticResponseGenerator
+from agents.response_evaluator import ResponseEvaluatorAgent
+from supabase_client import supabase_client
+
+
+SENTIMENTOS_VALIDOS = ("POSITIVO", "NEUTRO", "NEGATIVO")
+RISCOS_VALIDOS = ("BAIXO", "MEDIO", "ALTO")
+MAX_RESPOSTA_CHARS = 1000
+MAX_RESUMO_CHARS = 500
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class NPSAnswerAgent:
+    def __init__(self, empathetic_generator: Optional[EmpatheticResponseGenerator] = None,
+                 response_evaluator: Optional[ResponseEvaluatorAgent] = None):
+        # Uma chamada com as três saídas: mais tokens de saída que cada chamada isolada
+        self.llm = TessLLM(temperature=0.7, max_tokens=500)
+        # Agentes usados apenas para os fallbacks locais por campo
+        self.empathetic_generator = empathetic_generator or EmpatheticResponseGenerator()
+        self.response_evaluator = response_evaluator or ResponseEvaluatorAgent()
+
+    @traceable(name="NPS Combined Answer")
+    def answer(self, score: int, feedback_text: str = "",
+               cliente_dados: Optional[Dict[str, Any]] = None,
+               contact_id: str = "unknown") -> Dict[str, Any]:
+        """
+        Sentimento, resposta empática e resumo executivo numa única chamada
+
+        Args:
+            score: Nota NPS (0-10)
+            feedback_text: Texto enviado pelo cliente
+            cliente_dados: Dados do cliente do HubSpot (opcional)
+            contact_id: Identificador para o log no Supabase
+
+        Returns:
+            Dict com "sentimento" (formato do SentimentAnalyzerAgent), "resposta",
+            "resumo_executivo" e "campos_fallback" (campos que usaram fallback local)
+        """
+        print(f"🧩 Gerando resposta NPS combinada: {score}/10...")
+        start_time = time.time()
+        prompt, nome = self._build_prompt(score, feedback_text, cliente_dados)
+
+        try:
+            raw = self.llm.invoke(prompt)
+            error_msg = None
+        except Exception as e:
+            print(f"⚠️ Erro na chamada combinada via TessLLM: {e}")
+            raw, error_msg = "", str(e)
+
+        result = self._result_from_response(raw, score, feedback_text, nome)
+        self._log_answer(contact_id, prompt, result, error_msg, (time.time() - start_time) * 1000)
+        return result
+
+    @traceable(name="NPS Combined Answer")
+    async def aanswer(self, score: int, feedback_text: str = "",
+                      cliente_dados: Optional[Dict[str, Any]] = None,
+                      contact_id: str = "unknown") -> Dict[str, Any]:
+        """Versão async de answer (ainvoke; log no Supabase fora do event loop)"""
+        print(f"🧩 Gerando resposta NPS combinada: {score}/10...")
+        start_time = time.time()
+        prompt, nome = self._build_prompt(score, feedback_text, cliente_dados)
+
+        try:
+            raw = await self.llm.ainvoke(prompt)
+            error_msg = None
+        except Exception as e:
+            print(f"⚠️ Erro na chamada combinada via TessLLM: {e}")
+            raw, error_msg = "", str(e)
+
+        result = self._result_from_response(raw, score, feedback_text, nome)
+        await asyncio.to_thread(
+            self._log_answer, contact_id, prompt, result, error_msg, (time.time() - start_time) * 1000
+        )
+        return result
+
+    def local_answer(self, score: int, feedback_text: str = "",
+                     cliente_dados: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Mesmo formato de answer, só com fallbacks locais (sem chamar o LLM)"""
+        return self._result_from_response("", score, feedback_text, self._client_name(cliente_dados))
+
+    @staticmethod
+    def _client_name(cliente_dados: Optional[Dict[str, Any]]) -> str:
+        if not cliente_dados:
+            return ""
+        return cliente_dados.get("properties", {}).get("firstname", "") or ""
+
+    def _build_prompt(self, score: int, feedback_text: str,
+                      cliente_dados: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        """Monta o prompt estruturado; retorna (prompt, nome)"""
+        categoria = self.response_evaluator._classify_nps(score)["categoria"]
+
+        nome = self._client_name(cliente_dados)
+
+        linha_nome = f"\n- Cliente: {nome}" if nome else ""
+        diretriz_nome = f"\n  - Use o nome {nome} na resposta" if nome else ""
+
+        prompt = f"""Você é a Tess, assistente empática da Pareto, e também analista de experiência do cliente.
+
+AVALIAÇÃO NPS:{linha_nome}
+- Score NPS: {score}/10
+- Categoria: {categoria}
+- Feedback: "{feedback_text if feedback_text else 'Sem feedback textual'}"
+
+TAREFAS:
+1. Classifique o sentimento do feedback.
+2. Escreva a resposta ao cliente:
+  - NATURAL e EMPÁTICA, genuína e humana{diretriz_nome}
+  - SEM EMOJIS, máximo 3-4 linhas
+  - DETRATOR (0-6): acolha e peça desculpas
+  - NEUTRO (7-8): agradeça e pergunte como melhorar
+  - PROMOTOR (9-10): celebre e agradeça
+3. Escreva o resumo executivo para o time (máximo 2 linhas, específico e acionável):
+  "[Classificação] - [Insight principal baseado no feedback]. [Ação sugerida específica]."
+
+Retorne APENAS um JSON, sem texto antes ou depois:
+{{
+  "sentimento_geral": "POSITIVO/NEUTRO/NEGATIVO",
+  "nivel_satisfacao": 0-10,
+  "risco_churn": "BAIXO/MEDIO/ALTO",
+  "justificativa": "explicação breve do sentimento",
+  "resposta": "mensagem para o cliente",
+  "resumo_executivo": "resumo para o time"
+}}"""
+
+        return prompt, nome
+
+    @staticmethod
+    def _parse_json(raw: str) -> Dict[str, Any]:
+        """Extrai o objeto JSON da resposta (tolera cercas ``` e texto em volta)"""
+        match = _JSON_OBJECT.search(raw or "")
+        if not match:
+            return {}
+        try:
+            data = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _result_from_response(self, raw: str, score: int, feedback_text: str, nome: str) -> Dict[str, Any]:
+        """Valida campo a campo; inválidos usam o fallback local correspondente"""
+        data = self._parse_json(raw)
+        fallbacks: List[str] = []
+
+        sentimento = self._validate_sentiment(data, score)
+        if sentimento is None:
+            fallbacks.append("sentimento")
+            sentimento = self.score_sentiment(score)
+
+        resposta = self._validate_text(data.get("resposta"), MAX_RESPOSTA_CHARS)
+        if resposta is None:
+            fallbacks.append("resposta")
+            resposta = self.empathetic_generator._fallback_response(score, feedback_text, nome)
+
+        resumo = self._validate_text(data.get("resumo_executivo"), MAX_RESUMO_CHARS)
+        if resumo is None:
+            fallbacks.append("resumo_executivo")
+            resumo = self._fallback_summary(score, feedback_text)
+
+        if fallbacks:
+            print(f"📝 Campos com fallback local: {', '.join(fallbacks)}")
+        else:
+            print("✅ Resposta NPS combinada gerada via TessLLM (1 chamada)")
+
+        return {
+            "sentimento": sentimento,
+            "resposta": resposta,
+            "resumo_executivo": resumo,
+            "campos_fallback": fallbacks
+        }
+
+    @staticmethod
+    def _validate_sentiment(data: Dict[str, Any], score: int) -> Optional[Dict[str, Any]]:
+        sentimento = str(data.get("sentimento_geral", "")).upper()
+        if sentimento not in SENTIMENTOS_VALIDOS:
+            return None
+
+        try:
+            nivel = int(data.get("nivel_satisfacao", score))
+        except (TypeError, ValueError):
+            nivel = score
+        risco = str(data.get("risco_churn", "")).upper()
+
+        return {
+            "sentimento_geral": sentimento,
+            "nivel_satisfacao": max(0, min(10, nivel)),
+            "risco_churn": risco if risco in RISCOS_VALIDOS else None,
+            "justificativa": str(data.get("justificativa", ""))[:200]
+        }
+
+    @staticmethod
+    def _validate_text(value: Any, max_chars: int) -> Optional[str]:
+        if not isinstance(value, str):
+            return None
+        value = value.strip()
+        if not value or len(value) > max_chars:
+            return None
+        return value
+
+    @staticmethod
+    def score_sentiment(score: int) -> Dict[str, Any]:
+        """Sentimento derivado só da nota (fallback sem LLM)"""
+        if score <= 6:
+            return {"sentimento_geral": "NEGATIVO", "nivel_satisfacao": score}
+        elif score <= 8:
+            return {"sentimento_geral": "NEUTRO", "nivel_satisfacao": score}
+        else:
+            return {"sentimento_geral": "POSITIVO", "nivel_satisfacao": score}
+
+    def _fallback_summary(self, score: int, feedback_text: str) -> str:
+        evaluator = self.response_evaluator
+        classification = evaluator._classify_nps(score)
+        insights = evaluator._extract_insights(feedback_text, score)
+        return evaluator._generate_fallback_summary(
+            score, classification["categoria"], classification["emoji"],
+            insights.get("sentimento_detectado", "AUSENTE"), insights.get("temas", [])
+        )
+
+    def _log_answer(self, contact_id: str, prompt: str, result: Dict[str, Any],
+                    error_msg: Optional[str], processing_time: float):
+        """Logar interação no Supabase"""
+        supabase_client.log_interaction(
+            contact_id=contact_id,
+            interaction_type="nps_combined_answer",
+            agent_name="NPSAnswerAgent",
+            input_data={"prompt_len": len(prompt)},
+            output_data=result,
+            success=True,
+            error_message=error_msg,
+            processing_time_ms=processing_time
+        )
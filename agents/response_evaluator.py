@@ -5,6 +5,7 @@ Responsável por classificar respostas NPS e extrair insights
 MIGRADO PARA LANGCHAIN: Usa TessLLM wrapper para orquestração via LangChain
 """
 
+import asyncio
 from typing import Dict, Any, Optional
 from langchain_core.prompts import PromptTemplate
 # from langchain.chains import LLMChain (Removed for core compatibility)
@@ -54,7 +55,8 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
         # self.summary_chain = LLMChain(llm=self.llm, prompt=self.summary_prompt)
     
     @traceable(name="NPS Evaluation")
-    def evaluate(self, nps_score: int, feedback_text: str = "", context: Dict[str, Any] = None) -> Dict[str, Any]:
+    def evaluate(self, nps_score: int, feedback_text: str = "", context: Dict[str, Any] = None,
+                 resumo_executivo: Optional[str] = None) -> Dict[str, Any]:
         """
         Avalia a resposta de NPS do cliente
         
@@ -62,6 +64,8 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
             nps_score: Nota NPS (0-10)
             feedback_text: Texto de feedback opcional
             context: Contexto do cliente (opcional)
+            resumo_executivo: Resumo já gerado (ex: pelo NPSAnswerAgent); se
+                informado, não chama o LLM
             
         Returns:
             Dict com classificação e insights
@@ -69,7 +73,42 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
         print(f"📊 Avaliando resposta NPS: {nps_score}/10...")
         
         start_time = time.time()
+        result = self._build_result(nps_score, feedback_text, context)
+        result["resumo_executivo"] = resumo_executivo or self._generate_summary(
+            nps_score, result["classificacao"], result["insights"], feedback_text, context
+        )
+        
+        processing_time = (time.time() - start_time) * 1000
+        print(f"✅ Avaliação: {result['classificacao']['categoria']} | Prioridade: {result['prioridade']}")
         
+        self._persist_evaluation(result, context, processing_time)
+        
+        return result
+    
+    @traceable(name="NPS Evaluation")
+    async def aevaluate(self, nps_score: int, feedback_text: str = "", context: Dict[str, Any] = None,
+                        resumo_executivo: Optional[str] = None) -> Dict[str, Any]:
+        """Versão async de evaluate: resumo via ainvoke e gravação no Supabase fora do event loop"""
+        print(f"📊 Avaliando resposta NPS: {nps_score}/10...")
+        
+        start_time = time.time()
+        result = self._build_result(nps_score, feedback_text, context)
+        if resumo_executivo:
+            result["resumo_executivo"] = resumo_executivo
+        else:
+            result["resumo_executivo"] = await self._agenerate_summary(
+                nps_score, result["classificacao"], result["insights"], feedback_text, context
+            )
+        
+        processing_time = (time.time() - start_time) * 1000
+        print(f"✅ Avaliação: {result['classificacao']['categoria']} | Prioridade: {result['prioridade']}")
+        
+        await asyncio.to_thread(self._persist_evaluation, result, context, processing_time)
+        
+        return result
+    
+    def _build_result(self, nps_score: int, feedback_text: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Classificação, insights, ações e prioridade (parte determinística da avaliação)"""
         # Classificar NPS
         classification = self._classify_nps(nps_score)
         
@@ -79,18 +118,21 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
         # Identificar ações recomendadas
         actions = self._recommend_actions(nps_score, insights, context)
         
-        result = {
+        return {
             "nps_score": nps_score,
             "classificacao": classification,
             "feedback_texto": feedback_text,
             "insights": insights,
             "acoes_recomendadas": actions,
-            "prioridade": self._calculate_priority(nps_score, insights),
-            "resumo_executivo": self._generate_summary(nps_score, classification, insights, feedback_text, context)
+            "prioridade": self._calculate_priority(nps_score, insights)
         }
+    
+    def _persist_evaluation(self, result: Dict[str, Any], context: Optional[Dict[str, Any]], processing_time: float):
+        """Registra a avaliação no Supabase (interação + campanha)"""
+        nps_score = result["nps_score"]
+        feedback_text = result["feedback_texto"]
+        classification = result["classificacao"]
         
-        processing_time = (time.time() - start_time) * 1000
-        print(f"✅ Avaliação: {classification['categoria']} | Prioridade: {result['prioridade']}")
         
         # 1. Logar interação de avaliação
         contact_id = "unknown"
@@ -119,8 +161,6 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
                     "response_date": datetime.now().isoformat()
                 }
             )
-        
-        return result
 
     
     def _classify_nps(self, score: int) -> Dict[str, Any]:
@@ -313,16 +353,7 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
         temas = insights.get("temas", [])
         
         try:
-            # Executar LangChain chain (Manual formatting for Core compatibility)
-            prompt_value = self.summary_prompt.format_prompt(
-                score=score,
-                categoria=categoria,
-                emoji=emoji,
-                sentimento=sentimento,
-                feedback=feedback_text if feedback_text else "Sem feedback textual",
-                temas=", ".join(temas) if temas else "Nenhum"
-            )
-            resumo = self.llm.invoke(prompt_value.to_string())
+            resumo = self.llm.invoke(self._summary_prompt_text(score, classification, insights, feedback_text))
             
             print(f"✅ Resumo executivo gerado via LangChain")
             return resumo.strip()
@@ -332,6 +363,37 @@ IMPORTANTE: Retorne APENAS o resumo, sem explicações."""
             print("📝 Usando fallback para template padrão")
             return self._generate_fallback_summary(score, categoria, emoji, sentimento, temas)
     
+    async def _agenerate_summary(self, score: int, classification: Dict, insights: Dict, feedback_text: str = "", context: Optional[Dict] = None) -> str:
+        """Versão async de _generate_summary"""
+        categoria = classification["categoria"]
+        emoji = classification["emoji"]
+        sentimento = insights.get("sentimento_detectado", "AUSENTE")
+        temas = insights.get("temas", [])
+        
+        try:
+            resumo = await self.llm.ainvoke(self._summary_prompt_text(score, classification, insights, feedback_text))
+            
+            print(f"✅ Resumo executivo gerado via LangChain")
+            return resumo.strip()
+            
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar resumo via LangChain: {e}")
+            print("📝 Usando fallback para template padrão")
+            return self._generate_fallback_summary(score, categoria, emoji, sentimento, temas)
+    
+    def _summary_prompt_text(self, score: int, classification: Dict, insights: Dict, feedback_text: str = "") -> str:
+        """Formata o prompt do resumo executivo (Manual formatting for Core compatibility)"""
+        temas = insights.get("temas", [])
+        prompt_value = self.summary_prompt.format_prompt(
+            score=score,
+            categoria=classification["categoria"],
+            emoji=classification["emoji"],
+            sentimento=insights.get("sentimento_detectado", "AUSENTE"),
+            feedback=feedback_text if feedback_text else "Sem feedback textual",
+            temas=", ".join(temas) if temas else "Nenhum"
+        )
+        return prompt_value.to_string()
+    
     def _generate_fallback_summary(self, score: int, categoria: str, emoji: str, sentimento: str, temas: list) -> str:
         """Resumo de fallback caso o LLM falhe"""
         
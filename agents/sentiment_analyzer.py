@@ -4,8 +4,9 @@ Responsável por analisar o contexto do cliente e identificar sentimento/riscos
 Usa TessLLM para análise contextual
 """
 
+import asyncio
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import time
 from datetime import datetime
 from langsmith import traceable
@@ -42,16 +43,7 @@ class SentimentAnalyzerAgent:
         # Usar TessLLM para análise
         try:
             response = self.llm.invoke(prompt)
-            
-            # Tentar parsear JSON da resposta
-            try:
-                analysis = json.loads(response)
-            except json.JSONDecodeError:
-                # Se não for JSON válido, fazer análise simples
-                print("⚠️ Resposta não é JSON, usando análise simplificada")
-                analysis = self._parse_text_analysis(response, context)
-            
-            print(f"✅ Análise concluída: Sentimento {analysis.get('sentimento_geral', 'NEUTRO')}")
+            analysis = self._analysis_from_response(response, context)
             
         except Exception as e:
             print(f"⚠️ Erro na análise via TessLLM: {e}")
@@ -64,7 +56,59 @@ class SentimentAnalyzerAgent:
         processing_time = (time.time() - start_time) * 1000
         print(f"✅ Análise concluída: Sentimento {analysis.get('sentimento_geral', 'N/A')}")
         
-        # Logar interação no Supabase
+        self._log_analysis(context, prompt, analysis, success, error_msg, processing_time)
+        
+        return analysis
+    
+    @traceable(name="Sentiment Analysis")
+    async def aanalyze(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Versão async de analyze: não bloqueia o event loop durante a chamada à Tess
+        
+        Args:
+            context: Contexto formatado do cliente (vindo do ContextCollector)
+            
+        Returns:
+            Dict com análise de sentimento e riscos
+        """
+        print("🧠 Analisando sentimento e riscos do cliente...")
+        
+        start_time = time.time()
+        error_msg = None
+        prompt = self._build_analysis_prompt(context)
+        
+        try:
+            response = await self.llm.ainvoke(prompt)
+            analysis = self._analysis_from_response(response, context)
+        except Exception as e:
+            print(f"⚠️ Erro na análise via TessLLM: {e}")
+            analysis = self._local_analysis(context)
+            error_msg = str(e)
+        
+        processing_time = (time.time() - start_time) * 1000
+        print(f"✅ Análise concluída: Sentimento {analysis.get('sentimento_geral', 'N/A')}")
+        
+        # Log no Supabase é I/O bloqueante: fora do event loop
+        await asyncio.to_thread(self._log_analysis, context, prompt, analysis, True, error_msg, processing_time)
+        
+        return analysis
+    
+    def _analysis_from_response(self, response: str, context: Dict) -> Dict[str, Any]:
+        """Interpreta a resposta da Tess (JSON ou texto livre)"""
+        # Tentar parsear JSON da resposta
+        try:
+            analysis = json.loads(response)
+        except json.JSONDecodeError:
+            # Se não for JSON válido, fazer análise simples
+            print("⚠️ Resposta não é JSON, usando análise simplificada")
+            analysis = self._parse_text_analysis(response, context)
+        
+        print(f"✅ Análise concluída: Sentimento {analysis.get('sentimento_geral', 'NEUTRO')}")
+        return analysis
+    
+    def _log_analysis(self, context: Dict, prompt: str, analysis: Dict, success: bool,
+                      error_msg: Optional[str], processing_time: float):
+        """Logar interação no Supabase"""
         supabase_client.log_interaction(
             contact_id=context.get("cliente", {}).get("id", "unknown"),
             interaction_type="sentiment_analysis",
@@ -75,8 +119,6 @@ class SentimentAnalyzerAgent:
             error_message=error_msg,
             processing_time_ms=processing_time
         )
-        
-        return analysis
     
     def _build_analysis_prompt(self, context: Dict) -> str:
         """Constrói prompt para análise de sentimento"""
@@ -3,17 +3,22 @@ NPS Multi-Agent API - Pareto Case
 API FastAPI para expor o sistema multi-agente NPS
 """
 
+import asyncio
 import sys
 import traceback
 import os
+import hashlib
+import hmac
+import json
 
 # Remover path absoluto para compatibilidade com Vercel
 # sys.path.append('/Users/julianamoraesferreira/Documents/Projetos-Dev-Petrick/pareto-case/langchain')
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import uvicorn
 
 from agents.context_collector import ContextCollectorAgent
@@ -21,11 +26,20 @@ from agents.sentiment_analyzer import SentimentAnalyzerAgent
 from agents.message_generator import MessageGeneratorAgent
 from agents.response_evaluator import ResponseEvaluatorAgent
 from agents.empathetic_response import EmpatheticResponseGenerator
-from hubspot_client import HubSpotClient
-from telegram_client import TelegramClient
+from agents.llm.response_cache import get_response_cache
+from hubspot_client import HubSpotClient, context_flights
+from telegram_client import TelegramClient, TelegramStreamingReply
+from telegram_client import close_async_http_client as close_telegram_http_client
+from tess_client import close_async_http_client, tess_breaker
+from deadline import deadline_scope
+from task_queue import task_queue
+from chat_executor import MailboxFull, chat_executor
 from fastapi import Request, Header
 from langsmith import traceable
 from supabase_client import supabase_client
+from http_pool import http_pool
+from hubspot_scheduler import hubspot_scheduler
+from services.cliente_service import cliente_service
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -53,6 +67,9 @@ empathetic_generator = EmpatheticResponseGenerator()
 hubspot_client = HubSpotClient()
 telegram_client = TelegramClient()
 
+# Tempo máximo para responder uma mensagem do Telegram (segundos)
+TELEGRAM_REPLY_BUDGET_SECONDS = float(os.getenv("TELEGRAM_REPLY_BUDGET_SECONDS", "8"))
+
 # Modelos Pydantic
 class EvaluateRequest(BaseModel):
     score: int
@@ -75,17 +92,79 @@ class ManualMessageRequest(BaseModel):
     manager_id: Optional[str] = None
 
 
+class BatchContextRequest(BaseModel):
+    contact_ids: List[str]
+    days_back: int = 30
+
+
 class ManualModeRequest(BaseModel):
     chat_id: str
     manager_id: Optional[str] = None
 
 
+@app.on_event("startup")
+async def start_task_queue():
+    """Inicia os workers da fila pós-resposta (e retoma o spillover em disco)"""
+    await task_queue.start()
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    """Limpeza periódica de sessões ociosas"""
+    from conversation_manager import conversation_manager
+    conversation_manager.start_sweeper()
+
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    from conversation_manager import conversation_manager
+    await conversation_manager.stop_sweeper()
+
+
+@app.on_event("shutdown")
+async def stop_task_queue():
+    """Drena a fila pós-resposta; o que não terminar fica em disco"""
+    await task_queue.stop(timeout=float(os.getenv("TASK_QUEUE_SHUTDOWN_TIMEOUT_SECONDS", "10")))
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Fecha os httpx.AsyncClient compartilhados da Tess e do Telegram"""
+    await close_async_http_client()
+    await close_telegram_http_client()
+
+
 @app.get("/health")
 async def health_check():
     """Health check da API"""
     return {"status": "ok", "service": "nps-agent-api"}
 
 
+@app.get("/metrics/runtime")
+async def runtime_metrics():
+    """Métricas de runtime (pools, caches, filas) para monitoramento"""
+    return {
+        "http_pool": http_pool.stats(),
+        "context_cache": context_collector.cache.stats(),
+        "cliente_cache": cliente_service.cache.stats(),
+        "hubspot_mirror": context_collector.hubspot.mirror.stats() if context_collector.hubspot.mirror else None,
+        "hubspot_scheduler": hubspot_scheduler.stats(),
+        "context_singleflight": context_flights.stats(),
+        "llm_cache": get_response_cache().stats() if get_response_cache() else None,
+        "tess_breaker": tess_breaker.stats(),
+        "task_queue": task_queue.stats(),
+        "sessions": _session_stats(),
+        "chat_executor": chat_executor.stats(),
+        # Modo multi-processo (sharded_server.py): shard deste worker
+        "shard": {"index": os.getenv("SHARD_INDEX"), "count": os.getenv("SHARD_COUNT")}
+    }
+
+
+def _session_stats():
+    from conversation_manager import conversation_manager
+    return conversation_manager.session_stats()
+
+
 @app.get("/contacts")
 async def list_contacts():
     """Lista os contact_ids disponíveis no mock"""
@@ -120,13 +199,32 @@ async def list_contacts():
         raise HTTPException(status_code=500, detail=f"Erro ao listar contatos: {str(e)}")
 
 
+@app.post("/nps/context/batch")
+async def get_context_batch(request: BatchContextRequest):
+    """Coleta o contexto de vários contatos em poucas requisições ao HubSpot"""
+    if not request.contact_ids:
+        raise HTTPException(status_code=400, detail="contact_ids vazio")
+    try:
+        contexts = await asyncio.to_thread(
+            context_collector.collect_many, request.contact_ids, days_back=request.days_back
+        )
+        return {
+            "total": len(contexts),
+            "status": "success",
+            "data": contexts
+        }
+    except Exception as e:
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Erro ao coletar contextos: {str(e)}")
+
+
 @app.post("/nps/context/{contact_id}")
 async def get_context(contact_id: str):
     """Executa apenas o ContextCollector para um contato"""
     try:
         print(f"DEBUG contact_id recebido: {contact_id}, tipo: {type(contact_id)}")
         print(f"🔍 Coletando contexto para contato {contact_id}...")
-        context = context_collector.collect(contact_id, days_back=30)
+        context = await context_collector.acollect(contact_id, days_back=30)
         
         if not context:
             raise HTTPException(status_code=404, detail=f"Contato {contact_id} não encontrado ou erro na coleta")
@@ -147,6 +245,58 @@ async def get_context(contact_id: str):
         raise HTTPException(status_code=500, detail=f"Erro ao coletar contexto: {str(e)}")
 
 
+@app.post("/nps/context/{contact_id}/invalidate")
+async def invalidate_context(contact_id: str):
+    """Remove o contexto em cache de um contato"""
+    removed = context_collector.invalidate(contact_id)
+    return {"contact_id": contact_id, "status": "invalidated", "entries_removed": removed}
+
+
+@app.post("/hubspot/webhook")
+async def hubspot_webhook(request: Request, x_hubspot_signature: str = Header(None),
+                          x_shard_broadcast: str = Header(None)):
+    """
+    Recebe eventos do HubSpot e invalida o cache de contexto afetado
+
+    No modo com shards a frente repassa o webhook a todos os workers; só o que
+    recebeu o original (sem x-shard-broadcast) atualiza o espelho compartilhado
+    """
+    body = await request.body()
+    
+    # Validar assinatura v1 (sha256 de client_secret + corpo), se configurada
+    client_secret = os.getenv("HUBSPOT_CLIENT_SECRET")
+    if client_secret:
+        expected = hashlib.sha256(client_secret.encode() + body).hexdigest()
+        if not x_hubspot_signature or not hmac.compare_digest(expected, x_hubspot_signature):
+            raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    try:
+        events = json.loads(body or b"[]")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Payload inválido")
+    if isinstance(events, dict):
+        events = [events]
+    
+    removed = context_collector.handle_crm_events(events)
+    if context_collector.hubspot.mirror is not None and not x_shard_broadcast:
+        # Chamadas ao HubSpot e gravação no SQLite fora do event loop
+        await asyncio.to_thread(context_collector.hubspot.mirror.apply_crm_events, events)
+    return {"status": "processed", "events": len(events), "entries_removed": removed}
+
+
+@app.post("/hubspot/mirror/sync")
+async def sync_hubspot_mirror():
+    """Sincronização incremental do espelho local do HubSpot (para cron)"""
+    mirror = context_collector.hubspot.mirror
+    if mirror is None:
+        raise HTTPException(status_code=404, detail="Espelho HubSpot desativado (HUBSPOT_MIRROR_ENABLED)")
+    try:
+        updated = await asyncio.to_thread(mirror.sync)
+        return {"status": "synced", "updated": updated, "mirror": mirror.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao sincronizar espelho: {str(e)}")
+
+
 @app.post("/nps/analyze/{contact_id}")
 async def analyze_contact(contact_id: str):
     """Executa ContextCollector + SentimentAnalyzer"""
@@ -154,12 +304,12 @@ async def analyze_contact(contact_id: str):
         print(f"🔍 Analisando contato {contact_id}...")
         
         # Etapa 1: Coletar contexto
-        context = context_collector.collect(contact_id, days_back=30)
+        context = await context_collector.acollect(contact_id, days_back=30)
         if not context:
             raise HTTPException(status_code=404, detail=f"Contato {contact_id} não encontrado")
         
         # Etapa 2: Analisar sentimento
-        analysis = sentiment_analyzer.analyze(context)
+        analysis = await sentiment_analyzer.aanalyze(context)
         
         return {
             "contact_id": contact_id,
@@ -180,15 +330,15 @@ async def generate_nps_message(contact_id: str):
         print(f"✉️ Gerando mensagem NPS para contato {contact_id}...")
         
         # Etapa 1: Coletar contexto
-        context = context_collector.collect(contact_id, days_back=30)
+        context = await context_collector.acollect(contact_id, days_back=30)
         if not context:
             raise HTTPException(status_code=404, detail=f"Contato {contact_id} não encontrado")
         
         # Etapa 2: Analisar sentimento
-        analysis = sentiment_analyzer.analyze(context)
+        analysis = await sentiment_analyzer.aanalyze(context)
         
         # Etapa 3: Gerar mensagem
-        message = message_generator.generate(context, analysis)
+        message = await asyncio.to_thread(message_generator.generate, context, analysis)
         
         return {
             "contact_id": contact_id,
@@ -209,16 +359,18 @@ async def evaluate_nps_response(request: EvaluateRequest):
     try:
         print(f"📊 Avaliando resposta NPS: {request.score}/10...")
         
-        result = response_evaluator.evaluate(
-            nps_score=request.score,
-            feedback_text=request.feedback,
-            context=None
-        )
-        
-        # Gerar resposta empática para o cliente
-        empathetic_response = empathetic_generator.generate_response(
-            score=request.score,
-            feedback_text=request.feedback
+        # Avaliação e resposta empática são independentes: chamadas à Tess em paralelo
+        result, empathetic_response = await asyncio.gather(
+            response_evaluator.aevaluate(
+                nps_score=request.score,
+                feedback_text=request.feedback,
+                context=None
+            ),
+            # Gerar resposta empática para o cliente
+            empathetic_generator.agenerate_response(
+                score=request.score,
+                feedback_text=request.feedback
+            )
         )
         
         return EvaluateResponse(
@@ -241,15 +393,15 @@ async def run_full_nps_flow(contact_id: str):
         print(f"🚀 Executando fluxo NPS completo para contato {contact_id}...")
         
         # Etapa 1: Coletar contexto
-        context = context_collector.collect(contact_id, days_back=30)
+        context = await context_collector.acollect(contact_id, days_back=30)
         if not context:
             raise HTTPException(status_code=404, detail=f"Contato {contact_id} não encontrado")
         
         # Etapa 2: Analisar sentimento
-        analysis = sentiment_analyzer.analyze(context)
+        analysis = await sentiment_analyzer.aanalyze(context)
         
         # Etapa 3: Gerar mensagem
-        message = message_generator.generate(context, analysis)
+        message = await asyncio.to_thread(message_generator.generate, context, analysis)
         
         # Resumo consolidado - proteção para listas
         cliente = context.get("cliente", {}) if isinstance(context.get("cliente"), dict) else {}
@@ -410,19 +562,40 @@ async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: st
         # 2. Usar ConversationManager para processar mensagem
         from conversation_manager import conversation_manager
         
-        response_text = await conversation_manager.process_message(
-            chat_id=str(chat_id),
-            text=text
-        )
+        # Resposta empática exibida enquanto é gerada (sendMessage + editMessageText)
+        stream_sink = None
+        if os.getenv("TELEGRAM_STREAM_REPLIES", "false").lower() == "true":
+            stream_sink = TelegramStreamingReply(telegram_client, chat_id)
         
-        # 3. Enviar resposta (se houver)
-        if response_text:
+        # Orçamento de latência da resposta: agentes e clientes dimensionam
+        # seus timeouts pelo tempo restante e caem no fallback quando ele acaba
+        # Mensagens do mesmo chat em ordem, uma por vez; chats diferentes em paralelo
+        with deadline_scope(TELEGRAM_REPLY_BUDGET_SECONDS) as deadline:
+            response_text = await chat_executor.run(
+                str(chat_id),
+                conversation_manager.process_message,
+                chat_id=str(chat_id),
+                text=text,
+                stream_sink=stream_sink
+            )
+        print(f"⏱️ Mensagem processada em {deadline.elapsed():.2f}s (orçamento {deadline.budget:.0f}s)")
+        
+        # 3. Enviar resposta (se houver e ainda não tiver sido entregue em streaming)
+        if stream_sink is not None and stream_sink.delivered:
+            print(f"✅ Resposta enviada em streaming para {chat_id}")
+        elif response_text:
             await telegram_client.send_message(chat_id, response_text)
             print(f"✅ Resposta enviada para {chat_id}")
         else:
             print(f"⏸️ Sem resposta (modo manual ou outro motivo)")
         
         return {"status": "processed"}
+    
+    except MailboxFull as e:
+        # 429: o Telegram reenvia o update depois, sem perder a mensagem
+        print(f"🚦 {e}, pedindo reenvio ao Telegram")
+        return JSONResponse(status_code=429, content={"status": "busy", "retry_after": 1},
+                            headers={"Retry-After": "1"})
         
     except Exception as e:
         print(f"❌ Erro no Webhook Telegram: {e}")
@@ -437,8 +610,13 @@ if __name__ == "__main__":
     print("=" * 60)
     print("📡 Endpoints disponíveis:")
     print("  • GET  /health")
+    print("  • GET  /metrics/runtime")
     print("  • GET  /contacts")
+    print("  • POST /nps/context/batch")
     print("  • POST /nps/context/{contact_id}")
+    print("  • POST /nps/context/{contact_id}/invalidate")
+    print("  • POST /hubspot/webhook")
+    print("  • POST /hubspot/mirror/sync")
     print("  • POST /nps/analyze/{contact_id}")
     print("  • POST /nps/generate-message/{contact_id}")
     print("  • POST /nps/evaluate")
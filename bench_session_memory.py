@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memória das sessões de conversa
+Mede (tracemalloc) os bytes por sessão no layout antigo (classe com __dict__,
+histórico em lista sem limite e dados_cliente completo, com contexto) e no
+layout atual (dataclass com slots, buffer circular e cliente compacto), e
+projeta o total para N chats
+
+Uso:
+  python3 bench_session_memory.py
+  python3 bench_session_memory.py --chats 1000000 --sample 5000 --messages 80
+"""
+
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from conversation_manager import (
+    SESSION_HISTORY_LIMIT,
+    ConversationSession,
+    ConversationState,
+    compact_cliente,
+)
+from session_store import encode_session
+
+
+class LegacySession:
+    """Layout anterior: atributos em __dict__ e histórico sem limite"""
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.state = ConversationState.IDLE
+        self.nps_score: Optional[int] = None
+        self.feedback_text: str = ""
+        self.sentiment: Optional[str] = None
+        self.messages_history: list = []
+        self.created_at = datetime.now()
+        self.updated_at = datetime.now()
+        self.manual_mode = False
+        self.cliente_identificado: bool = False
+        self.dados_cliente: Optional[Dict[str, Any]] = None
+
+
+def sample_cliente(n: int) -> Dict[str, Any]:
+    """Cliente no formato do cliente_service (properties + contexto do HubSpot)"""
+    return {
+        "id": str(100000 + n),
+        "properties": {
+            "firstname": "Cliente",
+            "lastname": f"Teste {n}",
+            "email": f"cliente{n}@example.com",
+            "phone": "+55 11 99999-0000",
+            "company": "Pareto",
+            "lifecyclestage": "customer"
+        },
+        "contexto": {
+            "deals": [
+                {"id": str(n * 10 + i), "dealname": f"Contrato {i}", "amount": "1500", "dealstage": "closedwon"}
+                for i in range(3)
+            ],
+            "tickets": [
+                {"id": str(n * 10 + i), "subject": f"Chamado {i}", "hs_pipeline_stage": "closed"}
+                for i in range(4)
+            ],
+            "resumo": "Cliente ativo há 2 anos, 3 contratos e 4 chamados encerrados no período."
+        }
+    }
+
+
+def fill_session(session: Any, n: int, messages: int, compact: bool):
+    cliente = sample_cliente(n)
+    session.state = ConversationState.COMPLETED
+    session.nps_score = n % 11
+    session.feedback_text = "O atendimento foi bom, mas a entrega atrasou alguns dias."
+    session.sentiment = "NEUTRO"
+    session.cliente_identificado = True
+    session.dados_cliente = compact_cliente(cliente) if compact else cliente
+    for i in range(messages):
+        # deque(maxlen) no layout atual descarta as mais antigas; a lista cresce sem limite
+        session.messages_history.append({
+            "sender": "user" if i % 2 == 0 else "bot",
+            "text": f"Mensagem {i} da conversa {n}",
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+def bytes_per_session(factory: Callable[[int], Any], sample: int) -> float:
+    """Memória alocada (tracemalloc) por sessão mantida viva"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions: List[Any] = [factory(n) for n in range(sample)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del sessions
+    return allocated / sample
+
+
+def _legacy(messages: int) -> Callable[[int], Any]:
+    def factory(n: int) -> LegacySession:
+        session = LegacySession(str(n))
+        fill_session(session, n, messages, compact=False)
+        return session
+    return factory
+
+
+def _current(messages: int) -> Callable[[int], Any]:
+    def factory(n: int) -> ConversationSession:
+        session = ConversationSession(str(n))
+        fill_session(session, n, messages, compact=True)
+        return session
+    return factory
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:,.1f} {unit}"
+        value /= 1024
+    return f"{value:,.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes por sessão e projeção para N chats")
+    parser.add_argument("--chats", type=int, default=1_000_000, help="Chats para a projeção")
+    parser.add_argument("--sample", type=int, default=5000, help="Sessões medidas de fato")
+    parser.add_argument("--messages", type=int, default=80, help="Mensagens trocadas por chat")
+    args = parser.parse_args()
+
+    legacy = bytes_per_session(_legacy(args.messages), args.sample)
+    current = bytes_per_session(_current(args.messages), args.sample)
+
+    session = _current(args.messages)(0)
+    payload = len(encode_session(session.to_record()))
+
+    print(f"📊 {args.sample} sessões medidas, {args.messages} mensagens por chat "
+          f"(buffer de histórico: {SESSION_HISTORY_LIMIT})")
+    print(f"{'layout':<10} {'bytes/sessão':>15} {f'{args.chats:,} chats':>18}")
+    print(f"{'antigo':<10} {_format_bytes(legacy):>15} {_format_bytes(legacy * args.chats):>18}")
+    print(f"{'atual':<10} {_format_bytes(current):>15} {_format_bytes(current * args.chats):>18}")
+    print(f"{'store':<10} {_format_bytes(payload):>15} {_format_bytes(payload * args.chats):>18}")
+    print(f"✅ Redução em memória: {(1 - current / legacy) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Execução ordenada por chat
+Mensagens do mesmo chat são processadas estritamente na ordem de chegada
+(uma de cada vez); chats diferentes rodam em paralelo no mesmo event loop
+
+Cada chat tem uma "caixa de entrada" limitada: com CHAT_MAILBOX_SIZE mensagens
+pendentes (incluindo a que está rodando), novas mensagens são recusadas com
+MailboxFull e o webhook responde 429 para o Telegram reenviar depois
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class MailboxFull(Exception):
+    """Caixa de entrada do chat cheia"""
+
+
+class _ChatSlot:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        # asyncio.Lock acorda os waiters em ordem FIFO: garante a ordem por chat
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class ChatExecutor:
+    """
+    Executor com uma trava por chave (chat_id)
+
+    A corrotina roda na task de quem chamou run(): contextvars (deadline),
+    cancelamento e exceções seguem o fluxo normal do handler.
+
+    Configuração (.env):
+        CHAT_MAILBOX_SIZE: Mensagens pendentes por chat (default: 5)
+    """
+
+    def __init__(self, mailbox_size: Optional[int] = None, name: str = "chat"):
+        self.name = name
+        self.mailbox_size = mailbox_size or int(os.getenv("CHAT_MAILBOX_SIZE", "5"))
+        self._slots: Dict[str, _ChatSlot] = {}
+
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth_seen = 0
+        self._wait_total = 0.0
+
+    async def run(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Executa fn(*args, **kwargs) na vez da chave
+
+        Raises:
+            MailboxFull: Se a chave já tem mailbox_size mensagens pendentes
+        """
+        key = str(key)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _ChatSlot()
+
+        if slot.pending >= self.mailbox_size:
+            self.rejected += 1
+            raise MailboxFull(f"Chat {key} com {slot.pending} mensagens pendentes")
+
+        slot.pending += 1
+        self.max_depth_seen = max(self.max_depth_seen, slot.pending)
+        enqueued_at = time.monotonic()
+        try:
+            async with slot.lock:
+                self._wait_total += time.monotonic() - enqueued_at
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception:
+                    self.failed += 1
+                    raise
+                self.processed += 1
+                return result
+        finally:
+            slot.pending -= 1
+            if slot.pending == 0 and self._slots.get(key) is slot:
+                del self._slots[key]
+
+    def depth(self, key: str) -> int:
+        """Mensagens pendentes do chat (incluindo a que está rodando)"""
+        slot = self._slots.get(str(key))
+        return slot.pending if slot else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade das caixas de entrada e contadores"""
+        depths = sorted(((slot.pending, key) for key, slot in self._slots.items()), reverse=True)
+        finished = self.processed + self.failed
+        return {
+            "name": self.name,
+            "mailbox_size": self.mailbox_size,
+            "active_chats": len(depths),
+            "queued": sum(depth - 1 for depth, _ in depths),
+            "deepest_mailboxes": {key: depth for depth, key in depths[:5]},
+            "max_depth_seen": self.max_depth_seen,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_total / finished * 1000, 2) if finished else 0.0
+        }
+
+
+# Instância global para facilitar importação
+chat_executor = ChatExecutor()
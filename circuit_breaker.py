@@ -0,0 +1,136 @@
+"""
+Circuit breaker para dependências externas (Tess AI)
+Depois de falhas ou lentidão consecutivas, as chamadas falham na hora e os
+agentes usam seus fallbacks locais, em vez de esperar o timeout a cada mensagem
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Chamada recusada porque o circuito está aberto"""
+
+
+class CircuitBreaker:
+    """
+    Disjuntor fechado / aberto / meio-aberto
+
+    - Fechado: chamadas passam; falhas (ou chamadas lentas) consecutivas são contadas
+    - Aberto: após failure_threshold, allow_request() retorna False por reset_timeout
+    - Meio-aberto: passado o reset_timeout, até half_open_max_calls chamadas de teste;
+      sucesso fecha o circuito, falha o reabre
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 slow_call_seconds: Optional[float] = None, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+
+        self.rejected = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.successes = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def allow_request(self) -> bool:
+        """True se a chamada pode seguir (no meio-aberto, reserva uma vaga de teste)"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """
+        Devolve a vaga de teste do meio-aberto sem registrar resultado
+        (chamada cancelada ou abandonada antes de sucesso/falha)
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self, duration: Optional[float] = None):
+        """Registra chamada bem-sucedida; lenta demais conta como falha"""
+        if duration is not None and self.slow_call_seconds is not None and duration > self.slow_call_seconds:
+            with self._lock:
+                self.slow_calls += 1
+            self._register_failure()
+            return
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                print(f"✅ Circuito {self.name} fechado (serviço restabelecido)")
+            self._state = CLOSED
+            self._half_open_in_flight = 0
+
+    def record_failure(self):
+        """Registra falha (erro, timeout)"""
+        with self._lock:
+            self.failures += 1
+        self._register_failure()
+
+    def _register_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.trips += 1
+                    print(f"⚡ Circuito {self.name} aberto por {self.reset_timeout:.0f}s "
+                          f"({self._consecutive_failures} falhas/lentidões seguidas)")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_in_flight = 0
+
+    def reset(self):
+        """Volta ao estado fechado, sem falhas acumuladas"""
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._half_open_in_flight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado e contadores do circuito"""
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "successes": self.successes
+            }
@@ -0,0 +1,164 @@
+"""
+Fixtures compartilhadas pelos testes offline (pytest carrega este arquivo
+automaticamente; os testes também podem importar FakeResponse daqui)
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+import tess_client as tess_module
+from http_pool import http_pool
+
+
+class FakeResponse:
+    """Resposta HTTP mínima no formato de requests.Response"""
+
+    def __init__(self, payload=None, status_code=200, headers=None):
+        self._payload = payload if payload is not None else {}
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def fake_response():
+    """Classe FakeResponse, para testes que montam respostas dentro da função"""
+    return FakeResponse
+
+
+@pytest.fixture
+def install_tess_mock():
+    """
+    Função que registra um httpx.AsyncClient com MockTransport(handler) como
+    cliente da Tess do loop atual (chamar dentro do asyncio.run do teste)
+
+    Zera o circuit breaker antes (reset_breaker=False preserva o estado, ex:
+    testes de half-open) e depois do teste
+    """
+    def install(handler, reset_breaker: bool = True):
+        if reset_breaker:
+            tess_module.tess_breaker.reset()
+        tess_module._async_clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        )
+
+    yield install
+    tess_module.tess_breaker.reset()
+
+
+class FakeHubSpot:
+    """
+    HubSpot fake para os testes de coleta de contexto (busca, batch read,
+    associações v4 em lote e line items por deal)
+
+    Por padrão o contato N se chama "Cliente N" e tem o deal dN (amount N) e o
+    ticket tN ("problema"); contatos pode sobrescrever contatos específicos.
+    Cada deal tem o line item li-<deal_id>; emails e notes vêm vazios.
+    intervalos guarda (url, início, fim) de cada chamada, para testes de
+    sobreposição sem limites de tempo de relógio
+
+    Args:
+        batch_disponivel: False responde 404 nas associações em lote
+        latencia: Atraso de cada chamada (segundos)
+        contatos: contact_id -> {"firstname", "deals": [(id, amount)], "tickets": [(id, subject)]}
+    """
+
+    def __init__(self, batch_disponivel: bool = True, latencia: float = 0.0, contatos=None):
+        self.batch_disponivel = batch_disponivel
+        self.latencia = latencia
+        self.contatos = contatos or {}
+        self.chamadas = []
+        self.intervalos = []
+        self._lock = threading.Lock()
+
+    def contato(self, contact_id: str):
+        if contact_id in self.contatos:
+            return self.contatos[contact_id]
+        return {
+            "firstname": f"Cliente {contact_id}",
+            "deals": [(f"d{contact_id}", contact_id)],
+            "tickets": [(f"t{contact_id}", "problema")],
+        }
+
+    def _objeto(self, object_type: str, object_id: str):
+        """Deal ou ticket pelo id (o sufixo do id é o contato dono)"""
+        for contact_id in list(self.contatos) + [object_id[1:]]:
+            for item_id, valor in self.contato(contact_id).get(object_type, []):
+                if item_id == object_id:
+                    chave = "amount" if object_type == "deals" else "subject"
+                    return {"id": item_id, "properties": {chave: str(valor)}}
+        return None
+
+    def _associados(self, object_type: str, contact_id: str):
+        return [item_id for item_id, _ in self.contato(contact_id).get(object_type, [])]
+
+    def _registrar(self, url: str):
+        inicio = time.monotonic()
+        time.sleep(self.latencia)
+        with self._lock:
+            self.chamadas.append(url)
+            self.intervalos.append((url, inicio, time.monotonic()))
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        self._registrar(url)
+        if "/associations/" in url and "/batch/read" in url:
+            if not self.batch_disponivel:
+                return FakeResponse({"message": "not found"}, status_code=404)
+            from_type, to_type = url.split("/associations/")[1].split("/")[:2]
+            if from_type == "deals":
+                destinos = {i["id"]: [f"li-{i['id']}"] for i in json["inputs"]}
+            else:
+                destinos = {i["id"]: self._associados(to_type, i["id"]) for i in json["inputs"]}
+            return FakeResponse({"status": "COMPLETE", "results": [
+                {"from": {"id": origem}, "to": [{"toObjectId": destino} for destino in alvos]}
+                for origem, alvos in destinos.items() if alvos
+            ]})
+        if "/contacts/batch/read" in url:
+            return FakeResponse({"results": [
+                {"id": i["id"], "properties": {"firstname": self.contato(i["id"])["firstname"]}}
+                for i in json["inputs"]
+            ]})
+        if url.endswith("/search"):
+            object_type = url.split("/objects/")[1].split("/")[0]
+            filtro = json["filterGroups"][0]["filters"][0]
+            if filtro["operator"] == "IN":
+                assert len(filtro["values"]) <= 100
+                objetos = [self._objeto(object_type, i) for i in filtro["values"]]
+                return FakeResponse({"results": [objeto for objeto in objetos if objeto]})
+            contact_id = filtro["value"]
+            if object_type == "contacts":
+                return FakeResponse({"results": [
+                    {"id": contact_id, "properties": {"firstname": self.contato(contact_id)["firstname"]}}
+                ]})
+            return FakeResponse({"results": [
+                self._objeto(object_type, item_id) for item_id in self._associados(object_type, contact_id)
+            ]})
+        return FakeResponse({"results": []})
+
+    def get(self, url, headers=None, **kwargs):
+        self._registrar(url)
+        deal_id = url.split("/deals/")[1].split("/")[0]
+        return FakeResponse({"results": [{"toObjectId": f"li-{deal_id}"}]})
+
+
+@pytest.fixture
+def fake_hubspot(monkeypatch):
+    """Função que instala um FakeHubSpot na sessão HTTP compartilhada e o retorna"""
+    def install(**kwargs) -> FakeHubSpot:
+        hubspot = FakeHubSpot(**kwargs)
+        monkeypatch.setattr(http_pool.session, "post", hubspot.post)
+        monkeypatch.setattr(http_pool.session, "get", hubspot.get)
+        return hubspot
+
+    return install
@@ -4,16 +4,28 @@ Responsável por orquestrar agentes e manter contexto de conversação
 """
 
 from enum import Enum
-from typing import Dict, Any, Optional
-from datetime import datetime
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Any, Optional
+from datetime import datetime, timezone
+import asyncio
+import os
 import re
+import threading
+import time
 from langsmith import traceable
 
 from agents.sentiment_analyzer import SentimentAnalyzerAgent
 from agents.empathetic_response import EmpatheticResponseGenerator
 from agents.response_evaluator import ResponseEvaluatorAgent
+from agents.nps_answer import NPSAnswerAgent
 from services.cliente_service import cliente_service
 from supabase_client import supabase_client
+from task_queue import task_queue
+from chat_executor import MailboxFull, chat_executor
+from session_store import SessionStore, SessionVersionConflict, create_session_store
+from session_rehydration import is_snapshot, rebuild_record, snapshot_message
+from deadline import REPLY_RESERVE_SECONDS, budget_nearly_spent, stage_scope
 
 
 START_REQUIRED_MESSAGE = "Para começar, digite /start."
@@ -34,6 +46,9 @@ DETAILS_MESSAGE = (
 DECLINE_MESSAGE = (
     "Sem problemas! Quando quiser participar, é só digitar /start novamente."
 )
+# Mensagens do histórico mantidas na sessão gravada no session store
+SESSION_HISTORY_LIMIT = int(os.getenv("SESSION_HISTORY_LIMIT", "50"))
+
 CONFIRMATION_FALLBACK_MESSAGE = (
     "Você gostaria de deixar seu feedback agora? Responda sim ou não."
 )
@@ -49,23 +64,60 @@ class ConversationState(Enum):
     MANUAL_MODE = "manual_mode"          # Gerente assumiu controle
 
 
+# Campos do registro comparados no merge de conflitos (todos menos o histórico)
+RECORD_FIELDS = (
+    "state", "nps_score", "feedback_text", "sentiment", "created_at", "updated_at",
+    "manual_mode", "cliente_identificado", "dados_cliente"
+)
+
+
+def record_fields(record: Dict[str, Any]) -> tuple:
+    return tuple(record.get(key) for key in RECORD_FIELDS)
+
+
+def _new_history() -> Deque[Dict[str, Any]]:
+    return deque(maxlen=SESSION_HISTORY_LIMIT)
+
+
+@dataclass(slots=True, eq=False)
 class ConversationSession:
-    """Representa uma sessão de conversa com um usuário"""
+    """
+    Representa uma sessão de conversa com um usuário
     
-    def __init__(self, chat_id: str):
-        self.chat_id = chat_id
-        self.state = ConversationState.IDLE
-        self.nps_score: Optional[int] = None
-        self.feedback_text: str = ""
-        self.sentiment: Optional[str] = None
-        self.messages_history: list = []
-        self.created_at = datetime.now()
-        self.updated_at = datetime.now()
-        self.manual_mode = False
-        
-        # NOVO: Dados do cliente (HubSpot Mock)
-        self.cliente_identificado: bool = False
-        self.dados_cliente: Optional[Dict[str, Any]] = None
+    Layout com __slots__ e histórico em buffer circular (últimas
+    SESSION_HISTORY_LIMIT mensagens): memória por sessão limitada e previsível
+    """
+    chat_id: str
+    state: ConversationState = ConversationState.IDLE
+    nps_score: Optional[int] = None
+    feedback_text: str = ""
+    sentiment: Optional[str] = None
+    messages_history: Deque[Dict[str, Any]] = field(default_factory=_new_history)
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+    manual_mode: bool = False
+    
+    # Dados do cliente (HubSpot Mock): só o necessário para a conversa
+    cliente_identificado: bool = False
+    dados_cliente: Optional[Dict[str, Any]] = None
+    
+    # Versão no session store (controle otimista), campos como foram carregados e
+    # mensagens ainda não gravadas, para reaplicar só o que esta cópia mudou
+    version: int = 0
+    loaded: tuple = ()
+    unsaved_messages: int = 0
+    # Linhas gravadas em conversation_messages desde o último [SNAPSHOT]
+    rows_since_snapshot: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+
+    def add_message(self, sender: str, text: str):
+        """Acrescenta ao histórico (descarta a mais antiga se o buffer estiver cheio)"""
+        self.messages_history.append({
+            "sender": sender,
+            "text": text,
+            "timestamp": datetime.now().isoformat()
+        })
+        self.unsaved_messages += 1
 
     def reset_for_new_conversation(self):
         """Reseta campos da sessão para iniciar nova conversa"""
@@ -73,10 +125,48 @@ class ConversationSession:
         self.nps_score = None
         self.feedback_text = ""
         self.sentiment = None
-        self.messages_history = []
+        self.messages_history.clear()
         self.updated_at = datetime.now()
         self.manual_mode = False
     
+    def to_record(self) -> Dict[str, Any]:
+        """Estado completo para o session store"""
+        return {
+            "chat_id": self.chat_id,
+            "state": self.state.value,
+            "nps_score": self.nps_score,
+            "feedback_text": self.feedback_text,
+            "sentiment": self.sentiment,
+            "history": list(self.messages_history),
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "manual_mode": self.manual_mode,
+            "cliente_identificado": self.cliente_identificado,
+            "dados_cliente": self.dados_cliente,
+            "rows_since_snapshot": self.rows_since_snapshot
+        }
+    
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], version: int = 0) -> "ConversationSession":
+        """Reconstrói a sessão gravada por to_record"""
+        session = cls(
+            chat_id=record["chat_id"],
+            state=ConversationState(record["state"]),
+            nps_score=record.get("nps_score"),
+            feedback_text=record.get("feedback_text", ""),
+            sentiment=record.get("sentiment"),
+            created_at=datetime.fromisoformat(record["created_at"]),
+            updated_at=datetime.fromisoformat(record["updated_at"]),
+            manual_mode=record.get("manual_mode", False),
+            cliente_identificado=record.get("cliente_identificado", False),
+            dados_cliente=record.get("dados_cliente"),
+            version=version,
+            rows_since_snapshot=record.get("rows_since_snapshot", 0)
+        )
+        session.messages_history.extend(record.get("history", []))
+        session.loaded = record_fields(record)
+        return session
+    
     def to_dict(self) -> Dict[str, Any]:
         """Serializa sessão para dict"""
         return {
@@ -94,31 +184,275 @@ class ConversationSession:
         }
 
 
+# Tempo ocioso (segundos) até a sessão ser descartada, por estado da conversa
+DEFAULT_IDLE_TTLS = {
+    ConversationState.IDLE: 3600,
+    ConversationState.WAITING_CONFIRMATION: 86400,
+    ConversationState.WAITING_SCORE: 86400,
+    ConversationState.WAITING_FEEDBACK: 86400,
+    ConversationState.COMPLETED: 3600,
+    ConversationState.MANUAL_MODE: 7 * 86400,
+}
+
+# Propriedades do HubSpot mantidas na sessão (o resto não é usado na conversa)
+SESSION_CLIENT_PROPERTIES = ("firstname", "lastname", "email")
+
+
+def _idle_ttl_from_env(state: ConversationState) -> float:
+    """SESSION_IDLE_TTL_<ESTADO>_SECONDS, ex: SESSION_IDLE_TTL_WAITING_SCORE_SECONDS"""
+    env_name = f"SESSION_IDLE_TTL_{state.value.upper()}_SECONDS"
+    return float(os.getenv(env_name, str(DEFAULT_IDLE_TTLS[state])))
+
+
+def compact_cliente(cliente: Dict[str, Any]) -> Dict[str, Any]:
+    """Dados do cliente reduzidos ao que a conversa usa (sem contexto completo)"""
+    properties = cliente.get("properties", {}) or {}
+    return {
+        "id": cliente.get("id"),
+        "properties": {key: properties[key] for key in SESSION_CLIENT_PROPERTIES if properties.get(key)}
+    }
+
+
 class ConversationManager:
     """
     Gerenciador de conversas NPS com máquina de estados
     Orquestra múltiplos agentes para criar experiência inteligente
     """
     
-    def __init__(self):
-        # Cache de sessões em memória (em produção, usar Redis)
-        self.sessions: Dict[str, ConversationSession] = {}
+    def __init__(self, session_store: Optional[SessionStore] = None):
+        # Sessões persistidas no session store (SESSION_STORE: memory, sqlite, redis);
+        # self.sessions guarda a cópia de trabalho deste processo
+        self.session_store = session_store if session_store is not None else create_session_store()
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self.max_cached_sessions = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "10000"))
+        self.idle_ttls = {state: _idle_ttl_from_env(state) for state in ConversationState}
+        self._sessions_lock = threading.RLock()
+        # Chats com mensagem em processamento: o sweeper não remove essas cópias
+        self._active: Dict[str, int] = {}
+        self._sweeper_task: Optional[asyncio.Task] = None
+        self.sweeper_stats = {"sweeps": 0, "evicted_idle": 0, "evicted_lru": 0, "store_purged": 0}
+        
+        # Sessão fora do store: reconstruída das últimas linhas de conversation_messages,
+        # com um [SNAPSHOT] a cada SESSION_SNAPSHOT_EVERY linhas do chat
+        self.rehydrate_enabled = os.getenv("SESSION_REHYDRATE", "true").lower() != "false"
+        self.snapshot_every = int(os.getenv("SESSION_SNAPSHOT_EVERY", "25"))
+        self.rehydrate_rows = max(
+            int(os.getenv("SESSION_REHYDRATE_ROWS", "100")), self.snapshot_every + 1
+        )
+        self.rehydration_stats = {"rehydrated": 0, "rehydrate_misses": 0, "snapshots_written": 0}
         
         # Inicializar agentes
         self.sentiment_analyzer = SentimentAnalyzerAgent()
         self.empathetic_generator = EmpatheticResponseGenerator()
         self.response_evaluator = ResponseEvaluatorAgent()
+        self.nps_answer = NPSAnswerAgent(self.empathetic_generator, self.response_evaluator)
+        # Sentimento + resposta + resumo numa única chamada à Tess
+        self.combined_llm_call = os.getenv("NPS_COMBINED_LLM_CALL", "false").lower() == "true"
+        # Sem chamada combinada: análise de sentimento em paralelo com a resposta
+        self.concurrent_sentiment = os.getenv("NPS_CONCURRENT_SENTIMENT", "true").lower() != "false"
+        self._background_tasks = set()
         
         # Serviço de clientes
         self.cliente_service = cliente_service
+        
+        # Trabalho pós-resposta (avaliação, campanha, logs de auditoria)
+        task_queue.register("nps_evaluation", self._evaluate_and_log_nps)
+        task_queue.register("conversation_log", supabase_client.log_conversation_message)
 
     
+    async def _defer(self, job: str, **payload):
+        """Agenda a tarefa na fila pós-resposta (sem fila rodando, executa agora)"""
+        if not task_queue.enqueue(job, **payload):
+            await task_queue.run_inline(job, **payload)
+    
+    def _log_message(self, **kwargs):
+        """Registra a mensagem no Supabase pela fila, preservando o horário real"""
+        kwargs.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        if not task_queue.enqueue("conversation_log", **kwargs):
+            supabase_client.log_conversation_message(**kwargs)
+        session = self.sessions.get(kwargs["chat_id"])
+        if session is not None:
+            session.rows_since_snapshot += 1
+    
     def get_session(self, chat_id: str) -> ConversationSession:
         """Recupera ou cria uma sessão de conversa"""
-        if chat_id not in self.sessions:
-            self.sessions[chat_id] = ConversationSession(chat_id)
-            print(f"🆕 Nova sessão criada para chat_id: {chat_id}")
-        return self.sessions[chat_id]
+        with self._sessions_lock:
+            session = self.sessions.get(chat_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self.sessions.move_to_end(chat_id)
+                return session
+        return self.load_session(chat_id)
+    
+    def load_session(self, chat_id: str) -> ConversationSession:
+        """Carrega a versão mais recente do session store (ou cria uma sessão nova)"""
+        found = self.session_store.load(chat_id)
+        if found is not None:
+            record, version = found
+            session = ConversationSession.from_record(record, version)
+        else:
+            session = self._rehydrate_session(chat_id)
+            if session is None:
+                session = ConversationSession(chat_id)
+                print(f"🆕 Nova sessão criada para chat_id: {chat_id}")
+        self._cache_session(chat_id, session)
+        return session
+    
+    def _rehydrate_session(self, chat_id: str) -> Optional[ConversationSession]:
+        """
+        Reconstrói a sessão a partir do log do Supabase (snapshot mais recente +
+        linhas posteriores). O resultado vai para o cache e, no próximo
+        save_session, para o session store: o log só é lido uma vez por chat.
+        """
+        if not self.rehydrate_enabled or budget_nearly_spent():
+            return None
+        rows = supabase_client.fetch_conversation_tail(chat_id, limit=self.rehydrate_rows)
+        record = rebuild_record(chat_id, rows)
+        if record is None:
+            self.rehydration_stats["rehydrate_misses"] += 1
+            return None
+        
+        session = ConversationSession.from_record(record)
+        # Snapshot fora da janela lida: gravar um novo no próximo save
+        if not any(is_snapshot(row) for row in rows):
+            session.rows_since_snapshot = len(rows)
+        self.rehydration_stats["rehydrated"] += 1
+        print(f"♻️ Sessão reconstruída do log para chat_id: {chat_id} ({len(rows)} linhas, estado {session.state.value})")
+        return session
+    
+    def _write_snapshot(self, chat_id: str, session: ConversationSession):
+        """Grava a linha [SNAPSHOT] com o estado compacto da sessão"""
+        kwargs = snapshot_message(session.to_record())
+        kwargs["created_at"] = datetime.now(timezone.utc).isoformat()
+        if not task_queue.enqueue("conversation_log", **kwargs):
+            supabase_client.log_conversation_message(**kwargs)
+        session.rows_since_snapshot = 0
+        self.rehydration_stats["snapshots_written"] += 1
+    
+    def _cache_session(self, chat_id: str, session: ConversationSession):
+        """Guarda a cópia de trabalho; acima do limite, remove a menos usada (LRU)"""
+        with self._sessions_lock:
+            self.sessions[chat_id] = session
+            self.sessions.move_to_end(chat_id)
+            while len(self.sessions) > self.max_cached_sessions:
+                oldest = next(iter(self.sessions))
+                if oldest in self._active:
+                    break
+                del self.sessions[oldest]
+                self.sweeper_stats["evicted_lru"] += 1
+    
+    def _idle_ttl(self, state: ConversationState) -> float:
+        return self.idle_ttls[state]
+    
+    def sweep_sessions(self) -> Dict[str, int]:
+        """
+        Remove cópias de trabalho ociosas além do TTL do seu estado e sessões
+        vencidas do session store. Retorna o que foi removido nesta passada.
+        """
+        now = time.monotonic()
+        with self._sessions_lock:
+            idle = [
+                chat_id for chat_id, session in self.sessions.items()
+                if chat_id not in self._active and now - session.last_access > self._idle_ttl(session.state)
+            ]
+            for chat_id in idle:
+                del self.sessions[chat_id]
+        purged = self.session_store.purge_expired()
+        
+        self.sweeper_stats["sweeps"] += 1
+        self.sweeper_stats["evicted_idle"] += len(idle)
+        self.sweeper_stats["store_purged"] += purged
+        if idle or purged:
+            print(f"🧹 Sessões ociosas removidas: {len(idle)} em memória, {purged} no store")
+        return {"evicted_idle": len(idle), "store_purged": purged}
+    
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sweep_sessions)
+            except Exception as e:
+                print(f"⚠️ Erro no sweeper de sessões: {e}")
+    
+    def start_sweeper(self, interval: Optional[float] = None):
+        """Inicia a limpeza periódica de sessões no event loop atual"""
+        if self._sweeper_task is None:
+            interval = interval or float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+            self._sweeper_task = asyncio.create_task(self._sweep_loop(interval))
+    
+    async def stop_sweeper(self):
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            await asyncio.gather(self._sweeper_task, return_exceptions=True)
+            self._sweeper_task = None
+    
+    def session_stats(self) -> Dict[str, Any]:
+        """Sessões em memória, limites e contadores do sweeper"""
+        with self._sessions_lock:
+            cached = len(self.sessions)
+        return {
+            "cached_sessions": cached,
+            "max_cached_sessions": self.max_cached_sessions,
+            "active_chats": len(self._active),
+            "idle_ttl_seconds": {state.value: ttl for state, ttl in self.idle_ttls.items()},
+            **self.sweeper_stats,
+            "rehydration": dict(self.rehydration_stats),
+            "store": self.session_store.stats()
+        }
+    
+    def save_session(self, chat_id: str):
+        """
+        Grava a sessão no store com controle otimista de versão
+        
+        Se outro worker gravou antes, recarrega a versão dele, reaplica as
+        mensagens novas e o estado desta cópia e tenta uma vez mais.
+        """
+        session = self.sessions.get(chat_id)
+        if session is None:
+            return
+        
+        if self.snapshot_every and session.rows_since_snapshot >= self.snapshot_every:
+            self._write_snapshot(chat_id, session)
+        
+        for attempt in range(2):
+            record = session.to_record()
+            try:
+                session.version = self.session_store.save(
+                    chat_id, record, session.version, ttl=self._idle_ttl(session.state)
+                )
+                session.loaded = record_fields(record)
+                session.unsaved_messages = 0
+                return
+            except SessionVersionConflict:
+                if attempt == 1:
+                    print(f"⚠️ Conflito de versão persistente na sessão {chat_id}, mantendo a gravação do outro worker")
+                    with self._sessions_lock:
+                        self.sessions.pop(chat_id, None)
+                    return
+                session = self._merge_with_latest(chat_id, session)
+    
+    def _merge_with_latest(self, chat_id: str, ours: ConversationSession) -> ConversationSession:
+        """Versão gravada por outro worker + o que esta cópia mudou desde o load"""
+        found = self.session_store.load(chat_id)
+        if found is None:
+            ours.version = 0
+            return ours
+        latest_record, version = found
+        
+        mine = ours.to_record()
+        base = dict(zip(RECORD_FIELDS, ours.loaded))
+        merged_record = dict(latest_record)
+        for key in RECORD_FIELDS:
+            if mine[key] != base.get(key):
+                merged_record[key] = mine[key]
+        new_messages = list(ours.messages_history)[-ours.unsaved_messages:] if ours.unsaved_messages else []
+        merged_record["history"] = list(latest_record.get("history", [])) + new_messages
+        
+        merged = ConversationSession.from_record(merged_record, version)
+        merged.loaded = record_fields(latest_record)
+        merged.unsaved_messages = len(new_messages)
+        self._cache_session(chat_id, merged)
+        return merged
     
     def transition_state(self, chat_id: str, new_state: ConversationState):
         """Transição de estado com logging"""
@@ -130,7 +464,7 @@ class ConversationManager:
         print(f"🔄 Estado mudou: {old_state.value} → {new_state.value} (chat: {chat_id})")
         
         # Logar transição no Supabase
-        supabase_client.log_conversation_message(
+        self._log_message(
             chat_id=chat_id,
             message_text=f"[STATE_TRANSITION] {old_state.value} → {new_state.value}",
             sender="system",
@@ -139,22 +473,39 @@ class ConversationManager:
         )
     
     @traceable(name="Process User Message")
-    async def process_message(self, chat_id: str, text: str, username: Optional[str] = None) -> str:
+    async def process_message(self, chat_id: str, text: str, username: Optional[str] = None,
+                              stream_sink=None) -> str:
         """
         Processa mensagem do usuário baseado no estado atual
         Retorna resposta inteligente do bot
+        
+        stream_sink (opcional, ex: TelegramStreamingReply): recebe a resposta
+        empática enquanto ela é gerada; se stream_sink.delivered, ela já foi entregue
         """
+        self._active[chat_id] = self._active.get(chat_id, 0) + 1
+        try:
+            # Estado mais recente (outro worker pode ter atendido a mensagem anterior)
+            await asyncio.to_thread(self.load_session, chat_id)
+            try:
+                return await self._process_message(chat_id, text, username, stream_sink)
+            finally:
+                await asyncio.to_thread(self.save_session, chat_id)
+        finally:
+            if self._active[chat_id] <= 1:
+                del self._active[chat_id]
+            else:
+                self._active[chat_id] -= 1
+    
+    async def _process_message(self, chat_id: str, text: str, username: Optional[str],
+                               stream_sink) -> str:
+        """Processa a mensagem sobre a sessão já carregada (ver process_message)"""
         session = self.get_session(chat_id)
         
         # Adicionar mensagem ao histórico
-        session.messages_history.append({
-            "sender": "user",
-            "text": text,
-            "timestamp": datetime.now().isoformat()
-        })
+        session.add_message("user", text)
         
         # Logar mensagem do usuário no Supabase
-        supabase_client.log_conversation_message(
+        self._log_message(
             chat_id=chat_id,
             message_text=text,
             sender="user",
@@ -175,10 +526,10 @@ class ConversationManager:
             response = await self._handle_idle(chat_id, text, username)  # Passar username
 
         elif session.state == ConversationState.WAITING_CONFIRMATION:
-            response = await self._handle_waiting_confirmation(chat_id, text)
+            response = await self._handle_waiting_confirmation(chat_id, text, stream_sink)
         
         elif session.state == ConversationState.WAITING_SCORE:
-            response = await self._handle_waiting_score(chat_id, text)
+            response = await self._handle_waiting_score(chat_id, text, stream_sink)
         
         elif session.state == ConversationState.WAITING_FEEDBACK:
             response = await self._handle_waiting_feedback(chat_id, text)
@@ -191,14 +542,10 @@ class ConversationManager:
         
         # Adicionar resposta ao histórico
         if response:
-            session.messages_history.append({
-                "sender": "bot",
-                "text": response,
-                "timestamp": datetime.now().isoformat()
-            })
+            session.add_message("bot", response)
             
             # Logar resposta do bot no Supabase
-            supabase_client.log_conversation_message(
+            self._log_message(
                 chat_id=chat_id,
                 message_text=response,
                 sender="bot",
@@ -214,8 +561,8 @@ class ConversationManager:
         Tenta identificar cliente no HubSpot Mock
         
         Estratégia:
-        1. Buscar no cache por chat_id
-        2. Buscar no HubSpot por username (como email)
+        1. Buscar no índice de identidade por chat_id (sem ir ao CRM)
+        2. Buscar no HubSpot por username (como email) e registrar o vínculo
         3. Fallback: retornar None
         
         Args:
@@ -231,8 +578,9 @@ class ConversationManager:
         if session.cliente_identificado:
             return session.dados_cliente
         
-        # Tentar buscar por chat_id no cache
-        cliente = self.cliente_service.buscar_por_chat_id(chat_id)
+        # Tentar buscar por chat_id no índice de identidade
+        # Consultas síncronas (SQLite/HubSpot) fora do event loop
+        cliente = await asyncio.to_thread(self.cliente_service.buscar_por_chat_id, chat_id)
         if cliente:
             print(f"✅ Cliente identificado por chat_id: {chat_id}")
             return cliente
@@ -241,16 +589,13 @@ class ConversationManager:
         if username:
             # Tentar como email direto
             email = f"{username}@exemplo.com" if "@" not in username else username
-            cliente = self.cliente_service.buscar_por_email(email)
+            cliente = await asyncio.to_thread(self.cliente_service.buscar_por_email, email)
             
             if cliente:
                 print(f"✅ Cliente identificado por email: {email}")
-                # Coletar contexto completo
-                contact_id = cliente.get("id")
-                if contact_id:
-                    contexto = self.cliente_service.coletar_contexto(contact_id)
-                    cliente["contexto"] = contexto
-                
+                await asyncio.to_thread(self.cliente_service.vincular_chat_id, chat_id, cliente)
+                # Contexto completo não é coletado aqui: a sessão guarda só a
+                # identificação (compact_cliente) e o contexto vem do context_collector
                 return cliente
         
         print(f"⚠️ Cliente não identificado (chat_id: {chat_id}, username: {username})")
@@ -269,18 +614,18 @@ class ConversationManager:
             cliente = await self._tentar_identificar_cliente(chat_id, username)
             if cliente:
                 session.cliente_identificado = True
-                session.dados_cliente = cliente
+                session.dados_cliente = compact_cliente(cliente)
                 print(f"✅ Cliente identificado: {cliente.get('properties', {}).get('firstname', 'N/A')}")
         
         self.transition_state(chat_id, ConversationState.WAITING_CONFIRMATION)
         return self._gerar_saudacao(session)
 
-    async def _handle_waiting_confirmation(self, chat_id: str, text: str) -> str:
+    async def _handle_waiting_confirmation(self, chat_id: str, text: str, stream_sink=None) -> str:
         """Estado WAITING_CONFIRMATION: Aguardando confirmação do usuário"""
         score = self._extract_score(text)
         if score is not None:
             self.transition_state(chat_id, ConversationState.WAITING_SCORE)
-            return await self._handle_waiting_score(chat_id, text)
+            return await self._handle_waiting_score(chat_id, text, stream_sink)
 
         intent = self._classify_confirmation_intent(text)
 
@@ -309,7 +654,7 @@ class ConversationManager:
         return GREETING_BASE_MESSAGE.format(nome=nome_suffix)
     
     @traceable(name="Extract NPS Score")
-    async def _handle_waiting_score(self, chat_id: str, text: str) -> str:
+    async def _handle_waiting_score(self, chat_id: str, text: str, stream_sink=None) -> str:
         """Estado WAITING_SCORE: Extrair nota e feedback"""
         session = self.get_session(chat_id)
         
@@ -320,17 +665,30 @@ class ConversationManager:
             session.nps_score = score
             session.feedback_text = text
             
-            # Analisar sentimento do feedback
-            sentiment_result = await self._analyze_sentiment(chat_id, text, score)
-            session.sentiment = sentiment_result.get("sentimento_geral", "NEUTRO")
+            if self.combined_llm_call:
+                response = await self._answer_combined(chat_id, score, text, stream_sink)
+                self.transition_state(chat_id, ConversationState.COMPLETED)
+                return response
+            
+            if self.concurrent_sentiment:
+                # Resposta com o rótulo derivado da nota; a análise completa roda em
+                # paralelo e é anexada à sessão quando terminar
+                self._start_background_sentiment(chat_id, text, score)
+                sentiment_result = NPSAnswerAgent.score_sentiment(score)
+                session.sentiment = sentiment_result["sentimento_geral"]
+            else:
+                # Analisar sentimento do feedback, guardando parte do orçamento para a resposta
+                with stage_scope(REPLY_RESERVE_SECONDS):
+                    sentiment_result = await self._analyze_sentiment(chat_id, text, score)
+                session.sentiment = sentiment_result.get("sentimento_geral", "NEUTRO")
             
             # Gerar resposta empática usando IA
             response = await self._generate_empathetic_response(
-                chat_id, score, text, sentiment_result
+                chat_id, score, text, sentiment_result, stream_sink
             )
             
-            # Avaliar e registrar NPS
-            await self._evaluate_and_log_nps(chat_id, score, text)
+            # Avaliar e registrar NPS depois que a resposta for enviada
+            await self._defer("nps_evaluation", chat_id=chat_id, score=score, feedback=text)
             
             # Transição para COMPLETED
             self.transition_state(chat_id, ConversationState.COMPLETED)
@@ -358,9 +716,9 @@ Diretrizes:
 - Máximo 2-3 linhas
 
 Resposta:"""
-                response = llm.invoke(prompt)
+                response = await llm.ainvoke(prompt)
                 return response.strip()
-            except:
+            except Exception:
                 # Fallback
                 return (
                     "Não consegui identificar uma nota de 0 a 10 na sua mensagem. "
@@ -471,9 +829,53 @@ Resposta:"""
         
         return None
     
+    def _start_background_sentiment(self, chat_id: str, text: str, score: int):
+        """Dispara a análise de sentimento sem bloquear a resposta"""
+        task = asyncio.create_task(self._attach_sentiment(chat_id, text, score))
+        # O loop guarda só referência fraca: manter a task viva até terminar
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _attach_sentiment(self, chat_id: str, text: str, score: int):
+        """
+        Anexa o resultado da análise completa à sessão e ao histórico
+        
+        A gravação passa pelo chat_executor: espera a mensagem em andamento do
+        chat terminar, como qualquer outra mensagem do mesmo chat
+        """
+        try:
+            analysis = await self._analyze_sentiment(chat_id, text, score)
+            try:
+                await chat_executor.run(chat_id, self._apply_sentiment, chat_id, score, analysis)
+            except MailboxFull:
+                # Caixa cheia: aplica direto na cópia em memória (sem recarregar)
+                await self._apply_sentiment(chat_id, score, analysis)
+        except Exception as e:
+            print(f"⚠️ Erro ao anexar sentimento ao chat {chat_id}: {e}")
+    
+    async def _apply_sentiment(self, chat_id: str, score: int, analysis: Dict[str, Any]):
+        # Sessão viva do cache: recarregar do store descartaria o que a mensagem
+        # em andamento ainda não gravou
+        session = self.get_session(chat_id)
+        session.sentiment = analysis.get("sentimento_geral", session.sentiment)
+        await asyncio.to_thread(self.save_session, chat_id)
+        
+        self._log_message(
+            chat_id=chat_id,
+            message_text=f"[SENTIMENT] {session.sentiment}",
+            sender="system",
+            conversation_state=session.state.value,
+            nps_score=score,
+            sentiment=session.sentiment,
+            metadata={"sentiment_analysis": analysis}
+        )
+    
     @traceable(name="Sentiment Analysis")
     async def _analyze_sentiment(self, chat_id: str, text: str, score: int) -> Dict[str, Any]:
         """Analisa sentimento do feedback usando SentimentAnalyzer"""
+        if budget_nearly_spent():
+            print("⏱️ Sem orçamento para análise via LLM, usando sentimento pela nota")
+            return NPSAnswerAgent.score_sentiment(score)
         
         # Criar contexto mínimo para análise
         context = {
@@ -483,17 +885,11 @@ Resposta:"""
         }
         
         try:
-            analysis = self.sentiment_analyzer.analyze(context)
+            analysis = await self.sentiment_analyzer.aanalyze(context)
             return analysis
         except Exception as e:
             print(f"⚠️ Erro na análise de sentimento: {e}")
-            # Fallback simples
-            if score <= 6:
-                return {"sentimento_geral": "NEGATIVO", "nivel_satisfacao": score}
-            elif score <= 8:
-                return {"sentimento_geral": "NEUTRO", "nivel_satisfacao": score}
-            else:
-                return {"sentimento_geral": "POSITIVO", "nivel_satisfacao": score}
+            return NPSAnswerAgent.score_sentiment(score)
     
     @traceable(name="Generate Empathetic Response")
     async def _generate_empathetic_response(
@@ -501,14 +897,28 @@ Resposta:"""
         chat_id: str, 
         score: int, 
         feedback: str,
-        sentiment: Dict[str, Any]
+        sentiment: Dict[str, Any],
+        stream_sink=None
     ) -> str:
-        """Gera resposta empática usando TessLLM"""
+        """Gera resposta empática usando TessLLM (em streaming se houver stream_sink)"""
         session = self.get_session(chat_id)
         
         try:
+            if stream_sink is not None:
+                response = await self.empathetic_generator.astream_response(
+                    score=score,
+                    feedback_text=feedback,
+                    conversation_history=session.messages_history,
+                    sentiment=sentiment,
+                    cliente_dados=session.dados_cliente,
+                    on_partial=stream_sink.update
+                )
+                # Mostra o texto final já, sem esperar a avaliação do NPS
+                await stream_sink.finish(response)
+                return response
+            
             # Usar gerador empático com contexto completo
-            response = self.empathetic_generator.generate_response(
+            response = await self.empathetic_generator.agenerate_response(
                 score=score,
                 feedback_text=feedback,
                 conversation_history=session.messages_history,
@@ -523,15 +933,43 @@ Resposta:"""
             # Fallback
             return f"Obrigado pela sua avaliação! Registramos sua nota {score}/10."
     
+    async def _answer_combined(self, chat_id: str, score: int, text: str, stream_sink=None) -> str:
+        """Sentimento, resposta e resumo via NPSAnswerAgent (uma chamada ao LLM)"""
+        session = self.get_session(chat_id)
+        
+        if budget_nearly_spent():
+            print("⏱️ Sem orçamento para a chamada combinada, usando fallbacks locais")
+            answer = self.nps_answer.local_answer(score, text, session.dados_cliente)
+        else:
+            answer = await self.nps_answer.aanswer(
+                score=score,
+                feedback_text=text,
+                cliente_dados=session.dados_cliente,
+                contact_id=chat_id
+            )
+        
+        session.sentiment = answer["sentimento"].get("sentimento_geral", "NEUTRO")
+        response = answer["resposta"]
+        if stream_sink is not None:
+            await stream_sink.finish(response)
+        
+        await self._defer(
+            "nps_evaluation", chat_id=chat_id, score=score, feedback=text,
+            resumo_executivo=answer["resumo_executivo"]
+        )
+        return response
+    
     @traceable(name="NPS Evaluation")
-    async def _evaluate_and_log_nps(self, chat_id: str, score: int, feedback: str):
+    async def _evaluate_and_log_nps(self, chat_id: str, score: int, feedback: str,
+                                    resumo_executivo: Optional[str] = None):
         """Avalia e registra NPS no sistema"""
         
         try:
-            evaluation = self.response_evaluator.evaluate(
+            evaluation = await self.response_evaluator.aevaluate(
                 nps_score=score,
                 feedback_text=feedback,
-                context={"source": "telegram", "contact_id": chat_id}
+                context={"source": "telegram", "contact_id": chat_id},
+                resumo_executivo=resumo_executivo
             )
             
             print(f"✅ NPS registrado: {score}/10 - {evaluation.get('classificacao', {}).get('categoria')}")
@@ -541,17 +979,19 @@ Resposta:"""
     
     def enable_manual_mode(self, chat_id: str):
         """Ativa modo manual (gerente assume controle)"""
-        session = self.get_session(chat_id)
+        session = self.load_session(chat_id)
         session.manual_mode = True
         self.transition_state(chat_id, ConversationState.MANUAL_MODE)
+        self.save_session(chat_id)
         print(f"👤 Modo manual ativado para chat {chat_id}")
     
     def disable_manual_mode(self, chat_id: str):
         """Desativa modo manual (volta ao automático)"""
-        session = self.get_session(chat_id)
+        session = self.load_session(chat_id)
         session.manual_mode = False
         # Voltar ao estado anterior ou IDLE
         self.transition_state(chat_id, ConversationState.IDLE)
+        self.save_session(chat_id)
         print(f"🤖 Modo automático restaurado para chat {chat_id}")
 
 
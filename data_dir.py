@@ -0,0 +1,41 @@
+"""
+Diretório de dados persistentes do app
+Arquivos que precisam sobreviver a restart/cold start (índice de identidade,
+fila de tarefas, sessões, espelho do HubSpot, cache de LLM) ficam aqui, e não
+em <tmp>, que some no reboot
+
+Configuração (.env):
+    PARETO_DATA_DIR: Diretório dos arquivos (default: data/ na raiz do projeto)
+"""
+
+import os
+import sqlite3
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.getenv(
+    "PARETO_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+)
+
+
+def data_path(filename: str) -> str:
+    """Caminho de um arquivo dentro de DATA_DIR"""
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect_sqlite(path: str, timeout: float = 5.0) -> sqlite3.Connection:
+    """
+    Abre um arquivo SQLite em modo WAL, criando o diretório se preciso
+
+    Os stores chamam isto no primeiro acesso (não no import), para que
+    importar um módulo com singleton não crie nada em disco
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
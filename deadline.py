@@ -0,0 +1,110 @@
+"""
+Orçamento de latência por requisição (deadline)
+O webhook do Telegram abre um deadline_scope; agentes e clientes HTTP/LLM
+consultam o tempo restante para dimensionar seus timeouts e, quando o
+orçamento está quase no fim, vão direto para o fallback local
+
+O deadline vive num contextvar: acompanha o fluxo async e as chamadas em
+asyncio.to_thread sem precisar ser passado como argumento em cada camada
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Abaixo disso não vale a pena iniciar uma chamada remota (segundos)
+MIN_STAGE_SECONDS = float(os.getenv("DEADLINE_MIN_STAGE_SECONDS", "1.0"))
+# Tempo guardado para a resposta ao cliente quando uma etapa anterior roda
+REPLY_RESERVE_SECONDS = float(os.getenv("DEADLINE_REPLY_RESERVE_SECONDS", "3.0"))
+# Menor timeout entregue aos clientes: requests recusa timeout zero ou negativo
+MIN_TIMEOUT_SECONDS = 0.05
+
+
+class DeadlineExceeded(Exception):
+    """Orçamento de tempo da requisição esgotado antes de iniciar a etapa"""
+
+
+class Deadline:
+    """Instante limite para concluir a requisição atual"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_seconds
+
+    def remaining(self) -> float:
+        """Segundos restantes (nunca negativo)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def nearly_expired(self, reserve: Optional[float] = None) -> bool:
+        """True se sobra menos que reserve (default: DEADLINE_MIN_STAGE_SECONDS)"""
+        return self.remaining() < (MIN_STAGE_SECONDS if reserve is None else reserve)
+
+    def timeout(self, default: float) -> float:
+        """
+        Timeout da próxima chamada: o menor entre o default e o tempo restante
+        (nunca abaixo de MIN_TIMEOUT_SECONDS; quem não deve nem tentar consulta
+        nearly_expired antes)
+        """
+        return max(MIN_TIMEOUT_SECONDS, min(default, self.remaining()))
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(budget_seconds: float) -> Iterator[Deadline]:
+    """
+    Define o deadline do bloco (e de tudo que ele chamar)
+
+    Exemplo:
+        >>> with deadline_scope(8.0):
+        ...     await conversation_manager.process_message(chat_id, text)
+    """
+    deadline = Deadline(budget_seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage_scope(reserve: float) -> Iterator[Optional[Deadline]]:
+    """
+    Deadline de uma etapa intermediária: termina reserve segundos antes do
+    deadline atual, deixando esse tempo para as etapas seguintes
+    (sem deadline ativo, não limita nada)
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with deadline_scope(max(0.0, parent.remaining() - reserve)) as deadline:
+        yield deadline
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline ativo, ou None fora de um deadline_scope"""
+    return _current.get()
+
+
+def budget_timeout(default: float) -> float:
+    """Timeout dimensionado pelo deadline ativo (sem deadline, o próprio default)"""
+    deadline = _current.get()
+    return default if deadline is None else deadline.timeout(default)
+
+
+def budget_nearly_spent(reserve: Optional[float] = None) -> bool:
+    """True se há deadline ativo e ele está quase no fim"""
+    deadline = _current.get()
+    return deadline is not None and deadline.nearly_expired(reserve)
@@ -0,0 +1,149 @@
+"""
+Pool HTTP compartilhado
+Sessão requests com keep-alive reaproveitada por HubSpotClient e ClienteService,
+evitando um handshake TCP+TLS novo a cada chamada ao CRM
+"""
+
+import os
+import threading
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter que contabiliza conexões em uso e esperas por conexão livre"""
+
+    def __init__(self, pool_connections: int, pool_maxsize: int, pool_block: bool):
+        self._stats_lock = threading.Lock()
+        self._in_use: Dict[str, int] = {}
+        self.requests_total = 0
+        self.waits = 0
+        super().__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).netloc
+        with self._stats_lock:
+            self.requests_total += 1
+            in_use = self._in_use.get(host, 0) + 1
+            self._in_use[host] = in_use
+            # Acima do tamanho do pool a requisição espera (pool_block) ou abre
+            # conexão avulsa que é descartada depois
+            if in_use > self._pool_maxsize:
+                self.waits += 1
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self._stats_lock:
+                self._in_use[host] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Conexões em uso/ociosas por host e total de esperas"""
+        hosts: Dict[str, Dict[str, int]] = {}
+        with self._stats_lock:
+            for host, in_use in self._in_use.items():
+                hosts[host] = {"in_use": in_use, "idle": 0}
+            requests_total = self.requests_total
+            waits = self.waits
+
+        try:
+            for key in list(self.poolmanager.pools.keys()):
+                conn_pool = self.poolmanager.pools.get(key)
+                if conn_pool is None:
+                    continue
+                host = f"{conn_pool.host}:{conn_pool.port}" if conn_pool.port else conn_pool.host
+                # A fila do urllib3 guarda None para slots ainda não conectados
+                idle = sum(1 for conn in list(conn_pool.pool.queue) if conn is not None)
+                hosts.setdefault(host, {"in_use": 0, "idle": 0})["idle"] += idle
+        except Exception:
+            pass
+
+        return {
+            "pool_maxsize": self._pool_maxsize,
+            "pool_block": self._pool_block,
+            "requests_total": requests_total,
+            "waits": waits,
+            "in_use": sum(h["in_use"] for h in hosts.values()),
+            "idle": sum(h["idle"] for h in hosts.values()),
+            "hosts": hosts
+        }
+
+
+class HTTPPool:
+    """
+    Camada de transporte HTTP compartilhada
+
+    Configuração (.env):
+        HTTP_POOL_CONNECTIONS: Quantidade de hosts com pool mantido (default: 10)
+        HTTP_POOL_MAXSIZE: Conexões keep-alive por host (default: 20)
+        HTTP_POOL_BLOCK: Esperar conexão livre em vez de abrir extra (default: true)
+        HTTP_POOL_HOST_LIMITS: Limites por host, ex: "api.hubapi.com=30,localhost:4010=5"
+    """
+
+    def __init__(self):
+        self.pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+        self.pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+        self.pool_block = os.getenv("HTTP_POOL_BLOCK", "true").lower() != "false"
+        self.host_limits = self._parse_host_limits(os.getenv("HTTP_POOL_HOST_LIMITS", ""))
+
+        self.adapters: Dict[str, InstrumentedHTTPAdapter] = {}
+        self.session = self._build_session()
+
+    @staticmethod
+    def _parse_host_limits(raw: str) -> Dict[str, int]:
+        limits = {}
+        for item in raw.split(","):
+            if "=" not in item:
+                continue
+            host, size = item.split("=", 1)
+            try:
+                limits[host.strip()] = int(size)
+            except ValueError:
+                print(f"⚠️ HTTP_POOL_HOST_LIMITS inválido: {item}")
+        return limits
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+
+        default_adapter = InstrumentedHTTPAdapter(self.pool_connections, self.pool_maxsize, self.pool_block)
+        self.adapters["default"] = default_adapter
+        session.mount("http://", default_adapter)
+        session.mount("https://", default_adapter)
+
+        # requests escolhe o prefixo montado mais longo, então hosts com limite
+        # próprio ganham um adapter dedicado
+        for host, maxsize in self.host_limits.items():
+            adapter = InstrumentedHTTPAdapter(1, maxsize, self.pool_block)
+            self.adapters[host] = adapter
+            session.mount(f"http://{host}", adapter)
+            session.mount(f"https://{host}", adapter)
+
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do pool para monitoramento"""
+        adapters = {name: adapter.stats() for name, adapter in self.adapters.items()}
+        return {
+            "in_use": sum(a["in_use"] for a in adapters.values()),
+            "idle": sum(a["idle"] for a in adapters.values()),
+            "waits": sum(a["waits"] for a in adapters.values()),
+            "requests_total": sum(a["requests_total"] for a in adapters.values()),
+            "adapters": adapters
+        }
+
+    def close(self):
+        """Fecha todas as conexões do pool"""
+        self.session.close()
+
+
+# Instância global compartilhada pelos clientes HTTP síncronos
+http_pool = HTTPPool()
@@ -1,18 +1,80 @@
 import requests
+import contextvars
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+from http_pool import http_pool
+from hubspot_scheduler import hubspot_scheduler, PRIORITY_INTERACTIVE
+from singleflight import SingleFlight
 
 load_dotenv()
 
+# Limite de inputs por requisição do batch read de associações (API v4)
+HUBSPOT_ASSOCIATIONS_BATCH_LIMIT = 1000
+
+# Tamanho máximo de página aceito pela Search API
+HUBSPOT_SEARCH_PAGE_SIZE = 100
+
+# Projeção única das propriedades lidas pelos agentes (ContextCollectorAgent,
+# ClienteService, espelho). Buscas pedem só estes campos em vez do conjunto
+# padrão do HubSpot; ao consumir um campo novo, acrescente-o aqui.
+CONTEXT_PROPERTIES: Dict[str, List[str]] = {
+    "contacts": ["firstname", "lastname", "email", "phone", "mobilephone", "createdate", "mock_csat_survey"],
+    "deals": ["dealname", "amount", "dealstage", "createdate"],
+    "tickets": ["subject", "hs_ticket_category", "hs_ticket_priority", "createdate"],
+    "emails": ["hs_email_subject", "hs_email_text", "hs_timestamp", "hs_email_direction", "createdate"],
+    "notes": ["hs_note_body", "hs_timestamp", "createdate"],
+}
+
+# Coletas de contexto em andamento, compartilhadas por todas as instâncias do cliente
+context_flights = SingleFlight(name="contact_context")
+
 class HubSpotClient:
-    def __init__(self):
+    def __init__(self, use_mirror: Optional[bool] = None, priority: int = PRIORITY_INTERACTIVE):
         self.api_key = os.getenv("HUBSPOT_API_KEY", "pat-na1-123")
         self.base_url = os.getenv("HUBSPOT_API_URL", "http://localhost:4010")
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # Sessão keep-alive compartilhada (ver http_pool.py)
+        self.session = http_pool.session
+        
+        # Todas as requisições passam pelo agendador (rate limit, 429, retries);
+        # jobs em lote usam PRIORITY_BULK para não atrasar o bot
+        self.scheduler = hubspot_scheduler
+        self.priority = priority
+        # Timeout padrão das chamadas; o agendador reduz ao tempo restante do deadline
+        self.timeout = float(os.getenv("HUBSPOT_TIMEOUT_SECONDS", "10"))
+        
+        # Fan-out paralelo das buscas de contexto
+        self.parallel_fetch = os.getenv("HUBSPOT_PARALLEL_FETCH", "true").lower() != "false"
+        self.max_workers = int(os.getenv("HUBSPOT_MAX_WORKERS", "8"))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        
+        # Desligado automaticamente se o endpoint de batch não existir (ex: mock sem v4 batch)
+        self.batch_associations_supported = os.getenv("HUBSPOT_BATCH_ASSOCIATIONS", "true").lower() != "false"
+        
+        # Limite opcional de objetos por tipo no contexto (vazio = todas as páginas)
+        max_per_object = os.getenv("HUBSPOT_MAX_RESULTS_PER_OBJECT", "")
+        self.max_results_per_object: Optional[int] = int(max_per_object) if max_per_object else None
+        
+        # Espelho local incremental (ver hubspot_mirror.py); o próprio sync usa use_mirror=False
+        if use_mirror is None:
+            use_mirror = os.getenv("HUBSPOT_MIRROR_ENABLED", "false").lower() == "true"
+        self.mirror = None
+        if use_mirror:
+            from hubspot_mirror import get_mirror
+            self.mirror = get_mirror()
+    
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Envia a requisição pelo agendador com a prioridade deste cliente"""
+        kwargs.setdefault("headers", self.headers)
+        kwargs.setdefault("timeout", self.timeout)
+        return self.scheduler.request(self.session, method, url, priority=self.priority, **kwargs)
     
     def search_contacts(self, filters=None, properties=None, limit=10):
         """Busca contatos no HubSpot com filtros opcionais"""
@@ -27,7 +89,7 @@ class HubSpotClient:
             payload["properties"] = properties
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("POST", url, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -35,7 +97,7 @@ class HubSpotClient:
             return None
     
     def search_deals(self, contact_id: str, created_after: int = 0) -> Optional[Dict]:
-        """Busca deals associados a um contato"""
+        """Busca deals associados a um contato (só a primeira página; ver iter_deals)"""
         url = f"{self.base_url}/crm/v3/objects/deals/search"
         
         filters = [{
@@ -47,11 +109,12 @@ class HubSpotClient:
         
         payload = {
             "filterGroups": filters,
-            "limit": 100
+            "limit": 100,
+            "properties": CONTEXT_PROPERTIES["deals"]
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("POST", url, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -59,7 +122,7 @@ class HubSpotClient:
             return None
     
     def search_tickets(self, contact_id: str, created_after: int = 0) -> Optional[Dict]:
-        """Busca tickets (churn/downgrade) associados a um contato"""
+        """Busca tickets (churn/downgrade) associados a um contato (só a primeira página; ver iter_tickets)"""
         url = f"{self.base_url}/crm/v3/objects/tickets/search"
         
         filters = [{
@@ -71,11 +134,12 @@ class HubSpotClient:
         
         payload = {
             "filterGroups": filters,
-            "limit": 100
+            "limit": 100,
+            "properties": CONTEXT_PROPERTIES["tickets"]
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("POST", url, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -83,7 +147,7 @@ class HubSpotClient:
             return None
     
     def search_emails(self, contact_id: str, created_after: int = 0) -> Optional[Dict]:
-        """Busca emails associados a um contato"""
+        """Busca emails associados a um contato (só a primeira página; ver iter_emails)"""
         url = f"{self.base_url}/crm/v3/objects/emails/search"
         
         filters = [{
@@ -95,11 +159,12 @@ class HubSpotClient:
         
         payload = {
             "filterGroups": filters,
-            "limit": 100
+            "limit": 100,
+            "properties": CONTEXT_PROPERTIES["emails"]
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("POST", url, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -107,7 +172,7 @@ class HubSpotClient:
             return None
     
     def search_notes(self, contact_id: str, created_after: int = 0) -> Optional[Dict]:
-        """Busca anotações associadas a um contato"""
+        """Busca anotações associadas a um contato (só a primeira página; ver iter_notes)"""
         url = f"{self.base_url}/crm/v3/objects/notes/search"
         
         filters = [{
@@ -119,56 +184,496 @@ class HubSpotClient:
         
         payload = {
             "filterGroups": filters,
-            "limit": 100
+            "limit": 100,
+            "properties": CONTEXT_PROPERTIES["notes"]
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("POST", url, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Erro ao buscar notes: {e}")
             return None
     
+    def iter_search(self, object_type: str, filter_groups: List[Dict], properties: Optional[List[str]] = None,
+                    page_size: int = HUBSPOT_SEARCH_PAGE_SIZE, max_results: Optional[int] = None,
+                    sorts: Optional[List[Dict]] = None) -> Iterator[Dict]:
+        """
+        Itera sobre todos os resultados de uma busca, seguindo o cursor paging.next.after
+        
+        As páginas são buscadas sob demanda, então a memória fica limitada a uma página.
+        
+        Args:
+            object_type: Tipo do objeto (contacts, deals, tickets, emails, notes)
+            filter_groups: filterGroups da Search API
+            properties: Propriedades a retornar (opcional)
+            page_size: Resultados por requisição (máx. 100)
+            max_results: Para depois de N resultados (None = todas as páginas)
+            sorts: Ordenação da Search API (opcional)
+            
+        Raises:
+            requests.exceptions.RequestException: Se alguma página falhar
+        """
+        url = f"{self.base_url}/crm/v3/objects/{object_type}/search"
+        after = None
+        yielded = 0
+        
+        while max_results is None or yielded < max_results:
+            limit = page_size if max_results is None else min(page_size, max_results - yielded)
+            payload = {
+                "filterGroups": filter_groups,
+                "limit": limit
+            }
+            if properties:
+                payload["properties"] = properties
+            if sorts:
+                payload["sorts"] = sorts
+            if after:
+                payload["after"] = after
+            
+            response = self._request("POST", url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+            
+            for result in self._extract_results(data):
+                yield result
+                yielded += 1
+                if max_results is not None and yielded >= max_results:
+                    return
+            
+            paging = data.get("paging") if isinstance(data, dict) else None
+            after = ((paging or {}).get("next") or {}).get("after")
+            if not after:
+                return
+    
+    def iter_associated(self, object_type: str, contact_id: str, created_after: int = 0,
+                        max_results: Optional[int] = None) -> Iterator[Dict]:
+        """Itera sobre todos os objetos de um tipo associados a um contato (com a projeção de CONTEXT_PROPERTIES)"""
+        return self.iter_search(
+            object_type,
+            self._associated_filters(contact_id, created_after),
+            properties=CONTEXT_PROPERTIES.get(object_type),
+            max_results=max_results
+        )
+    
+    def iter_deals(self, contact_id: str, created_after: int = 0, max_results: Optional[int] = None) -> Iterator[Dict]:
+        """Itera sobre todos os deals do contato (todas as páginas)"""
+        return self.iter_associated("deals", contact_id, created_after, max_results)
+    
+    def iter_tickets(self, contact_id: str, created_after: int = 0, max_results: Optional[int] = None) -> Iterator[Dict]:
+        """Itera sobre todos os tickets do contato (todas as páginas)"""
+        return self.iter_associated("tickets", contact_id, created_after, max_results)
+    
+    def iter_emails(self, contact_id: str, created_after: int = 0, max_results: Optional[int] = None) -> Iterator[Dict]:
+        """Itera sobre todos os emails do contato (todas as páginas)"""
+        return self.iter_associated("emails", contact_id, created_after, max_results)
+    
+    def iter_notes(self, contact_id: str, created_after: int = 0, max_results: Optional[int] = None) -> Iterator[Dict]:
+        """Itera sobre todas as anotações do contato (todas as páginas)"""
+        return self.iter_associated("notes", contact_id, created_after, max_results)
+    
+    @staticmethod
+    def _associated_filters(contact_id: str, created_after: int) -> List[Dict]:
+        """filterGroups para objetos associados ao contato criados após o corte"""
+        return [{
+            "filters": [
+                {"propertyName": "associations.contact", "operator": "EQ", "value": contact_id},
+                {"propertyName": "createdate", "operator": "GTE", "value": str(created_after)}
+            ]
+        }]
+    
+    def _collect_associated(self, object_type: str, contact_id: str, created_after: int,
+                            max_results: Optional[int], errors: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Materializa iter_associated, mantendo o que já chegou se uma página falhar
+        
+        A falha é registrada em errors para o chamador não confundir com "sem dados"
+        """
+        results: List[Dict] = []
+        try:
+            results.extend(self.iter_associated(object_type, contact_id, created_after, max_results))
+        except requests.exceptions.RequestException as e:
+            print(f"Erro ao buscar {object_type}: {e}")
+            if errors is not None:
+                errors.append(object_type)
+        return results
+    
     def get_deal_line_items(self, deal_id: str) -> Optional[List[Dict]]:
         """Busca line items (produtos) de um deal específico"""
         url = f"{self.base_url}/crm/v4/objects/deals/{deal_id}/associations/line_items"
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._request("GET", url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Erro ao buscar line items do deal {deal_id}: {e}")
             return None
     
-    def get_contact_context(self, contact_id: str, days_back: int = 30) -> Dict:
+    def batch_read_associations(self, from_object: str, to_object: str, object_ids: List[str]) -> Optional[Dict[str, List[Dict]]]:
+        """
+        Lê associações de vários objetos em lote (v4 associations batch read)
+        
+        Args:
+            from_object: Tipo de origem (ex: "deals")
+            to_object: Tipo de destino (ex: "line_items")
+            object_ids: IDs dos objetos de origem
+            
+        Returns:
+            Dict id_origem -> lista de associações (formato do endpoint por objeto),
+            ou None se o endpoint em lote não estiver disponível
+        """
+        url = f"{self.base_url}/crm/v4/associations/{from_object}/{to_object}/batch/read"
+        associations: Dict[str, List[Dict]] = {str(object_id): [] for object_id in object_ids}
+        
+        for start in range(0, len(object_ids), HUBSPOT_ASSOCIATIONS_BATCH_LIMIT):
+            chunk = object_ids[start:start + HUBSPOT_ASSOCIATIONS_BATCH_LIMIT]
+            payload = {"inputs": [{"id": str(object_id)} for object_id in chunk]}
+            
+            try:
+                response = self._request("POST", url, json=payload)
+                if response.status_code in (404, 405, 501):
+                    print(f"⚠️ Batch de associações indisponível ({response.status_code}), usando chamadas individuais")
+                    self.batch_associations_supported = False
+                    return None
+                response.raise_for_status()
+                data = response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"Erro ao buscar associações {from_object}->{to_object} em lote: {e}")
+                return None
+            
+            # Objetos sem associação vêm em "errors" (NO_ASSOCIATIONS_FOUND) e ficam com lista vazia
+            for result in data.get("results", []) if isinstance(data, dict) else []:
+                from_id = str(result.get("from", {}).get("id", ""))
+                if from_id in associations:
+                    associations[from_id].extend(result.get("to", []))
+        
+        return associations
+    
+    def get_line_items_for_deals(self, deal_ids: List[str], parallel: bool = True) -> Dict[str, Optional[Dict]]:
+        """
+        Busca line items de todos os deals de uma vez
+        
+        Usa o batch read de associações (uma requisição para todos os deals) e só
+        cai para get_deal_line_items por deal quando o endpoint em lote não existe.
+        
+        Returns:
+            Dict deal_id -> resposta no formato de get_deal_line_items ({"results": [...]})
+        """
+        if not deal_ids:
+            return {}
+        
+        if self.batch_associations_supported:
+            associations = self.batch_read_associations("deals", "line_items", deal_ids)
+            if associations is not None:
+                return {deal_id: {"results": associations.get(str(deal_id), [])} for deal_id in deal_ids}
+        
+        if parallel:
+            futures = {deal_id: self._submit(self.get_deal_line_items, deal_id) for deal_id in deal_ids}
+            return {deal_id: future.result() for deal_id, future in futures.items()}
+        return {deal_id: self.get_deal_line_items(deal_id) for deal_id in deal_ids}
+    
+    def get_contact_context(self, contact_id: str, days_back: int = 30, parallel: Optional[bool] = None,
+                            max_per_object: Optional[int] = None) -> Dict:
         """
         Coleta contexto completo de um contato
         Retorna dict consolidado com: contato, deals, tickets, emails, notes
+
+        Args:
+            contact_id: ID do contato no HubSpot
+            days_back: Quantos dias de histórico buscar
+            parallel: Dispara as buscas independentes em paralelo (thread pool).
+                None usa HUBSPOT_PARALLEL_FETCH (default: true)
+            max_per_object: Limite de objetos por tipo (segue a paginação até lá).
+                None usa HUBSPOT_MAX_RESULTS_PER_OBJECT (default: sem limite)
         """
         # Calcular timestamp de corte (dias atrás em ms)
         from datetime import datetime, timedelta
         cutoff_date = datetime.now() - timedelta(days=days_back)
         created_after = int(cutoff_date.timestamp() * 1000)
         
+        if parallel is None:
+            parallel = self.parallel_fetch
+        if max_per_object is None:
+            max_per_object = self.max_results_per_object
+        
+        # Espelho local atualizado: consulta indexada em vez do fan-out de rede
+        if self.mirror is not None:
+            mirrored = self.mirror.get_contact_context(contact_id, days_back, max_per_object)
+            if mirrored is not None:
+                return mirrored
+        
+        # Chamadas concorrentes para o mesmo contato compartilham uma única coleta
+        # (o dict retornado é o mesmo para todas: não modificar)
+        return context_flights.do(
+            (str(contact_id), days_back, max_per_object),
+            self._fetch_contact_context, contact_id, created_after, parallel, max_per_object
+        )
+    
+    def _fetch_contact_context(self, contact_id: str, created_after: int, parallel: bool,
+                               max_per_object: Optional[int]) -> Dict:
+        """Busca o contexto na API do HubSpot (ver get_contact_context)"""
+        contact_filters = [{
+            "filters": [{"propertyName": "hs_object_id", "operator": "EQ", "value": contact_id}]
+        }]
+        
+        # Fontes que falharam mesmo após os retries do agendador
+        errors: List[str] = []
+        
+        if not parallel:
+            contact_data = self.search_contacts(filters=contact_filters, properties=CONTEXT_PROPERTIES["contacts"])
+            deals = self._collect_associated("deals", contact_id, created_after, max_per_object, errors)
+            line_items_by_deal = self.get_line_items_for_deals(self._deal_ids(deals), parallel=False)
+            tickets = self._collect_associated("tickets", contact_id, created_after, max_per_object, errors)
+            emails = self._collect_associated("emails", contact_id, created_after, max_per_object, errors)
+            notes = self._collect_associated("notes", contact_id, created_after, max_per_object, errors)
+            return self._build_context(contact_id, contact_data, deals, line_items_by_deal, tickets, emails, notes,
+                                       errors)
+        
+        # Buscas independentes disparadas ao mesmo tempo; line items dependem
+        # apenas dos deals, então são enviados assim que os deals chegam
+        contact_future = self._submit(self.search_contacts, filters=contact_filters,
+                                      properties=CONTEXT_PROPERTIES["contacts"])
+        deals_future = self._submit(self._collect_associated, "deals", contact_id, created_after, max_per_object, errors)
+        tickets_future = self._submit(self._collect_associated, "tickets", contact_id, created_after, max_per_object, errors)
+        emails_future = self._submit(self._collect_associated, "emails", contact_id, created_after, max_per_object, errors)
+        notes_future = self._submit(self._collect_associated, "notes", contact_id, created_after, max_per_object, errors)
+        
+        deals = deals_future.result()
+        line_items_by_deal = self.get_line_items_for_deals(self._deal_ids(deals), parallel=True)
+        
+        return self._build_context(
+            contact_id,
+            contact_future.result(),
+            deals,
+            line_items_by_deal,
+            tickets_future.result(),
+            emails_future.result(),
+            notes_future.result(),
+            errors
+        )
+    
+    def batch_read_objects(self, object_type: str, object_ids: List[str],
+                           properties: Optional[List[str]] = None) -> Optional[List[Dict]]:
+        """
+        Lê objetos por ID em lote (/crm/v3/objects/{type}/batch/read, 100 por requisição)
+        
+        Returns:
+            Lista de objetos encontrados, ou None se alguma requisição falhar
+        """
+        url = f"{self.base_url}/crm/v3/objects/{object_type}/batch/read"
+        objects: List[Dict] = []
+        
+        for start in range(0, len(object_ids), HUBSPOT_SEARCH_PAGE_SIZE):
+            chunk = object_ids[start:start + HUBSPOT_SEARCH_PAGE_SIZE]
+            payload = {
+                "inputs": [{"id": str(object_id)} for object_id in chunk],
+                "properties": properties or CONTEXT_PROPERTIES.get(object_type, [])
+            }
+            try:
+                response = self._request("POST", url, json=payload)
+                response.raise_for_status()
+                objects.extend(self._extract_results(response.json()))
+            except requests.exceptions.RequestException as e:
+                print(f"Erro ao ler {object_type} em lote: {e}")
+                return None
+        
+        return objects
+    
+    def _search_by_ids(self, object_type: str, object_ids: List[str], created_after: int) -> List[Dict]:
+        """
+        Busca objetos por ID com o operador IN (100 IDs por consulta), já filtrando por createdate
+        
+        Raises:
+            requests.exceptions.RequestException: Se alguma página falhar
+        """
+        results: List[Dict] = []
+        for start in range(0, len(object_ids), HUBSPOT_SEARCH_PAGE_SIZE):
+            chunk = object_ids[start:start + HUBSPOT_SEARCH_PAGE_SIZE]
+            filter_groups = [{
+                "filters": [
+                    {"propertyName": "hs_object_id", "operator": "IN", "values": [str(i) for i in chunk]},
+                    {"propertyName": "createdate", "operator": "GTE", "value": str(created_after)}
+                ]
+            }]
+            results.extend(self.iter_search(object_type, filter_groups, properties=CONTEXT_PROPERTIES[object_type]))
+        return results
+    
+    def get_contexts_batch(self, contact_ids: List[str], days_back: int = 30,
+                           max_per_object: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Coleta o contexto de vários contatos com poucas requisições em lote
+        
+        Fluxo: contatos por batch read, associações contato -> deals/tickets/emails/notes
+        por batch read de associações, objetos por busca com IN (filtrando createdate),
+        line items de todos os deals de uma vez. Os resultados são então separados por
+        contato, então o custo cresce com o número de lotes, não de contatos.
+        
+        Sem o endpoint de associações em lote, cai para get_contact_context por contato.
+        
+        Returns:
+            Dict contact_id -> contexto (mesmo formato de get_contact_context)
+        """
+        from datetime import datetime, timedelta
+        created_after = int((datetime.now() - timedelta(days=days_back)).timestamp() * 1000)
+        if max_per_object is None:
+            max_per_object = self.max_results_per_object
+        
+        contact_ids = list(dict.fromkeys(str(contact_id) for contact_id in contact_ids))
+        contexts: Dict[str, Dict] = {}
+        
+        # Contatos já presentes no espelho local não vão à API
+        if self.mirror is not None:
+            for contact_id in contact_ids:
+                mirrored = self.mirror.get_contact_context(contact_id, days_back, max_per_object)
+                if mirrored is not None:
+                    contexts[contact_id] = mirrored
+        pending = [contact_id for contact_id in contact_ids if contact_id not in contexts]
+        if not pending:
+            return contexts
+        
+        associations: Dict[str, Dict[str, List[Dict]]] = {}
+        if self.batch_associations_supported:
+            for object_type in ("deals", "tickets", "emails", "notes"):
+                result = self.batch_read_associations("contacts", object_type, pending)
+                if result is None:
+                    break
+                associations[object_type] = result
+        
+        if len(associations) < 4:
+            print("⚠️ Associações em lote indisponíveis, coletando contexto contato a contato")
+            for contact_id in pending:
+                contexts[contact_id] = self.get_contact_context(contact_id, days_back, max_per_object=max_per_object)
+            return contexts
+        
+        errors: List[str] = []
+        contacts = self.batch_read_objects("contacts", pending)
+        if contacts is None:
+            errors.append("contact")
+            contacts = []
+        contacts_by_id = {str(contact.get("id")): contact for contact in contacts if isinstance(contact, dict)}
+        
+        # Objetos de cada tipo buscados uma única vez, mesmo se associados a vários contatos
+        objects_by_type: Dict[str, Dict[str, Dict]] = {}
+        for object_type, by_contact in associations.items():
+            ids = list(dict.fromkeys(
+                str(assoc.get("toObjectId")) for assocs in by_contact.values() for assoc in assocs
+                if assoc.get("toObjectId") is not None
+            ))
+            try:
+                found = self._search_by_ids(object_type, ids, created_after) if ids else []
+            except requests.exceptions.RequestException as e:
+                print(f"Erro ao buscar {object_type} em lote: {e}")
+                errors.append(object_type)
+                found = []
+            objects_by_type[object_type] = {str(obj.get("id")): obj for obj in found if isinstance(obj, dict)}
+        
+        def related(object_type: str, contact_id: str) -> List[Dict]:
+            objects = objects_by_type[object_type]
+            items = [
+                objects[str(assoc.get("toObjectId"))] for assoc in associations[object_type].get(contact_id, [])
+                if str(assoc.get("toObjectId")) in objects
+            ]
+            return items if max_per_object is None else items[:max_per_object]
+        
+        per_contact = {
+            contact_id: {object_type: related(object_type, contact_id) for object_type in associations}
+            for contact_id in pending
+        }
+        all_deal_ids = list(dict.fromkeys(
+            deal_id for related_objects in per_contact.values() for deal_id in self._deal_ids(related_objects["deals"])
+        ))
+        line_items_by_deal = self.get_line_items_for_deals(all_deal_ids)
+        
+        for contact_id in pending:
+            contact = contacts_by_id.get(contact_id)
+            contexts[contact_id] = self._build_context(
+                contact_id,
+                {"results": [contact] if contact else []} if "contact" not in errors else None,
+                per_contact[contact_id]["deals"],
+                line_items_by_deal,
+                per_contact[contact_id]["tickets"],
+                per_contact[contact_id]["emails"],
+                per_contact[contact_id]["notes"],
+                [error for error in errors if error != "contact"]
+            )
+        
+        return contexts
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool compartilhado pelas buscas em paralelo (criado sob demanda)"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="hubspot"
+                    )
+        return self._executor
+    
+    def _submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Envia fn ao thread pool com uma cópia do contexto atual
+
+        Threads do pool não herdam contextvars: sem a cópia, o deadline da
+        requisição (deadline.py) não chegaria às buscas em paralelo
+        """
+        return self._get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    
+    @staticmethod
+    def _extract_results(data) -> List:
+        """Normaliza resposta de busca (dict com results ou lista) para lista"""
+        if isinstance(data, dict):
+            results = data.get("results", [])
+            return results if isinstance(results, list) else []
+        if isinstance(data, list):
+            return data
+        return []
+    
+    @staticmethod
+    def _deal_ids(deals: List) -> List[str]:
+        """IDs dos deals válidos, na ordem original"""
+        deal_ids = []
+        for deal in deals:
+            # Proteção: deal pode ser lista ou dict
+            if isinstance(deal, list):
+                deal = deal[0] if deal else {}
+            if not isinstance(deal, dict):
+                continue
+            deal_id = deal.get("id")
+            if deal_id:
+                deal_ids.append(deal_id)
+        return deal_ids
+    
+    def _build_context(self, contact_id: str, contact_data, deals: List, line_items_by_deal: Dict,
+                       tickets: List, emails: List, notes: List, errors: Optional[List[str]] = None) -> Dict:
+        """
+        Consolida as respostas do HubSpot no dict de contexto
+        
+        context["errors"] lista as fontes que falharam (contexto incompleto)
+        """
+        errors = list(errors or [])
+        if contact_data is None:
+            errors.append("contact")
+        deal_ids = self._deal_ids(deals)
+        if any(line_items_by_deal.get(deal_id) is None for deal_id in deal_ids):
+            errors.append("line_items")
+        
         context = {
             "contact_id": contact_id,
             "contact": None,
-            "deals": [],
-            "tickets": [],
-            "emails": [],
-            "notes": [],
+            "deals": deals,
+            "tickets": tickets,
+            "emails": emails,
+            "notes": notes,
             "line_items": [],
             "consolidated_value": 0.0,
-            "risks": []
+            "risks": [],
+            "errors": errors
         }
         
-        # Buscar dados do contato
-        contact_filters = [{
-            "filters": [{"propertyName": "hs_object_id", "operator": "EQ", "value": contact_id}]
-        }]
-        contact_data = self.search_contacts(filters=contact_filters)
+        # Dados do contato
         if contact_data:
             if isinstance(contact_data, dict):
                 results = contact_data.get("results", [])
@@ -177,94 +682,52 @@ class HubSpotClient:
             elif isinstance(contact_data, list) and contact_data:
                 context["contact"] = contact_data[0]
         
-        # Buscar deals
-        deals_data = self.search_deals(contact_id, created_after)
-        if deals_data:
-            if isinstance(deals_data, dict):
-                context["deals"] = deals_data.get("results", [])
-            elif isinstance(deals_data, list):
-                context["deals"] = deals_data
-            else:
-                context["deals"] = []
+        # Line items e valor consolidado dos deals
+        for deal in deals:
+            # Proteção: deal pode ser lista ou dict
+            if isinstance(deal, list):
+                deal = deal[0] if deal else {}
+            if not isinstance(deal, dict):
+                continue
+            deal_id = deal.get("id")
+            if not deal_id:
+                continue
+            line_items = line_items_by_deal.get(deal_id)
+            if line_items and isinstance(line_items, dict):
+                results = line_items.get("results", [])
+                if isinstance(results, list):
+                    context["line_items"].extend(results)
+            
+            # Somar valor do deal - proteção para properties
+            deal_props = deal.get("properties", {}) if isinstance(deal.get("properties"), dict) else {}
+            amount = deal_props.get("amount", "0") if isinstance(deal_props, dict) else "0"
+            try:
+                context["consolidated_value"] += float(amount)
+            except:
+                pass
+        
+        # Identificar riscos nos tickets (indicadores de churn)
+        for ticket in tickets:
+            # Proteção: ticket pode ser lista ou dict
+            if isinstance(ticket, list):
+                ticket = ticket[0] if ticket else {}
+            if not isinstance(ticket, dict):
+                continue
+            
+            # Proteção: properties pode ser lista ou dict
+            ticket_props = ticket.get("properties", {})
+            if isinstance(ticket_props, list):
+                ticket_props = ticket_props[0] if ticket_props else {}
             
-            # Para cada deal, buscar line items
-            for deal in context["deals"]:
-                # Proteção: deal pode ser lista ou dict
-                if isinstance(deal, list):
-                    deal = deal[0] if deal else {}
-                if not isinstance(deal, dict):
-                    continue
-                deal_id = deal.get("id") if isinstance(deal, dict) else None
-                if not deal_id:
-                    continue
-                line_items = self.get_deal_line_items(deal_id)
-                if line_items and isinstance(line_items, dict):
-                    results = line_items.get("results", [])
-                    if isinstance(results, list):
-                        context["line_items"].extend(results)
-                
-                # Somar valor do deal - proteção para properties
-                deal_props = deal.get("properties", {}) if isinstance(deal.get("properties"), dict) else {}
-                if isinstance(deal_props, list):
-                    deal_props = deal_props[0] if deal_props else {}
-                amount = deal_props.get("amount", "0") if isinstance(deal_props, dict) else "0"
-                try:
-                    context["consolidated_value"] += float(amount)
-                except:
-                    pass
-        
-        # Buscar tickets (indicadores de churn/risco)
-        tickets_data = self.search_tickets(contact_id, created_after)
-        if tickets_data:
-            if isinstance(tickets_data, dict):
-                context["tickets"] = tickets_data.get("results", [])
-            elif isinstance(tickets_data, list):
-                context["tickets"] = tickets_data
-            else:
-                context["tickets"] = []
+            subject = ticket_props.get("subject", "") if isinstance(ticket_props, dict) else ""
+            subject = subject.lower() if isinstance(subject, str) else ""
             
-            # Identificar riscos
-            for ticket in context["tickets"]:
-                # Proteção: ticket pode ser lista ou dict
-                if isinstance(ticket, list):
-                    ticket = ticket[0] if ticket else {}
-                if not isinstance(ticket, dict):
-                    continue
-                
-                # Proteção: properties pode ser lista ou dict
-                ticket_props = ticket.get("properties", {}) if isinstance(ticket, dict) else {}
-                if isinstance(ticket_props, list):
-                    ticket_props = ticket_props[0] if ticket_props else {}
-                
-                subject = ticket_props.get("subject", "") if isinstance(ticket_props, dict) else ""
-                subject = subject.lower() if isinstance(subject, str) else ""
-                
-                if any(word in subject for word in ["cancel", "churn", "downgrade", "problema", "reclama"]):
-                    context["risks"].append({
-                        "type": "ticket",
-                        "id": ticket.get("id") if isinstance(ticket, dict) else None,
-                        "description": subject
-                    })
-        
-        # Buscar emails
-        emails_data = self.search_emails(contact_id, created_after)
-        if emails_data:
-            if isinstance(emails_data, dict):
-                context["emails"] = emails_data.get("results", [])
-            elif isinstance(emails_data, list):
-                context["emails"] = emails_data
-            else:
-                context["emails"] = []
-        
-        # Buscar notes
-        notes_data = self.search_notes(contact_id, created_after)
-        if notes_data:
-            if isinstance(notes_data, dict):
-                context["notes"] = notes_data.get("results", [])
-            elif isinstance(notes_data, list):
-                context["notes"] = notes_data
-            else:
-                context["notes"] = []
+            if any(word in subject for word in ["cancel", "churn", "downgrade", "problema", "reclama"]):
+                context["risks"].append({
+                    "type": "ticket",
+                    "id": ticket.get("id"),
+                    "description": subject
+                })
         
         return context
 
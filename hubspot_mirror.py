@@ -0,0 +1,472 @@
+"""
+Espelho local incremental do HubSpot
+Mantém em SQLite os objetos lidos pelo HubSpotClient (contatos, deals, tickets,
+emails, notes, line items) e serve get_contact_context por consulta indexada
+enquanto o espelho estiver atualizado
+
+Sincronização incremental: cada tipo guarda um watermark (maior data de
+modificação já vista) e só busca objetos modificados depois dele.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from data_dir import connect_sqlite, data_path
+from hubspot_client import CONTEXT_PROPERTIES
+
+load_dotenv()
+
+
+# Tipo de objeto -> propriedade de última modificação usada como watermark
+MIRRORED_OBJECTS = {
+    "contacts": "lastmodifieddate",
+    "deals": "hs_lastmodifieddate",
+    "tickets": "hs_lastmodifieddate",
+    "emails": "hs_lastmodifieddate",
+    "notes": "hs_lastmodifieddate",
+}
+
+# A Search API não pagina além de 10.000 resultados por consulta
+SEARCH_RESULT_CAP = 10000
+
+# Eventos de webhook usam o nome no singular (deal.deletion, CONTACT_TO_DEAL...)
+_SINGULAR_TO_TYPE = {name[:-1]: name for name in MIRRORED_OBJECTS}
+
+
+class MirrorSyncError(Exception):
+    """Lote não pôde ser espelhado por completo (ex: falha ao ler associações)"""
+
+
+def _to_millis(value: Any) -> int:
+    """Converte timestamp do HubSpot (ms ou ISO 8601) para epoch em ms"""
+    if value is None or value == "":
+        return 0
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp() * 1000)
+    except ValueError:
+        return 0
+
+
+class HubSpotMirror:
+    """
+    Cópia local do HubSpot em SQLite
+
+    Configuração (.env):
+        HUBSPOT_MIRROR_PATH: Arquivo SQLite (default: <PARETO_DATA_DIR>/hubspot_mirror.db),
+            aberto no primeiro uso
+        HUBSPOT_MIRROR_MAX_STALENESS_SECONDS: Idade máxima do último sync para
+            servir contexto localmente (default: 900)
+        HUBSPOT_MIRROR_SYNC_INTERVAL_SECONDS: Sync periódico em background (0 = desligado)
+    """
+
+    def __init__(self, path: Optional[str] = None, client=None, max_staleness: Optional[float] = None):
+        self.path = path or os.getenv("HUBSPOT_MIRROR_PATH", data_path("hubspot_mirror.db"))
+        self.max_staleness = max_staleness if max_staleness is not None else float(
+            os.getenv("HUBSPOT_MIRROR_MAX_STALENESS_SECONDS", "900")
+        )
+        self._client = client
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def client(self):
+        """HubSpotClient usado no sync (sem espelho, para não consultar a si mesmo)"""
+        if self._client is None:
+            from hubspot_client import HubSpotClient
+            from hubspot_scheduler import PRIORITY_BULK
+            self._client = HubSpotClient(use_mirror=False, priority=PRIORITY_BULK)
+        return self._client
+
+    def _connection(self) -> sqlite3.Connection:
+        """Abre o arquivo (e cria o schema) no primeiro uso, não no import"""
+        with self._lock:
+            if self._conn is None:
+                conn = connect_sqlite(self.path)
+                self._create_schema(conn)
+                self._conn = conn
+            return self._conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+                object_type TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                createdate INTEGER NOT NULL DEFAULT 0,
+                lastmodified INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (object_type, id)
+            );
+            CREATE TABLE IF NOT EXISTS contact_associations (
+                contact_id TEXT NOT NULL,
+                object_type TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                PRIMARY KEY (contact_id, object_type, object_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_contact_associations_object
+                ON contact_associations (object_type, object_id);
+            CREATE TABLE IF NOT EXISTS deal_line_items (
+                deal_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                object_type TEXT PRIMARY KEY,
+                watermark INTEGER NOT NULL DEFAULT 0,
+                synced_at REAL
+            );
+            """
+        )
+        conn.commit()
+
+    # ------------------------------------------------------------------
+    # Sincronização
+    # ------------------------------------------------------------------
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Sincroniza incrementalmente todos os tipos espelhados
+
+        Returns:
+            Dict tipo -> quantidade de objetos atualizados
+        """
+        with self._sync_lock:
+            results = {}
+            for object_type in MIRRORED_OBJECTS:
+                results[object_type] = self.sync_object_type(object_type)
+            print(f"✅ Espelho HubSpot sincronizado: {results}")
+            return results
+
+    def sync_object_type(self, object_type: str) -> int:
+        """Busca objetos modificados desde o watermark e atualiza a cópia local"""
+        modified_prop = MIRRORED_OBJECTS[object_type]
+        watermark = self._get_watermark(object_type)
+        properties = self._sync_properties(object_type)
+        total = 0
+
+        while True:
+            start_watermark = watermark
+            # GTE no watermark: o re-download de empates é idempotente (upsert)
+            filter_groups = [{
+                "filters": [{"propertyName": modified_prop, "operator": "GTE", "value": str(watermark)}]
+            }]
+            batch: List[Dict] = []
+            fetched = 0
+            iterator = self.client.iter_search(
+                object_type,
+                filter_groups,
+                properties=properties,
+                max_results=SEARCH_RESULT_CAP,
+                sorts=[{"propertyName": modified_prop, "direction": "ASCENDING"}]
+            )
+            try:
+                for obj in iterator:
+                    batch.append(obj)
+                    fetched += 1
+                    if len(batch) >= 100:
+                        watermark = max(watermark, self._store_batch(object_type, batch))
+                        batch = []
+                if batch:
+                    watermark = max(watermark, self._store_batch(object_type, batch))
+            except MirrorSyncError as e:
+                # Watermark e synced_at não avançam: o tipo fica desatualizado (contexto
+                # vem da API) e o próximo sync baixa o lote de novo
+                print(f"⚠️ Sync do espelho HubSpot interrompido em {object_type}: {e}")
+                return total + fetched
+            total += fetched
+
+            # Menos que o teto da Search API: não há mais nada depois do watermark.
+            # Watermark parado (10k objetos no mesmo instante) também encerra.
+            if fetched < SEARCH_RESULT_CAP or watermark <= start_watermark:
+                break
+
+        self._set_watermark(object_type, watermark)
+        return total
+
+    def _sync_properties(self, object_type: str) -> List[str]:
+        return sorted(set(CONTEXT_PROPERTIES[object_type]) | {"createdate", MIRRORED_OBJECTS[object_type]})
+
+    def _store_batch(self, object_type: str, objects: List[Dict]) -> int:
+        """
+        Grava um lote de objetos (e suas associações); retorna o maior lastmodified
+
+        Raises:
+            MirrorSyncError: Se as associações não puderam ser lidas (nada é gravado)
+        """
+        modified_prop = MIRRORED_OBJECTS[object_type]
+        rows = []
+        max_modified = 0
+        for obj in objects:
+            if not isinstance(obj, dict) or not obj.get("id"):
+                continue
+            props = obj.get("properties") or {}
+            lastmodified = _to_millis(props.get(modified_prop) or obj.get("updatedAt"))
+            createdate = _to_millis(props.get("createdate") or obj.get("createdAt"))
+            rows.append((object_type, str(obj["id"]), json.dumps(obj, separators=(",", ":")), createdate, lastmodified))
+            max_modified = max(max_modified, lastmodified)
+
+        ids = [row[1] for row in rows]
+        associations = None
+        line_items = None
+        if object_type != "contacts" and ids:
+            associations = self.client.batch_read_associations(object_type, "contacts", ids)
+            if associations is None:
+                raise MirrorSyncError(f"associações {object_type} -> contacts indisponíveis")
+        if object_type == "deals" and ids:
+            line_items = self.client.batch_read_associations("deals", "line_items", ids)
+            if line_items is None:
+                raise MirrorSyncError("line items dos deals indisponíveis")
+
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO objects (object_type, id, data, createdate, lastmodified) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            if associations is not None:
+                self._replace_associations(object_type, associations)
+            if line_items is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO deal_line_items (deal_id, data) VALUES (?, ?)",
+                    [(deal_id, json.dumps(items, separators=(",", ":"))) for deal_id, items in line_items.items()]
+                )
+            conn.commit()
+
+        return max_modified
+
+    def _replace_associations(self, object_type: str, associations: Dict[str, List[Dict]]):
+        """Reescreve as associações objeto -> contatos (chamar com _lock)"""
+        conn = self._connection()
+        for object_id, targets in associations.items():
+            conn.execute(
+                "DELETE FROM contact_associations WHERE object_type = ? AND object_id = ?",
+                (object_type, str(object_id))
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO contact_associations (contact_id, object_type, object_id) VALUES (?, ?, ?)",
+                [(str(t.get("toObjectId")), object_type, str(object_id)) for t in targets if t.get("toObjectId")]
+            )
+
+    def refresh_associations(self, object_type: str, object_ids: List[str]):
+        """Relê do HubSpot as associações com contatos de objetos específicos"""
+        if object_type not in MIRRORED_OBJECTS or object_type == "contacts" or not object_ids:
+            return
+        associations = self.client.batch_read_associations(object_type, "contacts", [str(i) for i in object_ids])
+        if associations is None:
+            return
+        with self._lock:
+            conn = self._connection()
+            self._replace_associations(object_type, associations)
+            conn.commit()
+
+    def delete_object(self, object_type: str, object_id: str):
+        """Remove um objeto (e suas associações) do espelho"""
+        object_id = str(object_id)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM objects WHERE object_type = ? AND id = ?", (object_type, object_id))
+            if object_type == "contacts":
+                conn.execute("DELETE FROM contact_associations WHERE contact_id = ?", (object_id,))
+            else:
+                conn.execute(
+                    "DELETE FROM contact_associations WHERE object_type = ? AND object_id = ?",
+                    (object_type, object_id)
+                )
+            if object_type == "deals":
+                conn.execute("DELETE FROM deal_line_items WHERE deal_id = ?", (object_id,))
+            conn.commit()
+
+    def apply_crm_events(self, events: List[Dict[str, Any]]):
+        """
+        Aplica eventos de webhook que o sync por watermark não enxerga:
+        exclusões e mudanças de associação
+        """
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            subscription = str(event.get("subscriptionType", ""))
+            prefix, _, action = subscription.partition(".")
+            object_type = _SINGULAR_TO_TYPE.get(prefix)
+
+            try:
+                if action == "deletion" and object_type and event.get("objectId") is not None:
+                    self.delete_object(object_type, event["objectId"])
+                elif action == "associationChange":
+                    # associationType no formato CONTACT_TO_DEAL / DEAL_TO_CONTACT
+                    from_name, _, to_name = str(event.get("associationType", "")).lower().partition("_to_")
+                    if from_name == "contact" and to_name in _SINGULAR_TO_TYPE:
+                        self.refresh_associations(_SINGULAR_TO_TYPE[to_name], [event.get("toObjectId")])
+                    elif to_name == "contact" and from_name in _SINGULAR_TO_TYPE:
+                        self.refresh_associations(_SINGULAR_TO_TYPE[from_name], [event.get("fromObjectId")])
+            except Exception as e:
+                print(f"⚠️ Erro ao aplicar evento no espelho HubSpot: {e}")
+
+    def _get_watermark(self, object_type: str) -> int:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT watermark FROM sync_state WHERE object_type = ?", (object_type,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _set_watermark(self, object_type: str, watermark: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (object_type, watermark, synced_at) VALUES (?, ?, ?)",
+                (object_type, watermark, time.time())
+            )
+            conn.commit()
+
+    def start_background_sync(self, interval: float):
+        """Sincroniza periodicamente em uma thread daemon"""
+        if self._sync_thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"⚠️ Erro no sync do espelho HubSpot: {e}")
+                time.sleep(interval)
+
+        self._sync_thread = threading.Thread(target=loop, name="hubspot-mirror-sync", daemon=True)
+        self._sync_thread.start()
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def is_fresh(self) -> bool:
+        """True se todos os tipos foram sincronizados dentro de max_staleness"""
+        with self._lock:
+            conn = self._connection()
+            rows = dict(conn.execute("SELECT object_type, synced_at FROM sync_state").fetchall())
+        now = time.time()
+        return all(
+            rows.get(object_type) is not None and now - rows[object_type] <= self.max_staleness
+            for object_type in MIRRORED_OBJECTS
+        )
+
+    def get_contact_context(self, contact_id: str, days_back: int = 30,
+                            max_per_object: Optional[int] = None) -> Optional[Dict]:
+        """
+        Monta o mesmo dict de HubSpotClient.get_contact_context a partir da cópia local
+
+        Returns:
+            Contexto, ou None se o espelho estiver desatualizado ou não conhecer o
+            contato (o chamador cai para a API)
+        """
+        if not self.is_fresh():
+            return None
+
+        contact_id = str(contact_id)
+        created_after = int((datetime.now() - timedelta(days=days_back)).timestamp() * 1000)
+        limit = max_per_object if max_per_object is not None else -1
+
+        with self._lock:
+            conn = self._connection()
+            contact_row = conn.execute(
+                "SELECT data FROM objects WHERE object_type = 'contacts' AND id = ?", (contact_id,)
+            ).fetchone()
+            if not contact_row:
+                return None
+
+            related: Dict[str, List[Dict]] = {}
+            for object_type in ("deals", "tickets", "emails", "notes"):
+                rows = conn.execute(
+                    """
+                    SELECT o.data FROM contact_associations a
+                    JOIN objects o ON o.object_type = a.object_type AND o.id = a.object_id
+                    WHERE a.contact_id = ? AND a.object_type = ? AND o.createdate >= ?
+                    ORDER BY o.createdate DESC
+                    LIMIT ?
+                    """,
+                    (contact_id, object_type, created_after, limit)
+                ).fetchall()
+                related[object_type] = [json.loads(row[0]) for row in rows]
+
+            deal_ids = [str(deal.get("id")) for deal in related["deals"]]
+            line_items_by_deal = {deal_id: {"results": []} for deal_id in deal_ids}
+            if deal_ids:
+                placeholders = ",".join("?" * len(deal_ids))
+                for deal_id, data in conn.execute(
+                    f"SELECT deal_id, data FROM deal_line_items WHERE deal_id IN ({placeholders})", deal_ids
+                ).fetchall():
+                    line_items_by_deal[deal_id] = {"results": json.loads(data)}
+
+        return self.client._build_context(
+            contact_id,
+            {"results": [json.loads(contact_row[0])]},
+            related["deals"],
+            line_items_by_deal,
+            related["tickets"],
+            related["emails"],
+            related["notes"]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Contagem de objetos e idade do último sync por tipo"""
+        with self._lock:
+            conn = self._connection()
+            counts = dict(conn.execute(
+                "SELECT object_type, COUNT(*) FROM objects GROUP BY object_type"
+            ).fetchall())
+            synced = dict(conn.execute("SELECT object_type, synced_at FROM sync_state").fetchall())
+        now = time.time()
+        return {
+            "fresh": self.is_fresh(),
+            "objects": {t: counts.get(t, 0) for t in MIRRORED_OBJECTS},
+            "seconds_since_sync": {
+                t: round(now - synced[t], 1) if synced.get(t) else None for t in MIRRORED_OBJECTS
+            }
+        }
+
+
+_mirror: Optional[HubSpotMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror() -> HubSpotMirror:
+    """Instância compartilhada do espelho (inicia o sync periódico se configurado)"""
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = HubSpotMirror()
+                interval = float(os.getenv("HUBSPOT_MIRROR_SYNC_INTERVAL_SECONDS", "0"))
+                if interval > 0:
+                    _mirror.start_background_sync(interval)
+    return _mirror
+
+
+if __name__ == "__main__":
+    # python hubspot_mirror.py            -> um sync incremental
+    # python hubspot_mirror.py --loop 60  -> sync a cada 60s
+    mirror = get_mirror()
+    if len(sys.argv) == 3 and sys.argv[1] == "--loop":
+        interval = float(sys.argv[2])
+        while True:
+            mirror.sync()
+            time.sleep(interval)
+    else:
+        mirror.sync()
+        print(mirror.stats())
@@ -0,0 +1,276 @@
+"""
+Agendador de requisições ao HubSpot
+Token bucket ajustado às cotas do HubSpot (por segundo e diária), com respeito
+ao Retry-After em 429, retry com backoff exponencial + jitter e faixas de
+prioridade: consultas interativas (webhook/bot) passam na frente de jobs em lote
+"""
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+
+from deadline import MIN_STAGE_SECONDS, budget_nearly_spent, budget_timeout, current_deadline
+
+load_dotenv()
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Status que valem nova tentativa (além de erros de conexão/timeout)
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+
+class HubSpotQuotaExceeded(requests.exceptions.RequestException):
+    """Cota diária esgotada para a faixa de prioridade solicitada"""
+
+
+class HubSpotDeadlineExceeded(requests.exceptions.RequestException):
+    """Orçamento de tempo da requisição atual esgotado antes do envio"""
+
+
+class HubSpotRequestScheduler:
+    """
+    Controla o ritmo de todas as chamadas ao HubSpot do processo
+
+    Configuração (.env):
+        HUBSPOT_RATE_PER_SECOND: Requisições por segundo (default: 10)
+        HUBSPOT_RATE_BURST: Tamanho do balde/rajada (default: igual ao rate)
+        HUBSPOT_DAILY_QUOTA: Cota diária (default: 250000)
+        HUBSPOT_BULK_DAILY_RESERVE: Fração da cota diária reservada para
+            requisições interativas (default: 0.1)
+        HUBSPOT_MAX_RETRIES: Novas tentativas em 429/5xx/erro de rede (default: 4)
+        HUBSPOT_BACKOFF_BASE_SECONDS / HUBSPOT_BACKOFF_MAX_SECONDS: Backoff (default: 0.5 / 30)
+        SHARD_COUNT: Processos da API dividindo o mesmo app do HubSpot (definido
+            por sharded_server.py; default: 1). Rate, burst e cota do .env são
+            divididos por ele, para que N workers somados fiquem no limite do app
+    """
+
+    def __init__(self, rate_per_second: Optional[float] = None, burst: Optional[float] = None,
+                 daily_quota: Optional[int] = None, bulk_daily_reserve: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None):
+        shards = max(1, int(os.getenv("SHARD_COUNT", "1")))
+        self.rate = rate_per_second or float(os.getenv("HUBSPOT_RATE_PER_SECOND", "10")) / shards
+        if burst is None and os.getenv("HUBSPOT_RATE_BURST"):
+            burst = max(1.0, float(os.getenv("HUBSPOT_RATE_BURST")) / shards)
+        self.burst = burst or max(1.0, self.rate)
+        self.daily_quota = daily_quota or int(os.getenv("HUBSPOT_DAILY_QUOTA", "250000")) // shards
+        self.bulk_daily_reserve = bulk_daily_reserve if bulk_daily_reserve is not None else float(
+            os.getenv("HUBSPOT_BULK_DAILY_RESERVE", "0.1")
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("HUBSPOT_MAX_RETRIES", "4"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(
+            os.getenv("HUBSPOT_BACKOFF_BASE_SECONDS", "0.5")
+        )
+        self.backoff_max = backoff_max if backoff_max is not None else float(
+            os.getenv("HUBSPOT_BACKOFF_MAX_SECONDS", "30")
+        )
+
+        self._cond = threading.Condition()
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._day = self._today()
+        self._daily_used = 0
+
+        self.stats_counters: Dict[str, int] = {
+            "requests": 0,
+            "throttled_429": 0,
+            "retries": 0,
+            "failures": 0,
+            "quota_rejections": 0,
+            "deadline_aborts": 0
+        }
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._daily_used = 0
+
+    def _check_quota(self, priority: int):
+        limit = self.daily_quota
+        if priority != PRIORITY_INTERACTIVE:
+            limit = int(self.daily_quota * (1 - self.bulk_daily_reserve))
+        if self._daily_used >= limit:
+            self.stats_counters["quota_rejections"] += 1
+            raise HubSpotQuotaExceeded(
+                f"Cota diária do HubSpot esgotada ({self._daily_used}/{limit}) para prioridade {priority}"
+            )
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Bloqueia até haver um token livre para esta requisição
+
+        Waiters são atendidos por (prioridade, ordem de chegada), então uma fila
+        de jobs em lote nunca atrasa uma requisição interativa além de um token.
+        Com deadline ativo, a espera (rate limit ou pausa de um 429) nunca
+        passa do fim do orçamento.
+
+        Raises:
+            HubSpotQuotaExceeded: Se a cota diária da faixa estiver esgotada
+            HubSpotDeadlineExceeded: Se o token só viria depois do deadline
+        """
+        ticket = (priority, next(self._sequence))
+        deadline = current_deadline()
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket:
+                        self._check_quota(priority)
+                        if now >= self._paused_until and self._tokens >= 1:
+                            self._tokens -= 1
+                            self._daily_used += 1
+                            heapq.heappop(self._waiters)
+                            self._cond.notify_all()
+                            return
+                        wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.001)
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        remaining = deadline.remaining()
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            self.stats_counters["deadline_aborts"] += 1
+                            raise HubSpotDeadlineExceeded(
+                                f"Token do HubSpot só em {wait or 0:.2f}s; restam {remaining:.2f}s do orçamento"
+                            )
+                        if wait is None:
+                            wait = remaining
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def pause(self, seconds: float):
+        """Suspende todas as requisições (ex: Retry-After de um 429)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        """Backoff exponencial com full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        value = response.headers.get("Retry-After") if getattr(response, "headers", None) else None
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def request(self, session, method: str, url: str, priority: int = PRIORITY_INTERACTIVE, **kwargs: Any):
+        """
+        Executa a requisição respeitando rate limit, cota e retries
+
+        Returns:
+            requests.Response da última tentativa (o chamador faz raise_for_status)
+
+        Raises:
+            requests.exceptions.RequestException: Erro de rede após as tentativas,
+                HubSpotQuotaExceeded ou HubSpotDeadlineExceeded
+        """
+        send = getattr(session, method.lower())
+        default_timeout = kwargs.pop("timeout", None)
+        for attempt in range(self.max_retries + 1):
+            if budget_nearly_spent():
+                # Nem envia: não daria tempo de usar a resposta dentro do deadline
+                with self._cond:
+                    self.stats_counters["deadline_aborts"] += 1
+                raise HubSpotDeadlineExceeded("Orçamento de tempo esgotado antes da chamada ao HubSpot")
+            self.acquire(priority)
+            with self._cond:
+                self.stats_counters["requests"] += 1
+
+            if default_timeout is not None:
+                kwargs["timeout"] = budget_timeout(default_timeout)
+            try:
+                response = send(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or budget_nearly_spent(delay + MIN_STAGE_SECONDS):
+                    with self._cond:
+                        self.stats_counters["failures"] += 1
+                        if attempt < self.max_retries:
+                            self.stats_counters["deadline_aborts"] += 1
+                    raise
+                self._count_retry()
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRYABLE_STATUS:
+                return response
+
+            if response.status_code == 429:
+                with self._cond:
+                    self.stats_counters["throttled_429"] += 1
+            if attempt >= self.max_retries:
+                with self._cond:
+                    self.stats_counters["failures"] += 1
+                return response
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            if response.status_code == 429:
+                # O limite é por app: segura todas as requisições, não só esta
+                self.pause(delay)
+            if budget_nearly_spent(delay + MIN_STAGE_SECONDS):
+                # Sem tempo para esperar e tentar de novo dentro do deadline da requisição
+                with self._cond:
+                    self.stats_counters["deadline_aborts"] += 1
+                return response
+            self._count_retry()
+            print(f"⏳ HubSpot respondeu {response.status_code}, nova tentativa em {delay:.2f}s")
+            time.sleep(delay)
+
+        return response
+
+    def _count_retry(self):
+        with self._cond:
+            self.stats_counters["retries"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas do agendador"""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                **self.stats_counters,
+                "tokens": round(self._tokens, 2),
+                "waiting": len(self._waiters),
+                "waiting_bulk": sum(1 for p, _ in self._waiters if p != PRIORITY_INTERACTIVE),
+                "daily_used": self._daily_used,
+                "daily_quota": self.daily_quota,
+                "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2)
+            }
+
+
+# Instância global: todas as chamadas do processo compartilham o mesmo balde
+hubspot_scheduler = HubSpotRequestScheduler()
@@ -3,5 +3,6 @@ Services Package
 """
 
 from .cliente_service import cliente_service, ClienteService
+from .identity_index import identity_index, IdentityIndex
 
-__all__ = ["cliente_service", "ClienteService"]
+__all__ = ["cliente_service", "ClienteService", "identity_index", "IdentityIndex"]
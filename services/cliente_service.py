@@ -5,12 +5,20 @@ Responsável por buscar dados de clientes e coletar contexto
 
 import os
 import requests
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from http_pool import http_pool
+from hubspot_client import CONTEXT_PROPERTIES, HubSpotClient
+from hubspot_scheduler import hubspot_scheduler
+from ttl_cache import TTLCache
+from services.identity_index import identity_index
 
 load_dotenv()
 
+# Marcador de cache negativo: email consultado e inexistente no HubSpot
+_NAO_ENCONTRADO = object()
+
 
 class ClienteService:
     """Serviço para buscar e gerenciar dados de clientes do HubSpot Mock"""
@@ -23,7 +31,26 @@ class ClienteService:
             "Authorization": f"Bearer {self.hubspot_token}",
             "Content-Type": "application/json"
         }
-        self.cache: Dict[str, Dict] = {}  # Cache em memória
+        # Sessão keep-alive compartilhada com o HubSpotClient
+        self.session = http_pool.session
+        # Buscas paginadas do contexto (iter_search: cursor, projeção e agendador)
+        self.hubspot = HubSpotClient(use_mirror=False)
+        self.hubspot.base_url = self.hubspot_base
+        self.hubspot.headers = self.headers
+        # Cache em memória limitado (LRU + TTL), com entradas negativas curtas
+        self.cache = TTLCache(
+            max_size=int(os.getenv("CLIENTE_CACHE_MAX_SIZE", "5000")),
+            ttl=float(os.getenv("CLIENTE_CACHE_TTL_SECONDS", "3600")),
+            name="cliente_por_email"
+        )
+        self.negative_ttl = float(os.getenv("CLIENTE_CACHE_NEGATIVE_TTL_SECONDS", "120"))
+        
+        # Vínculos persistentes chat_id → contato (ver identity_index.py)
+        self.identity_index = identity_index
+        
+        # Limite opcional de objetos por tipo no contexto (vazio = todas as páginas)
+        max_resultados = os.getenv("HUBSPOT_MAX_RESULTS_PER_OBJECT", "")
+        self.max_resultados: Optional[int] = int(max_resultados) if max_resultados else None
     
     def buscar_por_email(self, email: str) -> Optional[Dict[str, Any]]:
         """
@@ -35,10 +62,14 @@ class ClienteService:
         Returns:
             Dados do cliente ou None se não encontrado
         """
-        # Verificar cache
-        if email in self.cache:
+        # Verificar cache (inclui "não encontrado" recente)
+        cached = self.cache.get(email)
+        if cached is _NAO_ENCONTRADO:
+            print(f"⚠️ Cliente {email} não encontrado (cache negativo)")
+            return None
+        if cached is not None:
             print(f"✅ Cliente {email} encontrado no cache")
-            return self.cache[email]
+            return cached
         
         url = f"{self.hubspot_base}/crm/v3/objects/contacts/search"
         
@@ -50,22 +81,24 @@ class ClienteService:
                     "value": email
                 }]
             }],
-            "properties": ["email", "firstname", "lastname", "phone", "mobilephone"],
+            "properties": CONTEXT_PROPERTIES["contacts"],
             "limit": 1
         }
         
         try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=5)
+            response = hubspot_scheduler.request(self.session, "POST", url, json=payload, headers=self.headers, timeout=5)
             response.raise_for_status()
             
             results = response.json().get("results", [])
             if results:
                 cliente = results[0]
                 # Armazenar em cache
-                self.cache[email] = cliente
+                self.cache.set(email, cliente)
                 print(f"✅ Cliente {email} encontrado no HubSpot Mock")
                 return cliente
             
+            # Só respostas válidas sem resultado viram cache negativo (erros não)
+            self.cache.set(email, _NAO_ENCONTRADO, ttl=self.negative_ttl)
             print(f"⚠️ Cliente {email} não encontrado no HubSpot Mock")
             return None
             
@@ -75,17 +108,46 @@ class ClienteService:
     
     def buscar_por_chat_id(self, chat_id: str) -> Optional[Dict[str, Any]]:
         """
-        Busca cliente no cache por chat_id do Telegram
+        Busca cliente no índice de identidade por chat_id do Telegram
         
         Args:
             chat_id: ID do chat do Telegram
             
         Returns:
-            Dados do cliente ou None
+            Dados do cliente ou None (fallback para busca por email)
+        """
+        try:
+            entry = self.identity_index.get(chat_id)
+        except Exception as e:
+            print(f"⚠️ Erro ao consultar índice de identidade: {e}")
+            return None
+        if not entry:
+            return None
+        
+        cliente = entry.get("cliente")
+        if cliente:
+            return cliente
+        return {"id": entry["contact_id"], "properties": {"email": entry.get("email")}}
+    
+    def vincular_chat_id(self, chat_id: str, cliente: Dict[str, Any]):
         """
-        # TODO: Implementar busca no Supabase por chat_id
-        # Por enquanto, retorna None (fallback para busca por email)
-        return None
+        Registra o vínculo chat_id → contato para as próximas sessões
+        
+        Args:
+            chat_id: ID do chat do Telegram
+            cliente: Dados do cliente retornados pelo HubSpot
+        """
+        contact_id = cliente.get("id")
+        if not contact_id:
+            return
+        
+        # Guardar só a identificação; o contexto é recalculado quando necessário
+        dados = {"id": contact_id, "properties": cliente.get("properties", {})}
+        email = dados["properties"].get("email")
+        try:
+            self.identity_index.put(chat_id, contact_id, email=email, cliente=dados)
+        except Exception as e:
+            print(f"⚠️ Erro ao vincular chat_id {chat_id}: {e}")
     
     def coletar_contexto(self, contact_id: str) -> Dict[str, Any]:
         """
@@ -124,124 +186,56 @@ class ClienteService:
     
     def _buscar_deals(self, contact_id: str, cutoff: int) -> List[Dict]:
         """Busca negócios do cliente"""
-        url = f"{self.hubspot_base}/crm/v3/objects/deals/search"
-        
-        payload = {
-            "filterGroups": [{
-                "filters": [
-                    {
-                        "propertyName": "associations.contact",
-                        "operator": "EQ",
-                        "value": contact_id
-                    },
-                    {
-                        "propertyName": "createdate",
-                        "operator": "GTE",
-                        "value": str(cutoff)
-                    }
-                ]
-            }],
-            "limit": 100
-        }
-        
-        try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=5)
-            response.raise_for_status()
-            return response.json().get("results", [])
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar deals: {e}")
-            return []
+        return self._buscar_associados("deals", contact_id, cutoff)
     
     def _buscar_tickets(self, contact_id: str, cutoff: int) -> List[Dict]:
         """Busca tickets do cliente"""
-        url = f"{self.hubspot_base}/crm/v3/objects/tickets/search"
-        
-        payload = {
-            "filterGroups": [{
-                "filters": [
-                    {
-                        "propertyName": "associations.contact",
-                        "operator": "EQ",
-                        "value": contact_id
-                    },
-                    {
-                        "propertyName": "createdate",
-                        "operator": "GTE",
-                        "value": str(cutoff)
-                    }
-                ]
-            }],
-            "limit": 100
-        }
-        
-        try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=5)
-            response.raise_for_status()
-            return response.json().get("results", [])
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar tickets: {e}")
-            return []
+        return self._buscar_associados("tickets", contact_id, cutoff)
     
     def _buscar_notes(self, contact_id: str, cutoff: int) -> List[Dict]:
         """Busca anotações do cliente"""
-        url = f"{self.hubspot_base}/crm/v3/objects/notes/search"
-        
-        payload = {
-            "filterGroups": [{
-                "filters": [
-                    {
-                        "propertyName": "associations.contact",
-                        "operator": "EQ",
-                        "value": contact_id
-                    },
-                    {
-                        "propertyName": "createdate",
-                        "operator": "GTE",
-                        "value": str(cutoff)
-                    }
-                ]
-            }],
-            "limit": 100
-        }
-        
-        try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=5)
-            response.raise_for_status()
-            return response.json().get("results", [])
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar notes: {e}")
-            return []
+        return self._buscar_associados("notes", contact_id, cutoff)
     
     def _buscar_emails(self, contact_id: str, cutoff: int) -> List[Dict]:
         """Busca emails do cliente"""
-        url = f"{self.hubspot_base}/crm/v3/objects/emails/search"
-        
-        payload = {
-            "filterGroups": [{
-                "filters": [
-                    {
-                        "propertyName": "associations.contact",
-                        "operator": "EQ",
-                        "value": contact_id
-                    },
-                    {
-                        "propertyName": "createdate",
-                        "operator": "GTE",
-                        "value": str(cutoff)
-                    }
-                ]
-            }],
-            "limit": 100
-        }
+        return self._buscar_associados("emails", contact_id, cutoff)
+    
+    def _iterar_associados(self, object_type: str, contact_id: str, cutoff: int) -> Iterator[Dict]:
+        """
+        Itera sobre os objetos associados ao cliente (HubSpotClient.iter_search)
         
+        Raises:
+            requests.exceptions.RequestException: Se alguma página falhar
+        """
+        filter_groups = [{
+            "filters": [
+                {
+                    "propertyName": "associations.contact",
+                    "operator": "EQ",
+                    "value": contact_id
+                },
+                {
+                    "propertyName": "createdate",
+                    "operator": "GTE",
+                    "value": str(cutoff)
+                }
+            ]
+        }]
+        return self.hubspot.iter_search(
+            object_type, filter_groups,
+            properties=CONTEXT_PROPERTIES[object_type],
+            max_results=self.max_resultados
+        )
+    
+    def _buscar_associados(self, object_type: str, contact_id: str, cutoff: int) -> List[Dict]:
+        """Busca todas as páginas de objetos associados, até o limite configurado"""
+        resultados: List[Dict] = []
         try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=5)
-            response.raise_for_status()
-            return response.json().get("results", [])
+            for item in self._iterar_associados(object_type, contact_id, cutoff):
+                resultados.append(item)
         except Exception as e:
-            print(f"⚠️ Erro ao buscar emails: {e}")
-            return []
-
+            print(f"⚠️ Erro ao buscar {object_type}: {e}")
+        return resultados
 
 # Singleton instance
 cliente_service = ClienteService()
@@ -0,0 +1,255 @@
+"""
+Índice de Identidade - chat_id do Telegram → contato do HubSpot
+Permite reconhecer clientes que já conversaram com o bot sem ir ao CRM
+
+Backends:
+    sqlite (padrão): arquivo local, IDENTITY_INDEX_PATH
+        (default: <PARETO_DATA_DIR>/identity_index.db, ver data_dir.py)
+    supabase: tabela telegram_identities (ver supabase_schema_conversations.sql)
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, List
+from dotenv import load_dotenv
+
+from data_dir import connect_sqlite, data_path
+from ttl_cache import TTLCache
+
+load_dotenv()
+
+
+class IdentityIndex(ABC):
+    """
+    Interface do índice chat_id → contato
+
+    Lookups passam por um LRU em memória antes do backend, então clientes
+    recorrentes são resolvidos em O(1) sem I/O.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=int(os.getenv("IDENTITY_INDEX_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("IDENTITY_INDEX_CACHE_TTL_SECONDS", "3600")),
+            name="identity_index"
+        )
+
+    def get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca o vínculo de um chat_id
+
+        Returns:
+            Dict com chat_id, contact_id, email e cliente (dados do HubSpot) ou None
+        """
+        chat_id = str(chat_id)
+        entry = self.cache.get(chat_id)
+        if entry is not None:
+            return entry
+
+        entry = self._get(chat_id)
+        if entry is not None:
+            self.cache.set(chat_id, entry)
+        return entry
+
+    def put(self, chat_id: str, contact_id: str, email: Optional[str] = None,
+            cliente: Optional[Dict[str, Any]] = None):
+        """Cria ou atualiza o vínculo chat_id → contato"""
+        entry = self._make_entry(chat_id, contact_id, email, cliente)
+        self._put_many([entry])
+        self.cache.set(entry["chat_id"], entry)
+
+    def delete(self, chat_id: str):
+        """Remove o vínculo de um chat_id"""
+        chat_id = str(chat_id)
+        self._delete(chat_id)
+        self.cache.invalidate(chat_id)
+
+    def bulk_import(self, rows: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+        """
+        Importa vínculos em lote (ex: exportação de campanhas anteriores)
+
+        Args:
+            rows: Dicts com chat_id, contact_id e opcionalmente email/cliente
+            batch_size: Linhas por escrita no backend
+
+        Returns:
+            Quantidade de vínculos importados
+        """
+        total = 0
+        batch: List[Dict[str, Any]] = []
+        for row in rows:
+            if not row.get("chat_id") or not row.get("contact_id"):
+                continue
+            batch.append(self._make_entry(row["chat_id"], row["contact_id"], row.get("email"), row.get("cliente")))
+            if len(batch) >= batch_size:
+                self._put_many(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self._put_many(batch)
+            total += len(batch)
+
+        # Entradas antigas no LRU podem ter sido sobrescritas
+        self.cache.clear()
+        return total
+
+    @staticmethod
+    def _make_entry(chat_id, contact_id, email=None, cliente=None) -> Dict[str, Any]:
+        return {
+            "chat_id": str(chat_id),
+            "contact_id": str(contact_id),
+            "email": email,
+            "cliente": cliente,
+            "updated_at": datetime.now().isoformat()
+        }
+
+    @abstractmethod
+    def _get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _put_many(self, entries: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def _delete(self, chat_id: str):
+        ...
+
+
+class SQLiteIdentityIndex(IdentityIndex):
+    """
+    Índice em SQLite local (chat_id é a chave primária)
+
+    O arquivo só é aberto no primeiro acesso: importar o módulo (singleton)
+    não cria nada em disco
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self.path = path or os.getenv("IDENTITY_INDEX_PATH", data_path("identity_index.db"))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Abre o arquivo (e cria a tabela) na primeira vez; chamar com _lock"""
+        if self._conn is None:
+            conn = connect_sqlite(self.path)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS telegram_identities (
+                    chat_id TEXT PRIMARY KEY,
+                    contact_id TEXT NOT NULL,
+                    email TEXT,
+                    cliente TEXT,
+                    updated_at TEXT
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT chat_id, contact_id, email, cliente, updated_at FROM telegram_identities WHERE chat_id = ?",
+                (chat_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "chat_id": row[0],
+            "contact_id": row[1],
+            "email": row[2],
+            "cliente": json.loads(row[3]) if row[3] else None,
+            "updated_at": row[4]
+        }
+
+    def _put_many(self, entries: List[Dict[str, Any]]):
+        rows = [
+            (e["chat_id"], e["contact_id"], e["email"],
+             json.dumps(e["cliente"], separators=(",", ":")) if e["cliente"] else None,
+             e["updated_at"])
+            for e in entries
+        ]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO telegram_identities (chat_id, contact_id, email, cliente, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+
+    def _delete(self, chat_id: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM telegram_identities WHERE chat_id = ?", (chat_id,))
+            conn.commit()
+
+
+class SupabaseIdentityIndex(IdentityIndex):
+    """Índice na tabela telegram_identities do Supabase (compartilhado entre instâncias)"""
+
+    def __init__(self, client=None):
+        super().__init__()
+        if client is None:
+            from supabase_client import supabase_client
+            client = supabase_client.client
+        self.client = client
+
+    def _get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        if not self.client:
+            return None
+        try:
+            result = self.client.table("telegram_identities").select("*").eq("chat_id", chat_id).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"⚠️ Erro ao buscar identidade no Supabase: {e}")
+            return None
+
+    def _put_many(self, entries: List[Dict[str, Any]]):
+        if not self.client:
+            return
+        try:
+            self.client.table("telegram_identities").upsert(entries, on_conflict="chat_id").execute()
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar identidade no Supabase: {e}")
+
+    def _delete(self, chat_id: str):
+        if not self.client:
+            return
+        try:
+            self.client.table("telegram_identities").delete().eq("chat_id", chat_id).execute()
+        except Exception as e:
+            print(f"⚠️ Erro ao remover identidade no Supabase: {e}")
+
+
+def create_identity_index() -> IdentityIndex:
+    """Cria o índice conforme IDENTITY_INDEX_BACKEND (sqlite | supabase)"""
+    backend = os.getenv("IDENTITY_INDEX_BACKEND", "sqlite").lower()
+    if backend == "supabase":
+        return SupabaseIdentityIndex()
+    return SQLiteIdentityIndex()
+
+
+# Singleton instance
+identity_index = create_identity_index()
+
+
+if __name__ == "__main__":
+    # Importação em lote: python -m services.identity_index import vinculos.csv
+    # CSV com colunas chat_id, contact_id e (opcional) email
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("Uso: python -m services.identity_index import <arquivo.csv>")
+        sys.exit(1)
+
+    with open(sys.argv[2], newline="", encoding="utf-8") as f:
+        total = identity_index.bulk_import(csv.DictReader(f))
+    print(f"✅ {total} vínculos importados para {type(identity_index).__name__}")
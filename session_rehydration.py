@@ -0,0 +1,135 @@
+"""
+Reconstrução de sessões a partir do log conversation_messages
+Toda mensagem do cliente, do bot e do gerente, e cada transição de estado, já
+é gravada no Supabase. Quando a sessão não está no session store (restart,
+TTL vencido, worker novo), ela é reconstruída a partir das últimas linhas do
+chat, numa única consulta pelo índice (chat_id, created_at DESC)
+
+Linhas [SNAPSHOT] periódicas guardam o estado compacto da sessão: a
+reconstrução parte do snapshot mais recente e reaplica só as linhas
+posteriores, sem reler o log inteiro
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SNAPSHOT_PREFIX = "[SNAPSHOT]"
+TRANSITION_PREFIX = "[STATE_TRANSITION]"
+SENTIMENT_PREFIX = "[SENTIMENT]"
+
+# Linhas que entram no histórico da sessão (as de sistema só alteram o estado)
+MESSAGE_SENDERS = ("user", "bot", "manager")
+
+# Campos do registro da sessão guardados no snapshot (histórico vem das linhas)
+SNAPSHOT_FIELDS = (
+    "state", "nps_score", "feedback_text", "sentiment", "created_at",
+    "manual_mode", "cliente_identificado", "dados_cliente"
+)
+
+
+def snapshot_message(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Argumentos de log_conversation_message para a linha [SNAPSHOT] do registro"""
+    return {
+        "chat_id": record["chat_id"],
+        "message_text": f"{SNAPSHOT_PREFIX} {record['state']}",
+        "sender": "system",
+        "conversation_state": record["state"],
+        "nps_score": record.get("nps_score"),
+        "sentiment": record.get("sentiment"),
+        "metadata": {"snapshot": {key: record.get(key) for key in SNAPSHOT_FIELDS}}
+    }
+
+
+def is_snapshot(row: Dict[str, Any]) -> bool:
+    return row.get("sender") == "system" and (row.get("message_text") or "").startswith(SNAPSHOT_PREFIX)
+
+
+def _local_iso(value: Optional[str]) -> str:
+    """Timestamp do Supabase (UTC, com fuso) no formato local das sessões"""
+    if not value:
+        return datetime.now().isoformat()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return datetime.now().isoformat()
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def rebuild_record(chat_id: str, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Registro da sessão (formato de ConversationSession.to_record) a partir das
+    linhas mais recentes do chat
+
+    Args:
+        chat_id: ID do chat
+        rows: Linhas de conversation_messages, da mais recente para a mais antiga
+
+    Returns:
+        Registro reconstruído, ou None se o chat não tem linhas
+    """
+    if not rows:
+        return None
+
+    chronological = list(reversed(rows))
+    start = 0
+    record: Dict[str, Any] = {
+        "chat_id": str(chat_id),
+        "state": "idle",
+        "nps_score": None,
+        "feedback_text": "",
+        "sentiment": None,
+        "created_at": _local_iso(chronological[0].get("created_at")),
+        "manual_mode": False,
+        "cliente_identificado": False,
+        "dados_cliente": None
+    }
+    for index in range(len(chronological) - 1, -1, -1):
+        row = chronological[index]
+        snapshot = (row.get("metadata") or {}).get("snapshot") if is_snapshot(row) else None
+        if snapshot:
+            record.update({key: snapshot[key] for key in SNAPSHOT_FIELDS if key in snapshot})
+            start = index + 1
+            break
+
+    last_user_text = ""
+    for row in chronological[start:]:
+        text = row.get("message_text") or ""
+        sender = row.get("sender")
+        state = row.get("conversation_state")
+
+        if sender == "system":
+            if text.startswith(TRANSITION_PREFIX) and state:
+                record["state"] = state
+            elif text.startswith(SENTIMENT_PREFIX):
+                record["sentiment"] = row.get("sentiment") or record["sentiment"]
+            continue
+
+        if state:
+            record["state"] = state
+        if sender == "user":
+            last_user_text = text
+            continue
+
+        # Resposta do bot/gerente: nota e sentimento já atualizados pela mensagem
+        score = row.get("nps_score")
+        if score is None:
+            # Nova conversa (/start): nota, feedback e sentimento zerados
+            record["feedback_text"] = ""
+            record["sentiment"] = row.get("sentiment")
+        else:
+            if record["nps_score"] is None:
+                record["feedback_text"] = last_user_text
+            # A análise em paralelo pode ter sido gravada antes desta resposta
+            record["sentiment"] = row.get("sentiment") or record["sentiment"]
+        record["nps_score"] = score
+
+    record["manual_mode"] = record["state"] == "manual_mode"
+    record["updated_at"] = _local_iso(rows[0].get("created_at"))
+    record["history"] = [
+        {"sender": row["sender"], "text": row.get("message_text") or "", "timestamp": _local_iso(row.get("created_at"))}
+        for row in chronological
+        if row.get("sender") in MESSAGE_SENDERS
+    ]
+    return record
@@ -0,0 +1,309 @@
+"""
+Armazenamento externo das sessões de conversa
+Permite vários workers (uvicorn/Vercel) atrás do webhook do Telegram sem que o
+cliente perca a pesquisa no meio a cada cold start
+
+Backends (SESSION_STORE):
+    memory: dict do processo (padrão; comportamento anterior)
+    sqlite: arquivo local, compartilhado entre workers do mesmo host
+    redis: qualquer servidor com protocolo Redis (Redis, Valkey, Upstash...)
+
+Cada sessão é gravada compacta (JSON sem espaços, zlib acima de um limite),
+com TTL e versão: save() só grava se a versão não mudou desde o load()
+(controle otimista); caso contrário levanta SessionVersionConflict
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from data_dir import connect_sqlite, data_path
+
+load_dotenv()
+
+# Payloads maiores que isso são comprimidos com zlib
+COMPRESS_MIN_BYTES = 512
+
+
+class SessionVersionConflict(Exception):
+    """Outra gravação alterou a sessão depois do load()"""
+
+
+def encode_session(data: Dict[str, Any]) -> bytes:
+    """Serialização compacta: prefixo b"j" (JSON) ou b"z" (JSON + zlib)"""
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def decode_session(payload: bytes) -> Dict[str, Any]:
+    if payload[:1] == b"z":
+        return json.loads(zlib.decompress(payload[1:]).decode("utf-8"))
+    return json.loads(payload[1:].decode("utf-8"))
+
+
+class SessionStore(ABC):
+    """
+    Interface dos backends
+
+    load(chat_id) -> (dados, versão) ou None
+    save(chat_id, dados, expected_version) -> nova versão
+        expected_version=0 significa "sessão nova"
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+        self._stats_lock = threading.Lock()
+        self.counters = {"loads": 0, "hits": 0, "saves": 0, "conflicts": 0, "bytes_written": 0}
+
+    def load(self, chat_id: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._stats_lock:
+            self.counters["loads"] += 1
+        found = self._load(str(chat_id))
+        if found is None:
+            return None
+        payload, version = found
+        with self._stats_lock:
+            self.counters["hits"] += 1
+        return decode_session(payload), version
+
+    def save(self, chat_id: str, data: Dict[str, Any], expected_version: int,
+             ttl: Optional[float] = None) -> int:
+        """Grava com TTL próprio (ex: por estado da conversa) ou o padrão do store"""
+        payload = encode_session(data)
+        new_version = self._save(str(chat_id), payload, expected_version, self.ttl if ttl is None else ttl)
+        with self._stats_lock:
+            if new_version is None:
+                self.counters["conflicts"] += 1
+            else:
+                self.counters["saves"] += 1
+                self.counters["bytes_written"] += len(payload)
+        if new_version is None:
+            raise SessionVersionConflict(f"Sessão {chat_id} alterada por outro worker")
+        return new_version
+
+    def delete(self, chat_id: str):
+        self._delete(str(chat_id))
+
+    def purge_expired(self) -> int:
+        """Remove sessões vencidas; retorna quantas (backends com TTL nativo: 0)"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"backend": self.backend, "ttl_seconds": self.ttl, **self.counters}
+
+    # Implementados pelos backends
+    backend = "abstract"
+
+    @abstractmethod
+    def _load(self, chat_id: str) -> Optional[Tuple[bytes, int]]:
+        ...
+
+    @abstractmethod
+    def _save(self, chat_id: str, payload: bytes, expected_version: int, ttl: float) -> Optional[int]:
+        """Grava se a versão atual == expected_version; retorna a nova versão ou None"""
+
+    @abstractmethod
+    def _delete(self, chat_id: str):
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessões no próprio processo (um worker só)
+
+    Limitado a SESSION_MAX_SESSIONS entradas: acima disso, remove a sessão
+    usada há mais tempo (LRU)
+    """
+
+    backend = "memory"
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        super().__init__(ttl)
+        self.max_entries = max_entries or int(os.getenv("SESSION_MAX_SESSIONS", "100000"))
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[bytes, int, float]]" = OrderedDict()
+        self.counters["evicted"] = 0
+
+    def _load(self, chat_id):
+        with self._lock:
+            entry = self._data.get(chat_id)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._data[chat_id]
+                return None
+            self._data.move_to_end(chat_id)
+            return entry[0], entry[1]
+
+    def _save(self, chat_id, payload, expected_version, ttl):
+        with self._lock:
+            entry = self._data.get(chat_id)
+            current = entry[1] if entry and entry[2] > time.time() else 0
+            if current != expected_version:
+                return None
+            self._data[chat_id] = (payload, current + 1, time.time() + ttl)
+            self._data.move_to_end(chat_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                with self._stats_lock:
+                    self.counters["evicted"] += 1
+            return current + 1
+
+    def _delete(self, chat_id):
+        with self._lock:
+            self._data.pop(chat_id, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [chat_id for chat_id, entry in self._data.items() if entry[2] <= now]
+            for chat_id in expired:
+                del self._data[chat_id]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessões em SQLite (WAL), compartilhadas entre workers do mesmo host
+
+    SESSION_STORE_PATH: Arquivo (default: <PARETO_DATA_DIR>/sessions.db, ver
+    data_dir.py), aberto no primeiro acesso
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.path = path or os.getenv("SESSION_STORE_PATH", data_path("sessions.db"))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Abre o arquivo (e cria a tabela) na primeira vez; chamar com _lock"""
+        if self._conn is None:
+            conn = connect_sqlite(self.path, timeout=5)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_sessions (
+                    chat_id TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    version INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _load(self, chat_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload, version, expires_at FROM conversation_sessions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        return bytes(row[0]), row[1]
+
+    def _save(self, chat_id, payload, expected_version, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            if expected_version == 0:
+                # Nova sessão: só insere se não existe (ou se a anterior expirou)
+                conn.execute(
+                    "DELETE FROM conversation_sessions WHERE chat_id = ? AND expires_at <= ?", (chat_id, now)
+                )
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO conversation_sessions (chat_id, payload, version, expires_at) "
+                    "VALUES (?, ?, 1, ?)",
+                    (chat_id, payload, now + ttl)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE conversation_sessions SET payload = ?, version = version + 1, expires_at = ? "
+                    "WHERE chat_id = ? AND version = ? AND expires_at > ?",
+                    (payload, now + ttl, chat_id, expected_version, now)
+                )
+            conn.commit()
+        return expected_version + 1 if cursor.rowcount == 1 else None
+
+    def _delete(self, chat_id):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM conversation_sessions WHERE chat_id = ?", (chat_id,))
+            conn.commit()
+
+    def purge_expired(self) -> int:
+        """Remove sessões vencidas; retorna quantas"""
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute("DELETE FROM conversation_sessions WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+
+
+# Compare-and-set atômico no servidor: grava só se a versão bate
+_REDIS_CAS = """
+local current = redis.call('HGET', KEYS[1], 'v')
+current = tonumber(current) or 0
+if current ~= tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'v', current + 1, 'p', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return current + 1
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """Sessões em Redis (hash com versão + payload, TTL via EXPIRE)"""
+
+    backend = "redis"
+
+    def __init__(self, url: Optional[str] = None, ttl: Optional[float] = None, prefix: str = "pareto:session:"):
+        super().__init__(ttl)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE=redis requer o pacote 'redis' (pip install redis)") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        self._cas = self._client.register_script(_REDIS_CAS)
+
+    def _load(self, chat_id):
+        values = self._client.hmget(self.prefix + chat_id, "p", "v")
+        if values[0] is None:
+            return None
+        return values[0], int(values[1])
+
+    def _save(self, chat_id, payload, expected_version, ttl):
+        result = self._cas(keys=[self.prefix + chat_id], args=[expected_version, payload, max(1, int(ttl))])
+        return None if int(result) < 0 else int(result)
+
+    def _delete(self, chat_id):
+        self._client.delete(self.prefix + chat_id)
+
+
+def create_session_store() -> SessionStore:
+    """Backend configurado em SESSION_STORE (memory | sqlite | redis)"""
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    return InMemorySessionStore()
@@ -45,6 +45,7 @@ def setup_conversation_table():
         CREATE INDEX IF NOT EXISTS idx_conversation_created_at ON conversation_messages(created_at DESC);
         CREATE INDEX IF NOT EXISTS idx_conversation_sender ON conversation_messages(sender);
         CREATE INDEX IF NOT EXISTS idx_conversation_state ON conversation_messages(conversation_state);
+        CREATE INDEX IF NOT EXISTS idx_conversation_chat_created ON conversation_messages(chat_id, created_at DESC);
         """
         
         print("📝 Executando SQL...")
@@ -0,0 +1,93 @@
+"""
+Roteamento de chats por hash consistente
+Cada worker do modo multi-processo (sharded_server.py) é dono de um conjunto
+de faixas do anel; todas as mensagens de um chat vão sempre para o mesmo
+worker, que mantém a sessão quente na própria memória
+
+O hash é estável entre processos e reinícios (blake2b, não o hash() do Python)
+e cada shard ocupa vários pontos do anel (vnodes), para dividir os chats de
+forma equilibrada; mudar o número de shards move só ~1/N dos chats
+"""
+
+import bisect
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+# Rotas que limpam estado em memória de cada worker (cache de contexto): a
+# frente repassa a todos os shards, não a um só
+BROADCAST_PATHS = (
+    re.compile(r"^/hubspot/webhook$"),
+    re.compile(r"^/nps/context/[^/]+/invalidate$"),
+)
+# Marca as cópias do broadcast: o worker só invalida o cache local e deixa o
+# trabalho compartilhado (espelho do HubSpot) para o shard que recebeu o original
+BROADCAST_HEADER = "x-shard-broadcast"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Anel de hash consistente com vnodes por shard"""
+
+    def __init__(self, nodes: Sequence[str], vnodes: int = 128):
+        if not nodes:
+            raise ValueError("HashRing precisa de pelo menos um shard")
+        self.nodes = list(nodes)
+        self.vnodes = vnodes
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(vnodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """Shard dono da chave: primeiro ponto do anel no sentido horário"""
+        index = bisect.bisect(self._keys, _hash(str(key)))
+        return self._owners[index % len(self._owners)]
+
+    def distribution(self, keys: Sequence[str]) -> Dict[str, int]:
+        """Quantas chaves cada shard recebe (diagnóstico do balanceamento)"""
+        counts = {node: 0 for node in self.nodes}
+        for key in keys:
+            counts[self.node_for(key)] += 1
+        return counts
+
+
+def extract_chat_id(body: bytes) -> Optional[str]:
+    """
+    chat_id de um update do Telegram (message.chat.id) ou de uma requisição
+    dos endpoints manuais (chat_id no corpo). None se o corpo não tiver chat.
+    """
+    if not body:
+        return None
+    try:
+        data: Any = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    for update_key in ("message", "edited_message"):
+        message = data.get(update_key)
+        if isinstance(message, dict):
+            chat_id = (message.get("chat") or {}).get("id")
+            if chat_id is not None:
+                return str(chat_id)
+
+    chat_id = data.get("chat_id")
+    return str(chat_id) if chat_id not in (None, "") else None
+
+
+def is_broadcast_path(path: str) -> bool:
+    """True se a rota deve ser repassada a todos os shards"""
+    return any(pattern.match(path) for pattern in BROADCAST_PATHS)
+
+
+def shard_names(count: int) -> List[str]:
+    return [f"shard-{index}" for index in range(count)]
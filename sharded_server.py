@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Modo multi-processo com chats fixos por worker
+Sobe N processos da API (uvicorn api:app), cada um num socket Unix local, e
+uma frente HTTP fina que recebe o webhook do Telegram e repassa cada update
+ao worker dono do chat (HashRing em shard_router.py)
+
+Assim a sessão de cada chat fica sempre no mesmo processo (cache quente, sem
+session store compartilhado) e a vazão escala com o número de núcleos
+
+Uso:
+  python3 sharded_server.py
+  python3 sharded_server.py --workers 4 --port 8000
+
+Configuração (.env):
+    SHARD_WORKERS: Processos da API (default: número de CPUs)
+    SHARD_SOCKET_DIR: Diretório dos sockets (default: <tmp>)
+    SHARD_FORWARD_TIMEOUT_SECONDS: Timeout do repasse ao worker (default: 30)
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from shard_router import BROADCAST_HEADER, HashRing, extract_chat_id, is_broadcast_path, shard_names
+
+load_dotenv()
+
+# Cabeçalhos que não devem ser repassados (conexão/transferência de cada salto)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "upgrade", "host", "content-length",
+    "proxy-authenticate", "proxy-authorization", "te", "trailer"
+}
+
+
+class ShardSupervisor:
+    """Processos da API, um por shard; reinicia os que morrerem"""
+
+    def __init__(self, count: int, socket_dir: Optional[str] = None, app: str = "api:app"):
+        self.count = count
+        self.app = app
+        self.socket_dir = socket_dir or os.getenv("SHARD_SOCKET_DIR", tempfile.gettempdir())
+        self.names = shard_names(count)
+        self.sockets = {
+            name: os.path.join(self.socket_dir, f"pareto_{name}.sock") for name in self.names
+        }
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self.restarts = 0
+
+    def _spawn(self, index: int, name: str) -> subprocess.Popen:
+        socket_path = self.sockets[name]
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        env = {**os.environ, "SHARD_INDEX": str(index), "SHARD_COUNT": str(self.count)}
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", self.app, "--uds", socket_path, "--log-level", "info"],
+            env=env
+        )
+
+    def start(self):
+        for index, name in enumerate(self.names):
+            self._processes[name] = self._spawn(index, name)
+        print(f"🧩 {self.count} workers iniciados (sockets em {self.socket_dir})")
+
+    def check(self) -> int:
+        """Reinicia workers que terminaram; retorna quantos"""
+        restarted = 0
+        for index, name in enumerate(self.names):
+            process = self._processes.get(name)
+            if process is not None and process.poll() is not None:
+                print(f"⚠️ Worker {name} terminou (código {process.returncode}), reiniciando")
+                self._processes[name] = self._spawn(index, name)
+                restarted += 1
+        self.restarts += restarted
+        return restarted
+
+    def stop(self, timeout: float = 10.0):
+        for process in self._processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            try:
+                process.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for socket_path in self.sockets.values():
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": {
+                name: {"pid": process.pid, "alive": process.poll() is None}
+                for name, process in self._processes.items()
+            },
+            "restarts": self.restarts
+        }
+
+
+def create_front_app(ring: HashRing, clients: Dict[str, httpx.AsyncClient],
+                     supervisor: Optional[ShardSupervisor] = None) -> FastAPI:
+    """
+    Frente HTTP: repassa cada requisição ao worker dono do chat
+
+    Requisições sem chat_id (métricas, contatos, fluxo NPS) vão para os
+    workers em rodízio. Rotas que invalidam o cache de contexto (webhook do
+    HubSpot, invalidate) vão para todos: um shard recebe o original e responde,
+    os demais recebem uma cópia marcada com BROADCAST_HEADER.
+
+    Args:
+        ring: Anel com os nomes dos shards
+        clients: Cliente HTTP de cada shard (socket Unix do worker)
+        supervisor: Processos dos workers (opcional; reinicia os que morrerem)
+    """
+    app = FastAPI(title="NPS Multi-Agent API - Frente com shards")
+    round_robin = itertools.cycle(ring.nodes)
+    counters = {name: {"forwarded": 0, "failed": 0} for name in ring.nodes}
+    monitor: List[asyncio.Task] = []
+
+    async def _monitor_workers():
+        while True:
+            await asyncio.sleep(2)
+            supervisor.check()
+
+    @app.on_event("startup")
+    async def start_monitor():
+        if supervisor is not None:
+            monitor.append(asyncio.create_task(_monitor_workers()))
+
+    @app.on_event("shutdown")
+    async def stop_monitor():
+        for task in monitor:
+            task.cancel()
+        await asyncio.gather(*monitor, return_exceptions=True)
+        for client in clients.values():
+            await client.aclose()
+        # Aqui, e não só no finally de main(): o uvicorn reenvia o sinal recebido
+        # ao terminar, e o processo pode sair antes do finally
+        if supervisor is not None:
+            await asyncio.to_thread(supervisor.stop)
+
+    @app.get("/metrics/shards")
+    async def shard_metrics():
+        """Repasses por shard e estado dos processos"""
+        return {
+            "shards": len(ring.nodes),
+            "vnodes": ring.vnodes,
+            "forwarding": counters,
+            "supervisor": supervisor.stats() if supervisor is not None else None
+        }
+
+    async def _send(shard: str, request: Request, path: str, body: bytes,
+                    headers: Dict[str, str]) -> Optional[httpx.Response]:
+        try:
+            upstream = await clients[shard].request(
+                request.method, "/" + path, params=request.query_params, content=body, headers=headers
+            )
+        except httpx.HTTPError as e:
+            counters[shard]["failed"] += 1
+            print(f"❌ Worker {shard} indisponível: {e}")
+            return None
+        counters[shard]["forwarded"] += 1
+        return upstream
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def forward(path: str, request: Request):
+        body = await request.body()
+        chat_id = extract_chat_id(body)
+        shard = ring.node_for(chat_id) if chat_id is not None else next(round_robin)
+
+        headers = {
+            key: value for key, value in request.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() != BROADCAST_HEADER
+        }
+        if is_broadcast_path("/" + path):
+            copies = [
+                _send(other, request, path, body, {**headers, BROADCAST_HEADER: "1"})
+                for other in ring.nodes if other != shard
+            ]
+            upstream, *others = await asyncio.gather(_send(shard, request, path, body, headers), *copies)
+            if any(other is None for other in others):
+                # Algum shard ficou com cache velho: 503 faz o remetente reenviar
+                # (invalidar de novo é inofensivo)
+                upstream = None
+        else:
+            upstream = await _send(shard, request, path, body, headers)
+
+        if upstream is None:
+            # 503 + Retry-After: o Telegram reenvia o update depois
+            return JSONResponse(status_code=503, content={"status": "unavailable", "shard": shard},
+                                headers={"Retry-After": "1"})
+
+        response_headers = {
+            key: value for key, value in upstream.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() != "content-encoding"
+        }
+        return Response(content=upstream.content, status_code=upstream.status_code, headers=response_headers)
+
+    return app
+
+
+def _uds_client(socket_path: str, timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(uds=socket_path),
+        base_url="http://shard",
+        timeout=timeout
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API NPS em N processos com chats fixos por worker")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    supervisor = ShardSupervisor(args.workers)
+    ring = HashRing(supervisor.names)
+    timeout = float(os.getenv("SHARD_FORWARD_TIMEOUT_SECONDS", "30"))
+    clients = {name: _uds_client(path, timeout) for name, path in supervisor.sockets.items()}
+
+    supervisor.start()
+    try:
+        print(f"🚀 Frente com {args.workers} shards em http://{args.host}:{args.port}")
+        uvicorn.run(create_front_app(ring, clients, supervisor), host=args.host, port=args.port, log_level="info")
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
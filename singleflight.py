@@ -0,0 +1,82 @@
+"""
+Single-flight: deduplicação de chamadas idênticas em andamento
+Chamadas concorrentes com a mesma chave compartilham uma única execução
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes pela chave
+
+    A primeira thread executa a função; as que chegam com a mesma chave enquanto
+    ela está em andamento esperam e recebem o mesmo resultado (ou a mesma exceção).
+    Nada é guardado depois que a chamada termina: isto não é um cache.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa fn(*args, **kwargs) uma única vez por chave em andamento"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de deduplicação"""
+        with self._lock:
+            total = self.executions + self.shared
+            return {
+                "name": self.name,
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "shared": self.shared,
+                "dedup_rate": round(self.shared / total, 4) if total else 0.0
+            }
@@ -92,7 +92,7 @@ class SupabaseClient:
     
     def log_conversation_message(self, chat_id, message_text, sender, 
                                  conversation_state=None, nps_score=None, 
-                                 sentiment=None, metadata=None):
+                                 sentiment=None, metadata=None, created_at=None):
         """
         Registra uma mensagem de conversa no banco de dados
         
@@ -104,6 +104,8 @@ class SupabaseClient:
             nps_score: Score NPS se disponível
             sentiment: Sentimento detectado
             metadata: Dados adicionais em JSON
+            created_at: Instante da mensagem (ISO 8601); usado quando o log é
+                gravado depois, pela fila de tarefas, para manter a ordem real
         """
         if not self.client:
             return None
@@ -118,6 +120,8 @@ class SupabaseClient:
                 "sentiment": sentiment,
                 "metadata": metadata if isinstance(metadata, dict) else {}
             }
+            if created_at:
+                data["created_at"] = created_at
             
             result = self.client.table("conversation_messages").insert(data).execute()
             return result
@@ -125,6 +129,31 @@ class SupabaseClient:
         except Exception as e:
             print(f"⚠️ Erro ao logar mensagem de conversa: {e}")
             return None
+    
+    def fetch_conversation_tail(self, chat_id, limit=100):
+        """
+        Últimas mensagens de um chat, da mais recente para a mais antiga
+        
+        Uma consulta servida pelo índice (chat_id, created_at DESC); usada para
+        reconstruir a sessão depois de um restart. Safe-fail: retorna [] sem
+        Supabase configurado ou em caso de erro.
+        """
+        if not self.client:
+            return []
+        
+        try:
+            result = (
+                self.client.table("conversation_messages")
+                .select("message_text,sender,conversation_state,nps_score,sentiment,metadata,created_at")
+                .eq("chat_id", str(chat_id))
+                .order("created_at", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            print(f"⚠️ Erro ao buscar mensagens da conversa: {e}")
+            return []
 
 # Instância global para facilitar importação
 supabase_client = SupabaseClient()
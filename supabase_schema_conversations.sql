@@ -17,9 +17,25 @@ CREATE INDEX IF NOT EXISTS idx_conversation_chat_id ON conversation_messages(cha
 CREATE INDEX IF NOT EXISTS idx_conversation_created_at ON conversation_messages(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_conversation_sender ON conversation_messages(sender);
 CREATE INDEX IF NOT EXISTS idx_conversation_state ON conversation_messages(conversation_state);
+-- Reconstrução da sessão: últimas linhas de um chat numa única consulta
+CREATE INDEX IF NOT EXISTS idx_conversation_chat_created ON conversation_messages(chat_id, created_at DESC);
 
 -- Comentários
 COMMENT ON TABLE conversation_messages IS 'Histórico completo de mensagens das conversas NPS via Telegram';
 COMMENT ON COLUMN conversation_messages.sender IS 'Quem enviou: user (cliente), bot (automático), manager (gerente manual), system (transições)';
 COMMENT ON COLUMN conversation_messages.conversation_state IS 'Estado da conversa: idle, waiting_score, waiting_feedback, completed, manual_mode';
 COMMENT ON COLUMN conversation_messages.manual_mode IS 'Se true, bot não responde automaticamente (gerente assumiu controle)';
+COMMENT ON COLUMN conversation_messages.message_text IS 'Texto da mensagem; linhas de sistema [SNAPSHOT] guardam o estado compacto da sessão em metadata.snapshot';
+
+-- Índice de identidade: chat_id do Telegram → contato do HubSpot
+CREATE TABLE IF NOT EXISTS telegram_identities (
+    chat_id TEXT PRIMARY KEY,
+    contact_id TEXT NOT NULL,
+    email TEXT,
+    cliente JSONB,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_identities_contact_id ON telegram_identities(contact_id);
+
+COMMENT ON TABLE telegram_identities IS 'Vínculo chat_id → contact_id usado para identificar clientes recorrentes sem consultar o HubSpot';
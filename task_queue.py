@@ -0,0 +1,348 @@
+"""
+Fila de tarefas pós-resposta
+Trabalho que o cliente não vê (avaliação do NPS, atualização de campanha,
+logs de auditoria) roda depois que a resposta do Telegram foi enviada
+
+- Fila asyncio em memória consumida por N workers do próprio processo
+- Fila cheia ou shutdown com tarefas pendentes: as tarefas vão para o SQLite
+  (spillover) e são retomadas no próximo start
+- Falhas são tentadas de novo até max_attempts; depois ficam registradas como
+  mortas no SQLite para inspeção
+
+As tarefas são identificadas por nome (register) e recebem kwargs
+serializáveis em JSON, para sobreviverem ao spillover em disco
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from data_dir import connect_sqlite, data_path
+
+load_dotenv()
+
+
+class BackgroundTaskQueue:
+    """
+    Fila asyncio com workers, retries e spillover em SQLite
+
+    Configuração (.env):
+        TASK_QUEUE_ENABLED: Usar a fila (default: true); false executa na hora
+        TASK_QUEUE_WORKERS: Workers concorrentes (default: 2)
+        TASK_QUEUE_MAX_SIZE: Tarefas em memória antes do spillover (default: 1000)
+        TASK_QUEUE_MAX_ATTEMPTS: Tentativas por tarefa (default: 3)
+        TASK_QUEUE_SPILL_PATH: Arquivo SQLite (default: <PARETO_DATA_DIR>/task_queue.db)
+
+    O arquivo é aberto no start() (ou no primeiro spillover), não no import
+    """
+
+    def __init__(self, name: str = "post_response", workers: Optional[int] = None,
+                 max_size: Optional[int] = None, max_attempts: Optional[int] = None,
+                 spill_path: Optional[str] = None, retry_delay: float = 1.0):
+        self.name = name
+        self.enabled = os.getenv("TASK_QUEUE_ENABLED", "true").lower() != "false"
+        self.workers = workers or int(os.getenv("TASK_QUEUE_WORKERS", "2"))
+        self.max_size = max_size or int(os.getenv("TASK_QUEUE_MAX_SIZE", "1000"))
+        self.max_attempts = max_attempts or int(os.getenv("TASK_QUEUE_MAX_ATTEMPTS", "3"))
+        self.retry_delay = retry_delay
+        self.spill_path = spill_path or os.getenv("TASK_QUEUE_SPILL_PATH", data_path("task_queue.db"))
+
+        self._jobs: Dict[str, Callable[..., Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.counters = {
+            "enqueued": 0,
+            "inline": 0,
+            "spilled": 0,
+            "restored": 0,
+            "completed": 0,
+            "retried": 0,
+            "failed": 0,
+            "dead": 0
+        }
+        self.last_error: Optional[str] = None
+
+    def register(self, job: str, fn: Callable[..., Any]):
+        """Associa um nome de tarefa a uma função (sync ou async) que recebe kwargs"""
+        self._jobs[job] = fn
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counters[key] += amount
+
+    # ---------- Produção ----------
+
+    def enqueue(self, job: str, **payload: Any) -> bool:
+        """
+        Agenda a tarefa para depois da resposta
+
+        Returns:
+            True se foi para a fila (memória ou disco); False se a fila não está
+            rodando neste processo (o chamador executa na hora, ex: run_inline)
+        """
+        if not self.enabled or not self._running:
+            return False
+
+        item = (job, payload, 0)
+        try:
+            if self._in_loop_thread():
+                self._queue.put_nowait(item)
+            else:
+                # Chamado de uma thread (asyncio.to_thread): entrega ao loop da fila
+                if self._queue.full():
+                    raise asyncio.QueueFull
+                self._loop.call_soon_threadsafe(self._put_or_spill, item)
+        except asyncio.QueueFull:
+            self._spill(job, payload, 0)
+            return True
+
+        self._count("enqueued")
+        return True
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _put_or_spill(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._spill(*item)
+
+    async def run_inline(self, job: str, **payload: Any):
+        """Executa a tarefa agora (fila desligada ou fora do processo da API)"""
+        self._count("inline")
+        try:
+            await self._execute(job, payload)
+        except Exception as e:
+            self._count("failed")
+            self.last_error = f"{job}: {e}"
+            print(f"⚠️ Tarefa {job} falhou: {e}")
+
+    # ---------- Spillover ----------
+
+    def _connection(self) -> sqlite3.Connection:
+        """Abre o arquivo (e cria as tabelas) na primeira vez; chamar com _lock"""
+        if self._conn is None:
+            conn = connect_sqlite(self.spill_path)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS spilled_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    job TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS dead_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    job TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    error TEXT,
+                    failed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _spill(self, job: str, payload: Dict[str, Any], attempts: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO spilled_tasks (queue, job, payload, attempts, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, job, json.dumps(payload, default=str), attempts, time.time())
+            )
+            conn.commit()
+            self.counters["spilled"] += 1
+
+    def _spilled_count(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return 0
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM spilled_tasks WHERE queue = ?", (self.name,)
+            ).fetchone()[0]
+
+    def _restore_spilled(self) -> int:
+        """
+        Move do disco para a fila em memória o quanto couber
+
+        O arquivo pode ser compartilhado por vários processos (workers de
+        sharded_server.py): as linhas são reivindicadas e apagadas num único
+        DELETE ... RETURNING sob BEGIN IMMEDIATE, então cada tarefa é retomada
+        por um processo só
+        """
+        free = self._queue.maxsize - self._queue.qsize()
+        if free <= 0:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    """
+                    DELETE FROM spilled_tasks WHERE id IN (
+                        SELECT id FROM spilled_tasks WHERE queue = ? ORDER BY id LIMIT ?
+                    )
+                    RETURNING id, job, payload, attempts
+                    """,
+                    (self.name, free)
+                ).fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self.counters["restored"] += len(rows)
+        # RETURNING não garante ordem
+        rows.sort(key=lambda row: row[0])
+        for _, job, payload, attempts in rows:
+            self._queue.put_nowait((job, json.loads(payload), attempts))
+        return len(rows)
+
+    def _bury(self, job: str, payload: Dict[str, Any], attempts: int, error: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO dead_tasks (queue, job, payload, attempts, error, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, job, json.dumps(payload, default=str), attempts, error, time.time())
+            )
+            conn.commit()
+            self.counters["dead"] += 1
+
+    # ---------- Execução ----------
+
+    async def _execute(self, job: str, payload: Dict[str, Any]):
+        fn = self._jobs.get(job)
+        if fn is None:
+            raise KeyError(f"Tarefa não registrada: {job}")
+        if inspect.iscoroutinefunction(fn):
+            await fn(**payload)
+        else:
+            await asyncio.to_thread(fn, **payload)
+
+    async def _worker(self):
+        while True:
+            job, payload, attempts = await self._queue.get()
+            try:
+                await self._execute(job, payload)
+                self._count("completed")
+            except asyncio.CancelledError:
+                # Interrompida no shutdown: volta para o disco (entrega ao menos uma vez)
+                self._spill(job, payload, attempts)
+                raise
+            except Exception as e:
+                attempts += 1
+                self._count("failed")
+                self.last_error = f"{job}: {e}"
+                if attempts < self.max_attempts and job in self._jobs:
+                    print(f"⚠️ Tarefa {job} falhou ({attempts}/{self.max_attempts}), nova tentativa: {e}")
+                    self._count("retried")
+                    try:
+                        await asyncio.sleep(self.retry_delay * attempts)
+                    except asyncio.CancelledError:
+                        # Shutdown durante o backoff: o except acima não vê este
+                        # cancelamento, então a tarefa volta para o disco aqui
+                        self._spill(job, payload, attempts)
+                        raise
+                    self._put_or_spill((job, payload, attempts))
+                else:
+                    print(f"❌ Tarefa {job} descartada após {attempts} tentativa(s): {e}")
+                    self._bury(job, payload, attempts, traceback.format_exc(limit=3))
+            finally:
+                self._queue.task_done()
+
+            if self._queue.empty():
+                self._restore_spilled()
+
+    async def start(self):
+        """Inicia os workers no loop atual e retoma tarefas do spillover"""
+        if self._running or not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        with self._lock:
+            self._connection()
+        self._running = True
+        restored = self._restore_spilled()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"🧵 Fila {self.name} iniciada ({self.workers} workers, {restored} tarefa(s) retomada(s) do disco)")
+
+    async def stop(self, timeout: float = 10.0):
+        """Espera a fila esvaziar (até timeout); o que sobrar vai para o disco"""
+        if not self._running:
+            return
+        self._running = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        pending = 0
+        while not self._queue.empty():
+            self._spill(*self._queue.get_nowait())
+            pending += 1
+        if pending:
+            print(f"💾 Fila {self.name}: {pending} tarefa(s) salva(s) em disco para o próximo start")
+
+    async def join(self):
+        """Espera todas as tarefas em memória terminarem (testes, scripts)"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade, spillover e falhas da fila"""
+        spilled_pending = self._spilled_count()
+        with self._lock:
+            dead_total = 0
+            if self._conn is not None:
+                dead_total = self._conn.execute(
+                    "SELECT COUNT(*) FROM dead_tasks WHERE queue = ?", (self.name,)
+                ).fetchone()[0]
+            return {
+                "name": self.name,
+                "running": self._running,
+                "workers": len(self._tasks),
+                "depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_size": self.max_size,
+                "spilled_pending": spilled_pending,
+                "dead_total": dead_total,
+                "last_error": self.last_error,
+                **self.counters
+            }
+
+
+# Instância global para facilitar importação
+task_queue = BackgroundTaskQueue()
@@ -1,10 +1,38 @@
+import asyncio
 import os
+import time
+import weakref
 import httpx
 import logging
 from typing import Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
+# Limite de caracteres de uma mensagem do Telegram
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Um AsyncClient por event loop: o streaming edita a mesma mensagem várias vezes
+# e cada cliente novo pagaria handshake TLS com api.telegram.org
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """httpx.AsyncClient de longa duração compartilhado pelas chamadas ao Telegram"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient()
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_http_client():
+    """Fecha o AsyncClient do loop atual (shutdown da aplicação)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
 class TelegramClient:
     def __init__(self):
         self.token = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -26,12 +54,45 @@ class TelegramClient:
         }
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=10.0)
-                response.raise_for_status()
-                return True
+            response = await get_async_http_client().post(url, json=payload, timeout=10.0)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao enviar mensagem Telegram: {e}")
+            return False
+
+    async def send_message_returning_id(self, chat_id: int, text: str, parse_mode: Optional[str] = None) -> Optional[int]:
+        """Envia mensagem e retorna o message_id (necessário para editá-la depois)"""
+        if not self.token:
+            return None
+        
+        url = f"{self.base_url}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text[:TELEGRAM_MAX_MESSAGE_LENGTH]}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        
+        try:
+            response = await get_async_http_client().post(url, json=payload, timeout=10.0)
+            response.raise_for_status()
+            return response.json().get("result", {}).get("message_id")
         except Exception as e:
             logger.error(f"❌ Erro ao enviar mensagem Telegram: {e}")
+            return None
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str) -> bool:
+        """Substitui o texto de uma mensagem já enviada (texto puro)"""
+        if not self.token:
+            return False
+        
+        url = f"{self.base_url}/editMessageText"
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text[:TELEGRAM_MAX_MESSAGE_LENGTH]}
+        
+        try:
+            response = await get_async_http_client().post(url, json=payload, timeout=10.0)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao editar mensagem Telegram: {e}")
             return False
 
     async def set_webhook(self, webhook_url: str, secret_token: str = None) -> bool:
@@ -54,3 +115,73 @@ class TelegramClient:
         except Exception as e:
             logger.error(f"❌ Erro ao configurar webhook: {e}")
             return False
+
+
+class TelegramStreamingReply:
+    """
+    Resposta do bot exibida enquanto é gerada
+
+    A primeira parte vira uma mensagem (sendMessage) e as seguintes a atualizam com
+    editMessageText, no máximo uma edição por intervalo (limite do Telegram por chat).
+    Usa texto puro: Markdown parcial quebraria o parse no meio da geração.
+
+    Configuração (.env):
+        TELEGRAM_STREAM_EDIT_INTERVAL_SECONDS: Intervalo mínimo entre edições (default: 1.0)
+        TELEGRAM_STREAM_MIN_FIRST_CHARS: Caracteres antes da primeira mensagem (default: 20)
+    """
+
+    def __init__(self, client: TelegramClient, chat_id: int, edit_interval: Optional[float] = None,
+                 min_first_chars: Optional[int] = None):
+        self.client = client
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval if edit_interval is not None else float(
+            os.getenv("TELEGRAM_STREAM_EDIT_INTERVAL_SECONDS", "1.0")
+        )
+        self.min_first_chars = min_first_chars if min_first_chars is not None else int(
+            os.getenv("TELEGRAM_STREAM_MIN_FIRST_CHARS", "20")
+        )
+        self.message_id: Optional[int] = None
+        self.finished = False
+        # Resposta final entregue (finish): se False, quem chamou envia de novo
+        self.delivered = False
+        self._send_failed = False
+        self._shown_text = ""
+        self._last_edit = 0.0
+
+    async def update(self, text: str):
+        """Recebe o texto gerado até agora e atualiza a mensagem se for a hora"""
+        if self.finished or self._send_failed or not text.strip():
+            return
+        if self.message_id is None:
+            if len(text) < self.min_first_chars:
+                return
+            self.message_id = await self.client.send_message_returning_id(self.chat_id, text)
+            if self.message_id is None:
+                # Sem message_id não há o que editar: a resposta sai inteira no finish
+                self._send_failed = True
+                return
+            self._shown_text = text
+            self._last_edit = time.monotonic()
+            return
+        if time.monotonic() - self._last_edit >= self.edit_interval and text != self._shown_text:
+            await self._edit(text)
+
+    async def finish(self, text: str) -> bool:
+        """Exibe o texto final (envia se nada foi mostrado ainda); retorna se foi entregue"""
+        if self.finished:
+            return self.delivered
+        self.finished = True
+        if self.message_id is None:
+            self.delivered = await self.client.send_message(self.chat_id, text)
+        elif text != self._shown_text:
+            self.delivered = await self._edit(text)
+        else:
+            self.delivered = True
+        return self.delivered
+
+    async def _edit(self, text: str) -> bool:
+        self._last_edit = time.monotonic()
+        ok = await self.client.edit_message_text(self.chat_id, self.message_id, text)
+        if ok:
+            self._shown_text = text
+        return ok
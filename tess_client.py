@@ -1,13 +1,69 @@
+import asyncio
+import json
 import requests
 import os
+import time
+import weakref
+import httpx
 from dotenv import load_dotenv
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from deadline import DeadlineExceeded, budget_nearly_spent, budget_timeout
+
 load_dotenv()
 
+# Texto devolvido quando a Tess falha (mantido para compatibilidade dos agentes)
+FALLBACK_TEXT = "Olá! Como posso ajudar você hoje?"
+
+# Circuito compartilhado por todas as chamadas à Tess do processo
+tess_breaker = CircuitBreaker(
+    name="tess",
+    failure_threshold=int(os.getenv("TESS_BREAKER_FAILURE_THRESHOLD", "3")),
+    reset_timeout=float(os.getenv("TESS_BREAKER_RESET_SECONDS", "30")),
+    slow_call_seconds=float(os.getenv("TESS_BREAKER_SLOW_CALL_SECONDS", "10"))
+)
+
+
+class TessUnavailableError(Exception):
+    """Falha na chamada à Tess (erro HTTP, timeout ou resposta inválida)"""
+
+# Um AsyncClient por event loop: conexões httpx ficam presas ao loop que as criou
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    httpx.AsyncClient de longa duração compartilhado pelas chamadas async à Tess
+    
+    Configuração (.env):
+        TESS_MAX_CONNECTIONS: Conexões simultâneas (default: 100)
+        TESS_MAX_KEEPALIVE_CONNECTIONS: Conexões ociosas mantidas (default: 20)
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("TESS_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("TESS_MAX_KEEPALIVE_CONNECTIONS", "20"))
+            )
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_http_client():
+    """Fecha o AsyncClient do loop atual (shutdown da aplicação)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
 class TessClient:
     def __init__(self):
         self.api_key = os.getenv("TESS_API_KEY")
         self.base_url = "https://tess.pareto.io/api"
+        self.timeout = float(os.getenv("TESS_TIMEOUT_SECONDS", "30"))
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -52,24 +108,9 @@ class TessClient:
             return None
     
     
-    def generate(self, prompt, max_tokens=300, temperature=0.7, agent_id=None, system_prompt=None):
-        """
-        Gera texto usando a API da Tess AI
-        Método compatível com LangChain TessLLM wrapper
-        
-        Usa o endpoint OpenAI-compatible com formato correto para agentes workspace:
-        https://docs.tess.im/api/endpoints/agents/execute_openai_compatible/
-        
-        Args:
-            prompt: Texto de entrada para geração
-            max_tokens: Número máximo de tokens na resposta (não usado no formato atual)
-            temperature: Temperatura para geração (0.0 a 1.0) (não usado no formato atual)
-            agent_id: ID do agente a usar (opcional, usa agente padrão se não especificado)
-            system_prompt: Prompt do sistema (opcional)
-            
-        Returns:
-            Texto gerado pela API
-        """
+    def _build_chat_request(self, prompt, max_tokens=300, temperature=0.7, agent_id=None,
+                            system_prompt=None, stream=False):
+        """Monta URL e payload do endpoint OpenAI-compatible (compartilhado entre sync e async)"""
         # Usar agente padrão se não especificado
         if not agent_id:
             agent_id = os.getenv("TESS_DEFAULT_AGENT_ID", "39004")  # Agente de sentimento
@@ -90,41 +131,240 @@ class TessClient:
         payload = {
             "messages": messages,
             "tools": "no-tools",  # STRING obrigatória
-            "stream": False,
+            "stream": stream,
             "temperature": safe_temp,
             "max_tokens": max_tokens
         }
+        return url, payload
+    
+    @staticmethod
+    def _extract_content(result):
+        """Extrai o texto da resposta (formato OpenAI: choices[0].message.content)"""
+        if isinstance(result, dict) and 'choices' in result:
+            if len(result['choices']) > 0:
+                content = result['choices'][0].get('message', {}).get('content', '')
+                if content:
+                    return str(content).strip()
+        
+        # Fallback se não conseguir extrair content
+        return str(result)
+    
+    @staticmethod
+    def _log_error(e, status_code=None, body=None):
+        """Log detalhado para debug em produção (stdout → logs Vercel)"""
+        print(f"Erro ao gerar texto com Tess AI: {e}")
+        if status_code is not None:
+            print(f"Status Code: {status_code}")
+            print(f"Response Body: {(body or '')[:500]}")
+    
+    def _before_call(self, raise_on_error):
+        """
+        Consulta o deadline da requisição e o circuit breaker antes de chamar a Tess
+        
+        Returns:
+            None se a chamada pode seguir; FALLBACK_TEXT se o orçamento de tempo
+            acabou ou o circuito está aberto
+        """
+        if budget_nearly_spent():
+            print("⏱️ Orçamento de tempo da requisição quase esgotado, pulando chamada à Tess")
+            if raise_on_error:
+                raise DeadlineExceeded("Orçamento de tempo esgotado antes da chamada à Tess")
+            return FALLBACK_TEXT
+        if tess_breaker.allow_request():
+            return None
+        if raise_on_error:
+            raise CircuitOpenError("Circuito da Tess aberto")
+        return FALLBACK_TEXT
+    
+    def _on_failure(self, error, raise_on_error):
+        """Registra a falha no breaker e propaga ou devolve o fallback"""
+        tess_breaker.record_failure()
+        if raise_on_error:
+            raise TessUnavailableError(str(error)) from error
+        return FALLBACK_TEXT
+    
+    def generate(self, prompt, max_tokens=300, temperature=0.7, agent_id=None, system_prompt=None,
+                 raise_on_error=False):
+        """
+        Gera texto usando a API da Tess AI
+        Método compatível com LangChain TessLLM wrapper
+        
+        Usa o endpoint OpenAI-compatible com formato correto para agentes workspace:
+        https://docs.tess.im/api/endpoints/agents/execute_openai_compatible/
+        
+        Args:
+            prompt: Texto de entrada para geração
+            max_tokens: Número máximo de tokens na resposta (não usado no formato atual)
+            temperature: Temperatura para geração (0.0 a 1.0) (não usado no formato atual)
+            agent_id: ID do agente a usar (opcional, usa agente padrão se não especificado)
+            system_prompt: Prompt do sistema (opcional)
+            raise_on_error: Em falha (ou circuito aberto) levanta TessUnavailableError /
+                CircuitOpenError em vez de devolver FALLBACK_TEXT, para o chamador usar
+                o próprio fallback
+            
+        Returns:
+            Texto gerado pela API
+        """
+        fallback = self._before_call(raise_on_error)
+        if fallback is not None:
+            return fallback
+        
+        url, payload = self._build_chat_request(prompt, max_tokens, temperature, agent_id, system_prompt)
+        start = time.monotonic()
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = requests.post(url, headers=self.headers, json=payload, timeout=budget_timeout(self.timeout))
             response.raise_for_status()
-            result = response.json()
-            
-            # Extrair texto da resposta (formato OpenAI)
-            # Resposta contém: choices[0].message.content
-            if isinstance(result, dict) and 'choices' in result:
-                if len(result['choices']) > 0:
-                    content = result['choices'][0].get('message', {}).get('content', '')
-                    if content:
-                        return str(content).strip()
-            
-            # Fallback se não conseguir extrair content
-            return str(result)
+            content = self._extract_content(response.json())
             
-        except requests.exceptions.RequestException as e:
-            # Log detalhado para debug em produção
-            error_msg = f"Erro ao gerar texto com Tess AI: {e}"
-            print(error_msg)  # Stdout (logs Vercel)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            response = getattr(e, 'response', None)
+            if response is not None:
+                self._log_error(e, response.status_code, response.text)
+            else:
+                self._log_error(e)
             
-            # Se tiver resposta HTTP, logar detalhes
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Status Code: {e.response.status_code}")
-                print(f"Response Body: {e.response.text[:500]}")
+            return self._on_failure(e, raise_on_error)
+        except BaseException:
+            # Interrompida sem resultado: libera a vaga de teste do breaker
+            tess_breaker.release()
+            raise
+        
+        tess_breaker.record_success(time.monotonic() - start)
+        return content
+    
+    async def agenerate(self, prompt, max_tokens=300, temperature=0.7, agent_id=None, system_prompt=None,
+                        raise_on_error=False):
+        """
+        Versão async de generate, sobre o httpx.AsyncClient compartilhado
+        
+        Não bloqueia o event loop: um único worker mantém várias chamadas à Tess
+        em andamento. Mesmos argumentos e retorno de generate.
+        """
+        fallback = self._before_call(raise_on_error)
+        if fallback is not None:
+            return fallback
+        
+        url, payload = self._build_chat_request(prompt, max_tokens, temperature, agent_id, system_prompt)
+        start = time.monotonic()
+        
+        try:
+            # O timeout do httpx vale por operação; wait_for limita a chamada inteira
+            timeout = budget_timeout(self.timeout)
+            response = await asyncio.wait_for(
+                get_async_http_client().post(url, headers=self.headers, json=payload, timeout=timeout),
+                timeout=timeout
+            )
+            response.raise_for_status()
+            content = self._extract_content(response.json())
             
-            # Fallback: retornar mensagem padrão
-            return f"Olá! Como posso ajudar você hoje?"
-
-
+        except asyncio.TimeoutError as e:
+            self._log_error(f"Timeout após {timeout:.1f}s")
+            return self._on_failure(e, raise_on_error)
+        except httpx.HTTPStatusError as e:
+            self._log_error(e, e.response.status_code, e.response.text)
+            return self._on_failure(e, raise_on_error)
+        except (httpx.HTTPError, ValueError) as e:
+            self._log_error(e)
+            return self._on_failure(e, raise_on_error)
+        except BaseException:
+            # Cancelada (ex: asyncio.CancelledError): libera a vaga de teste do breaker
+            tess_breaker.release()
+            raise
+        
+        tess_breaker.record_success(time.monotonic() - start)
+        return content
+    
+    async def astream(self, prompt, max_tokens=300, temperature=0.7, agent_id=None, system_prompt=None,
+                      raise_on_error=False):
+        """
+        Gera texto em streaming (SSE do endpoint OpenAI-compatible)
+        
+        Async iterator de trechos de texto na ordem em que chegam, para exibir a
+        resposta a partir do primeiro token. Em erro antes do primeiro trecho,
+        emite FALLBACK_TEXT (mesmo comportamento de generate); depois dele, encerra.
+        Com raise_on_error, levanta a exceção em qualquer ponto.
+        
+        Como em agenerate, o stream inteiro (não só cada leitura) termina dentro
+        de budget_timeout.
+        """
+        fallback = self._before_call(raise_on_error)
+        if fallback is not None:
+            yield fallback
+            return
+        
+        url, payload = self._build_chat_request(prompt, max_tokens, temperature, agent_id, system_prompt, stream=True)
+        start = time.monotonic()
+        emitted = False
+        # O timeout do httpx vale por leitura; expires_at limita o stream inteiro
+        timeout = budget_timeout(self.timeout)
+        expires_at = start + timeout
+        
+        try:
+            async with get_async_http_client().stream("POST", url, headers=self.headers, json=payload,
+                                                      timeout=timeout) as response:
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode(errors="replace")
+                    self._log_error(f"HTTP {response.status_code}", response.status_code, body)
+                    yield self._on_failure(f"HTTP {response.status_code}", raise_on_error)
+                    return
+                
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(),
+                                                      timeout=max(0.0, expires_at - time.monotonic()))
+                    except StopAsyncIteration:
+                        break
+                    chunk = self._parse_sse_line(line)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        emitted = True
+                        yield chunk
+        
+        except asyncio.TimeoutError as e:
+            self._log_error(f"Stream excedeu {timeout:.1f}s")
+            fallback = self._on_failure(e, raise_on_error)
+            if not emitted:
+                yield fallback
+            return
+        except httpx.HTTPError as e:
+            self._log_error(e)
+            fallback = self._on_failure(e, raise_on_error)
+            if not emitted:
+                yield fallback
+            return
+        except BaseException:
+            # Cancelada ou consumidor parou de ler (GeneratorExit): libera a vaga de teste
+            tess_breaker.release()
+            raise
+        
+        tess_breaker.record_success(time.monotonic() - start)
+    
+    @staticmethod
+    def _parse_sse_line(line):
+        """
+        Extrai o texto de uma linha SSE ("data: {...}")
+        
+        Returns:
+            Trecho de texto ("" se a linha não traz conteúdo) ou None no fim do stream
+        """
+        line = line.strip()
+        if not line.startswith("data:"):
+            return ""
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return ""
+        choices = event.get("choices") if isinstance(event, dict) else None
+        if not choices:
+            return ""
+        delta = choices[0].get("delta") or choices[0].get("message") or {}
+        return delta.get("content") or ""
 
 if __name__ == "__main__":
     print("🤖 Testando conexão com Tess AI...")
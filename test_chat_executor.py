@@ -0,0 +1,88 @@
+"""
+Teste offline da execução ordenada por chat (ChatExecutor)
+"""
+
+import asyncio
+
+import pytest
+
+from chat_executor import ChatExecutor, MailboxFull
+
+
+def test_same_chat_runs_in_order_other_chats_in_parallel():
+    executor = ChatExecutor(mailbox_size=10)
+    eventos = []
+    outros = set("BCDE")
+
+    async def handler(chat, n, outros_rodando):
+        eventos.append(("inicio", chat, n))
+        if chat == "A" and n == 0:
+            # Só termina quando os outros chats começaram: se o executor
+            # serializasse chats diferentes, o wait_for estouraria
+            await asyncio.wait_for(outros_rodando.wait(), 5)
+        elif chat in outros and outros <= {c for _, c, _ in eventos}:
+            outros_rodando.set()
+        await asyncio.sleep(0)
+        eventos.append(("fim", chat, n))
+        return n
+
+    async def run():
+        outros_rodando = asyncio.Event()
+        return await asyncio.gather(
+            *[executor.run("A", handler, "A", n, outros_rodando) for n in range(3)],
+            *[executor.run(chat, handler, chat, 0, outros_rodando) for chat in "BCDE"]
+        )
+
+    resultados = asyncio.run(run())
+
+    assert resultados == [0, 1, 2, 0, 0, 0, 0]
+    do_a = [(tipo, n) for tipo, chat, n in eventos if chat == "A"]
+    assert do_a == [("inicio", 0), ("fim", 0), ("inicio", 1), ("fim", 1), ("inicio", 2), ("fim", 2)]
+    # Chat A em série; os outros chats começam enquanto A ainda está na primeira mensagem
+    fim_a0 = eventos.index(("fim", "A", 0))
+    assert all(eventos.index(("inicio", chat, 0)) < fim_a0 for chat in outros)
+    assert executor.stats()["active_chats"] == 0
+    assert executor.stats()["processed"] == 7
+
+
+def test_full_mailbox_rejects():
+    executor = ChatExecutor(mailbox_size=2)
+
+    async def lento():
+        await asyncio.sleep(0.1)
+
+    async def run():
+        tarefas = [asyncio.create_task(executor.run("A", lento)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.depth("A") == 2
+        with pytest.raises(MailboxFull):
+            await executor.run("A", lento)
+        await executor.run("B", lento)
+        await asyncio.gather(*tarefas)
+
+    asyncio.run(run())
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["max_depth_seen"] == 2
+
+
+def test_failure_releases_chat():
+    executor = ChatExecutor()
+
+    async def quebra():
+        raise RuntimeError("erro")
+
+    async def ok():
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await executor.run("A", quebra)
+        return await executor.run("A", ok)
+
+    assert asyncio.run(run()) == "ok"
+    assert executor.stats()["failed"] == 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,148 @@
+"""
+Teste offline do circuit breaker e do fallback rápido da Tess
+"""
+
+import asyncio
+import time
+
+import httpx
+
+import tess_client as tess_module
+from agents.empathetic_response import EmpatheticResponseGenerator
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from tess_client import FALLBACK_TEXT, TessClient
+
+
+def test_opens_after_consecutive_failures_and_recovers():
+    breaker = CircuitBreaker("teste", failure_threshold=2, reset_timeout=0.05)
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()      # só uma chamada de teste
+
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["trips"] == 1
+
+
+def test_half_open_failure_reopens():
+    breaker = CircuitBreaker("teste", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("teste", failure_threshold=2, slow_call_seconds=1.0)
+    breaker.record_success(5.0)
+    breaker.record_success(5.0)
+
+    assert breaker.state == OPEN
+    assert breaker.stats()["slow_calls"] == 2
+
+
+def test_open_circuit_skips_network(install_tess_mock):
+    chamadas = []
+
+    async def handler(request):
+        chamadas.append(request)
+        return httpx.Response(503, text="indisponível")
+
+    async def run():
+        install_tess_mock(handler)
+        client = TessClient()
+        respostas = [await client.agenerate("oi") for _ in range(5)]
+        try:
+            await client.agenerate("oi", raise_on_error=True)
+        except CircuitOpenError:
+            respostas.append("circuito aberto")
+        return respostas
+
+    respostas = asyncio.run(run())
+    tess_module.tess_breaker.reset()
+
+    threshold = tess_module.tess_breaker.failure_threshold
+    assert respostas == [FALLBACK_TEXT] * 5 + ["circuito aberto"]
+    assert len(chamadas) == threshold
+
+
+def test_agent_uses_local_fallback_when_circuit_open():
+    tess_module.tess_breaker.reset()
+    for _ in range(tess_module.tess_breaker.failure_threshold):
+        tess_module.tess_breaker.record_failure()
+
+    generator = EmpatheticResponseGenerator()
+    generator.llm.response_cache = None
+    resposta = generator.generate_response(3, "o atendimento demorou muito")
+    tess_module.tess_breaker.reset()
+
+    assert resposta != FALLBACK_TEXT
+    assert "atendimento" in resposta
+
+
+def _half_open_breaker():
+    breaker = tess_module.tess_breaker
+    breaker.reset()
+    original_timeout = breaker.reset_timeout
+    breaker.reset_timeout = 0.01
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    return breaker, original_timeout
+
+
+def test_cancelled_half_open_probe_releases_slot(install_tess_mock):
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "oi"}}]})
+
+    async def run():
+        install_tess_mock(slow, reset_breaker=False)
+        probe = asyncio.create_task(TessClient().agenerate("oi"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    breaker, original_timeout = _half_open_breaker()
+    try:
+        asyncio.run(run())
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request()      # vaga de teste devolvida
+    finally:
+        breaker.reset_timeout = original_timeout
+        breaker.reset()
+
+
+def test_abandoned_stream_probe_releases_slot(install_tess_mock):
+    async def handler(request):
+        return httpx.Response(200, text='data: {"choices": [{"delta": {"content": "Olá"}}]}\n\n')
+
+    async def run():
+        install_tess_mock(handler, reset_breaker=False)
+        stream = TessClient().astream("oi")
+        assert await stream.__anext__() == "Olá"
+        await stream.aclose()
+
+    breaker, original_timeout = _half_open_breaker()
+    try:
+        asyncio.run(run())
+        assert breaker.allow_request()
+    finally:
+        breaker.reset_timeout = original_timeout
+        breaker.reset()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
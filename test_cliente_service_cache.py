@@ -0,0 +1,98 @@
+"""
+Teste offline do cache de clientes por email (LRU + TTL + cache negativo)
+"""
+
+import time
+
+from conftest import FakeResponse
+from services.cliente_service import ClienteService
+
+
+def _service(monkeypatch, respostas):
+    """ClienteService com sessão fake; respostas: email -> payload (ou status de erro)"""
+    service = ClienteService()
+    chamadas = []
+
+    def fake_post(url, json=None, headers=None, timeout=None):
+        email = json["filterGroups"][0]["filters"][0]["value"]
+        chamadas.append(email)
+        resposta = respostas.get(email, {"results": []})
+        if isinstance(resposta, int):
+            return FakeResponse({}, status_code=resposta)
+        return FakeResponse(resposta)
+
+    monkeypatch.setattr(service, "session", type("S", (), {"post": staticmethod(fake_post)})())
+    return service, chamadas
+
+
+def test_found_client_is_cached(monkeypatch):
+    service, chamadas = _service(monkeypatch, {"ana@exemplo.com": {"results": [{"id": "101"}]}})
+
+    assert service.buscar_por_email("ana@exemplo.com") == {"id": "101"}
+    assert service.buscar_por_email("ana@exemplo.com") == {"id": "101"}
+    assert chamadas == ["ana@exemplo.com"]
+
+
+def test_not_found_is_negatively_cached_until_ttl(monkeypatch):
+    service, chamadas = _service(monkeypatch, {})
+    service.negative_ttl = 0.05
+
+    assert service.buscar_por_email("desconhecido@exemplo.com") is None
+    assert service.buscar_por_email("desconhecido@exemplo.com") is None
+    assert chamadas == ["desconhecido@exemplo.com"]
+
+    time.sleep(0.1)
+    service.buscar_por_email("desconhecido@exemplo.com")
+    assert len(chamadas) == 2
+
+
+def test_errors_are_not_cached(monkeypatch):
+    service, chamadas = _service(monkeypatch, {"erro@exemplo.com": 500})
+
+    assert service.buscar_por_email("erro@exemplo.com") is None
+    assert service.buscar_por_email("erro@exemplo.com") is None
+    assert len(chamadas) == 2
+
+
+def test_cache_is_bounded(monkeypatch):
+    service, _ = _service(monkeypatch, {})
+    service.cache.max_size = 10
+
+    for i in range(100):
+        service.buscar_por_email(f"user{i}@exemplo.com")
+
+    assert len(service.cache) == 10
+    assert service.cache.stats()["evictions"] == 90
+
+
+def test_context_paging_goes_through_hubspot_client():
+    """coletar_contexto pagina pelo iter_search (cursor after e projeção de propriedades)"""
+    service = ClienteService()
+    service.max_resultados = 150
+    payloads = []
+
+    def fake_post(url, json=None, **kwargs):
+        payloads.append((url, json))
+        if "/deals/search" not in url:
+            return FakeResponse({"results": []})
+        inicio = int(json.get("after", 0))
+        fim = inicio + json["limit"]
+        return FakeResponse({
+            "results": [{"id": f"d{i}", "properties": {"amount": "1"}} for i in range(inicio, fim)],
+            "paging": {"next": {"after": str(fim)}}
+        })
+
+    service.hubspot.session = type("S", (), {"post": staticmethod(fake_post)})()
+
+    contexto = service.coletar_contexto("101")
+
+    paginas = [payload for url, payload in payloads if "/deals/search" in url]
+    assert contexto["metricas"]["num_deals"] == 150
+    assert [payload["limit"] for payload in paginas] == [100, 50]
+    assert paginas[1]["after"] == "100"
+    assert all(payload["properties"] for _, payload in payloads)
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
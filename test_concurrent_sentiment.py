@@ -0,0 +1,140 @@
+"""
+Teste offline do modo concorrente: resposta empática e análise de sentimento
+em paralelo (caminho crítico de uma chamada ao LLM)
+"""
+
+import asyncio
+
+from chat_executor import chat_executor
+from conversation_manager import ConversationManager, ConversationState
+
+
+class FakeSentiment:
+    """Análise que só termina quando o teste libera (release)"""
+
+    def __init__(self, events):
+        self.events = events
+        self.release = asyncio.Event()
+
+    async def aanalyze(self, context):
+        self.events.append("sentiment_start")
+        await self.release.wait()
+        self.events.append("sentiment_done")
+        return {"sentimento_geral": "NEUTRO", "risco_churn": "MEDIO"}
+
+
+class FakeEmpathetic:
+    def __init__(self, events=None):
+        self.events = events if events is not None else []
+        self.sentimentos = []
+
+    async def agenerate_response(self, score, feedback_text, conversation_history, sentiment, cliente_dados):
+        self.events.append("reply")
+        self.sentimentos.append(sentiment)
+        return "Sinto muito pela experiência."
+
+
+class FakeEvaluator:
+    async def aevaluate(self, **kwargs):
+        return {"classificacao": {"categoria": "DETRATOR"}}
+
+
+def _manager():
+    events = []
+    manager = ConversationManager()
+    manager.combined_llm_call = False
+    manager.concurrent_sentiment = True
+    manager.sentiment_analyzer = FakeSentiment(events)
+    manager.empathetic_generator = FakeEmpathetic(events)
+    manager.response_evaluator = FakeEvaluator()
+    return manager, events
+
+
+def test_reply_does_not_wait_for_sentiment():
+    manager, events = _manager()
+
+    async def run():
+        manager.get_session("42").state = ConversationState.WAITING_SCORE
+        manager.save_session("42")
+        # Se a resposta esperasse a análise, o timeout estouraria (análise presa)
+        resposta = await asyncio.wait_for(manager.process_message("42", "nota 5, atendimento lento"), 5)
+        sentimento_na_resposta = manager.get_session("42").sentiment
+        manager.sentiment_analyzer.release.set()
+        await asyncio.gather(*manager._background_tasks)
+        return resposta, sentimento_na_resposta
+
+    resposta, sentimento_na_resposta = asyncio.run(run())
+
+    assert resposta == "Sinto muito pela experiência."
+    assert events[-1] == "sentiment_done" and "reply" in events
+    assert manager.empathetic_generator.sentimentos[0]["sentimento_geral"] == "NEGATIVO"
+    assert sentimento_na_resposta == "NEGATIVO"
+    assert manager.get_session("42").sentiment == "NEUTRO"
+
+
+def test_sequential_mode_waits_for_both():
+    manager, events = _manager()
+    manager.concurrent_sentiment = False
+    manager.sentiment_analyzer.release.set()
+
+    async def run():
+        manager.get_session("43").state = ConversationState.WAITING_SCORE
+        manager.save_session("43")
+        await manager.process_message("43", "nota 9")
+
+    asyncio.run(run())
+
+    # Resposta gerada só depois da análise, já com o sentimento dela
+    assert events == ["sentiment_start", "sentiment_done", "reply"]
+    assert manager.empathetic_generator.sentimentos[0]["sentimento_geral"] == "NEUTRO"
+
+
+class FastSentiment:
+    """Análise que termina antes da resposta empática (ex: cache de respostas)"""
+
+    def __init__(self):
+        self.done = asyncio.Event()
+
+    async def aanalyze(self, context):
+        self.done.set()
+        return {"sentimento_geral": "NEUTRO"}
+
+
+class SlowEmpathetic(FakeEmpathetic):
+    def __init__(self, sentiment):
+        super().__init__()
+        self.sentiment = sentiment
+
+    async def agenerate_response(self, score, feedback_text, conversation_history, sentiment, cliente_dados):
+        await self.sentiment.done.wait()
+        # Dá ao sentimento a chance de ser gravado no meio da mensagem
+        for _ in range(20):
+            await asyncio.sleep(0)
+        return "Sinto muito pela experiência."
+
+
+def test_sentiment_finishing_first_keeps_score_and_history():
+    manager, _ = _manager()
+    manager.sentiment_analyzer = FastSentiment()
+    manager.empathetic_generator = SlowEmpathetic(manager.sentiment_analyzer)
+
+    async def run(chat_id):
+        manager.get_session(chat_id).state = ConversationState.WAITING_SCORE
+        manager.save_session(chat_id)
+        # Como no webhook: mensagens do chat passam pelo chat_executor
+        await chat_executor.run(chat_id, manager.process_message, chat_id, "nota 5, atendimento lento")
+        await asyncio.gather(*manager._background_tasks)
+
+    asyncio.run(run("44"))
+
+    # Outro worker (sem cache) vê o que foi gravado no store
+    session = ConversationManager(session_store=manager.session_store).load_session("44")
+    assert session.state == ConversationState.COMPLETED
+    assert session.nps_score == 5
+    assert session.sentiment == "NEUTRO"
+    assert [m["sender"] for m in session.messages_history] == ["user", "bot"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
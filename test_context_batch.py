@@ -0,0 +1,58 @@
+"""
+Teste offline da coleta de contexto em lote (collect_many / get_contexts_batch)
+Usa o FakeHubSpot do conftest (batch read, associações em lote e busca com IN)
+"""
+
+from agents.context_collector import ContextCollectorAgent
+from hubspot_client import HubSpotClient
+
+
+def test_batch_contexts_split_per_contact(fake_hubspot):
+    chamadas = fake_hubspot().chamadas
+    client = HubSpotClient(use_mirror=False)
+    ids = [str(i) for i in range(1, 301)]
+
+    contexts = client.get_contexts_batch(ids)
+
+    assert set(contexts) == set(ids)
+    assert contexts["42"]["contact"]["properties"]["firstname"] == "Cliente 42"
+    assert [deal["id"] for deal in contexts["42"]["deals"]] == ["d42"]
+    assert contexts["42"]["consolidated_value"] == 42.0
+    assert contexts["42"]["line_items"] == [{"toObjectId": "li-d42"}]
+    assert len(contexts["42"]["risks"]) == 1
+    assert contexts["42"]["errors"] == []
+
+    # 4 associações + 3 batch reads de contatos + 3 buscas IN de deals e de tickets + 1 line items
+    assert len(chamadas) == 14
+
+
+def test_collect_many_uses_cache(fake_hubspot):
+    chamadas = fake_hubspot().chamadas
+    collector = ContextCollectorAgent()
+    collector.hubspot = HubSpotClient(use_mirror=False)
+    collector.hubspot_bulk = HubSpotClient(use_mirror=False)
+
+    first = collector.collect_many(["1", "2", "3"])
+    assert first["2"]["metricas"]["valor_total"] == 2.0
+    total = len(chamadas)
+
+    second = collector.collect_many(["3", "2", "1"])
+    assert list(second) == ["3", "2", "1"]
+    assert second["1"] is first["1"]
+    assert len(chamadas) == total
+    assert collector.collect("1") is first["1"]
+
+
+def test_batch_falls_back_per_contact(fake_hubspot):
+    fake_hubspot(batch_disponivel=False)
+    client = HubSpotClient(use_mirror=False)
+
+    contexts = client.get_contexts_batch(["7", "8"])
+
+    assert contexts["7"]["deals"][0]["id"] == "d7"
+    assert contexts["8"]["consolidated_value"] == 8.0
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
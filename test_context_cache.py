@@ -0,0 +1,97 @@
+"""
+Teste offline do cache TTL + LRU de contexto de contatos
+"""
+
+import time
+
+from ttl_cache import TTLCache
+from agents.context_collector import ContextCollectorAgent
+
+
+def test_ttl_cache_lru_eviction_and_metrics():
+    """Entrada menos usada recentemente sai primeiro; hits/misses contabilizados"""
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" vira a mais recente
+    cache.set("c", 3)           # despeja "b"
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["size"] == 2
+
+
+def test_ttl_cache_expiration():
+    """Entradas expiram após o TTL (padrão ou por entrada)"""
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set("curta", "x", ttl=0.05)
+    cache.set("longa", "y")
+    time.sleep(0.1)
+
+    assert cache.get("curta") is None
+    assert cache.get("longa") == "y"
+    assert cache.stats()["expirations"] == 1
+
+
+class FakeHubSpot:
+    def __init__(self):
+        self.calls = 0
+
+    def get_contact_context(self, contact_id, days_back=30):
+        self.calls += 1
+        return {
+            "contact_id": contact_id,
+            "contact": {"id": contact_id, "properties": {"firstname": "Ana"}},
+            "deals": [{"id": "d1", "properties": {"amount": "10"}}],
+            "tickets": [], "emails": [], "notes": [], "line_items": [],
+            "consolidated_value": 10.0, "risks": []
+        }
+
+
+def _collector():
+    collector = ContextCollectorAgent()
+    collector.hubspot = FakeHubSpot()
+    return collector
+
+
+def test_collect_is_served_from_cache():
+    """Chamadas repetidas para o mesmo (contact_id, days_back) não vão ao CRM"""
+    collector = _collector()
+
+    first = collector.collect("101")
+    second = collector.collect("101")
+    collector.collect("101", days_back=90)
+
+    assert second is first
+    assert collector.hubspot.calls == 2
+    assert collector.cache.stats()["hits"] == 1
+
+
+def test_invalidation_by_contact_and_webhook_events():
+    """Invalidação explícita e por eventos de webhook do CRM"""
+    collector = _collector()
+    collector.collect("101")
+    collector.collect("101", days_back=90)
+    collector.collect("102")
+
+    assert collector.invalidate("101") == 2
+    assert len(collector.cache) == 1
+
+    # Alteração em um deal invalida os contextos que o contêm
+    removed = collector.handle_crm_events([
+        {"subscriptionType": "deal.propertyChange", "objectId": "d1"}
+    ])
+    assert removed == 1
+    assert len(collector.cache) == 0
+
+    collector.collect("103")
+    assert collector.handle_crm_events([{"subscriptionType": "contact.propertyChange", "objectId": 103}]) == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
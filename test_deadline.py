@@ -0,0 +1,96 @@
+"""
+Teste offline do orçamento de latência (deadline) e sua propagação
+"""
+
+import asyncio
+import time
+
+import httpx
+
+import tess_client as tess_module
+from conversation_manager import ConversationManager
+from deadline import budget_nearly_spent, budget_timeout, current_deadline, deadline_scope, stage_scope
+from tess_client import FALLBACK_TEXT, TessClient
+
+
+def test_scope_sizes_timeouts_and_resets():
+    assert current_deadline() is None
+    assert budget_timeout(30) == 30
+
+    with deadline_scope(2.0):
+        assert budget_timeout(30) <= 2.0
+        assert budget_timeout(0.5) == 0.5
+        with stage_scope(1.5):
+            assert budget_timeout(30) <= 0.5
+        assert budget_timeout(30) > 1.5
+
+    with deadline_scope(0.0):
+        # Orçamento esgotado: timeout positivo (requests recusa zero)
+        assert budget_timeout(30) > 0
+
+    assert current_deadline() is None
+
+
+def test_deadline_follows_to_thread():
+    async def run():
+        with deadline_scope(5.0):
+            return await asyncio.to_thread(budget_timeout, 30)
+
+    assert asyncio.run(run()) <= 5.0
+
+
+def test_tess_skipped_when_budget_spent():
+    chamadas = []
+
+    async def handler(request):
+        chamadas.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "oi"}}]})
+
+    async def run():
+        tess_module.tess_breaker.reset()
+        tess_module._async_clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        )
+        with deadline_scope(0.1):
+            assert budget_nearly_spent()
+            return await TessClient().agenerate("oi")
+
+    assert asyncio.run(run()) == FALLBACK_TEXT
+    assert chamadas == []
+
+
+def test_slow_tess_is_cut_at_deadline():
+    async def lento(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "tarde"}}]})
+
+    async def run():
+        tess_module.tess_breaker.reset()
+        tess_module._async_clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            transport=httpx.MockTransport(lento)
+        )
+        inicio = time.monotonic()
+        with deadline_scope(1.5):
+            resposta = await TessClient().agenerate("oi")
+        return resposta, time.monotonic() - inicio
+
+    resposta, duracao = asyncio.run(run())
+    tess_module.tess_breaker.reset()
+
+    assert resposta == FALLBACK_TEXT
+    assert duracao < 2.5
+
+
+def test_sentiment_stage_falls_back_to_score():
+    manager = ConversationManager.__new__(ConversationManager)
+
+    async def run():
+        with deadline_scope(0.2):
+            return await manager._analyze_sentiment("1", "horrível", 2)
+
+    assert asyncio.run(run())["sentimento_geral"] == "NEGATIVO"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,70 @@
+"""
+Teste offline do pool HTTP compartilhado
+Sobe um servidor HTTP/1.1 local e verifica reaproveitamento de conexões e estatísticas
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_pool import HTTPPool
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    conexoes = set()
+
+    def do_GET(self):
+        _KeepAliveHandler.conexoes.add(self.client_address)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_connections_are_reused(monkeypatch):
+    """Chamadas sequenciais reaproveitam a mesma conexão keep-alive"""
+    server = _start_server()
+    _KeepAliveHandler.conexoes = set()
+    pool = HTTPPool()
+    url = f"http://127.0.0.1:{server.server_address[1]}/ping"
+
+    try:
+        for _ in range(5):
+            assert pool.session.get(url, timeout=5).json() == {"ok": True}
+
+        assert len(_KeepAliveHandler.conexoes) == 1
+        stats = pool.stats()
+        assert stats["requests_total"] == 5
+        assert stats["in_use"] == 0
+        assert stats["idle"] == 1
+        assert stats["waits"] == 0
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_per_host_limits(monkeypatch):
+    """HTTP_POOL_HOST_LIMITS monta um adapter dedicado com o tamanho configurado"""
+    monkeypatch.setenv("HTTP_POOL_HOST_LIMITS", "api.hubapi.com=30, invalido, localhost:4010=5")
+    pool = HTTPPool()
+
+    assert pool.host_limits == {"api.hubapi.com": 30, "localhost:4010": 5}
+    adapter = pool.session.get_adapter("https://api.hubapi.com/crm/v3/objects/deals/search")
+    assert adapter is pool.adapters["api.hubapi.com"]
+    assert pool.stats()["adapters"]["localhost:4010"]["pool_maxsize"] == 5
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
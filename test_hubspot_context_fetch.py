@@ -0,0 +1,164 @@
+"""
+Teste offline da coleta de contexto do HubSpotClient (fan-out paralelo e batch)
+Simula o HubSpot com respostas fixas e latência artificial
+"""
+
+import hubspot_client as hubspot_module
+from conftest import FakeResponse
+from hubspot_client import HubSpotClient
+
+
+LATENCIA = 0.2
+CONTATOS = {
+    "101": {
+        "firstname": "Ana",
+        "deals": [("d1", "1000"), ("d2", "500.5")],
+        "tickets": [("t1", "Pedido de CANCELAMENTO")],
+    }
+}
+
+
+def _fake_hubspot(fake_hubspot, batch_disponivel=True):
+    """HubSpot fake com latência: contato 101 (Ana), deals d1/d2 e um ticket de cancelamento"""
+    return fake_hubspot(batch_disponivel=batch_disponivel, latencia=LATENCIA, contatos=CONTATOS).chamadas
+
+
+def test_parallel_context_matches_sequential(fake_hubspot):
+    """Modo paralelo deve retornar exatamente o mesmo contexto do sequencial"""
+    _fake_hubspot(fake_hubspot)
+    client = HubSpotClient()
+
+    sequencial = client.get_contact_context("101", parallel=False)
+    paralelo = client.get_contact_context("101", parallel=True)
+
+    assert paralelo == sequencial
+    assert paralelo["contact"]["properties"]["firstname"] == "Ana"
+    assert paralelo["consolidated_value"] == 1500.5
+    assert [li["toObjectId"] for li in paralelo["line_items"]] == ["li-d1", "li-d2"]
+    assert len(paralelo["risks"]) == 1
+
+
+def test_parallel_context_overlaps_searches(fake_hubspot):
+    """Modo paralelo sobrepõe as buscas independentes; line items esperam só os deals"""
+    hubspot = fake_hubspot(latencia=LATENCIA, contatos=CONTATOS)
+    client = HubSpotClient()
+
+    client.get_contact_context("101", parallel=True)
+
+    assert len(hubspot.chamadas) == 6
+    buscas = [(inicio, fim) for url, inicio, fim in hubspot.intervalos if url.endswith("/search")]
+    assert len(buscas) == 5
+    # As 5 buscas estavam em andamento ao mesmo tempo (no sequencial, cada uma
+    # começa depois do fim da anterior)
+    assert max(inicio for inicio, _ in buscas) < min(fim for _, fim in buscas)
+    fim_deals = next(fim for url, _, fim in hubspot.intervalos if "/deals/search" in url)
+    inicio_line_items = next(inicio for url, inicio, _ in hubspot.intervalos if "line_items" in url)
+    assert inicio_line_items >= fim_deals
+
+
+def test_line_items_single_batch_request(fake_hubspot):
+    """Line items de todos os deals saem de uma única requisição em lote"""
+    chamadas = _fake_hubspot(fake_hubspot)
+    client = HubSpotClient()
+
+    context = client.get_contact_context("101", parallel=False)
+
+    line_item_calls = [url for url in chamadas if "line_items" in url]
+    assert line_item_calls == [f"{client.base_url}/crm/v4/associations/deals/line_items/batch/read"]
+    assert [li["toObjectId"] for li in context["line_items"]] == ["li-d1", "li-d2"]
+
+
+def test_line_items_fallback_when_batch_unavailable(fake_hubspot):
+    """Sem endpoint em lote, volta para uma chamada por deal e memoriza a indisponibilidade"""
+    chamadas = _fake_hubspot(fake_hubspot, batch_disponivel=False)
+    client = HubSpotClient()
+
+    context = client.get_contact_context("101", parallel=True)
+    assert [li["toObjectId"] for li in context["line_items"]] == ["li-d1", "li-d2"]
+    assert client.batch_associations_supported is False
+
+    chamadas.clear()
+    client.get_contact_context("101", parallel=True)
+    assert not any("batch/read" in url for url in chamadas)
+
+
+def _fake_paginated_deals(monkeypatch, total=250):
+    """HubSpot fake com `total` deals paginados pelo cursor after"""
+    payloads = []
+
+    def fake_post(url, headers=None, json=None, **kwargs):
+        payloads.append(json)
+        if "/deals/search" not in url:
+            return FakeResponse({"results": []})
+        start = int(json.get("after", 0))
+        end = min(start + json["limit"], total)
+        data = {"results": [{"id": f"d{i}", "properties": {"amount": "1"}} for i in range(start, end)]}
+        if end < total:
+            data["paging"] = {"next": {"after": str(end)}}
+        return FakeResponse(data)
+
+    monkeypatch.setattr(hubspot_module.http_pool.session, "post", fake_post)
+    return payloads
+
+
+def test_iter_deals_follows_cursor(monkeypatch):
+    """Iterador percorre todas as páginas sob demanda"""
+    payloads = _fake_paginated_deals(monkeypatch)
+    client = HubSpotClient()
+
+    iterator = client.iter_deals("101")
+    assert payloads == []  # nada é buscado antes do consumo
+
+    deals = list(iterator)
+    assert len(deals) == 250
+    assert [p.get("after") for p in payloads] == [None, "100", "200"]
+
+
+def test_iter_deals_respects_cap(monkeypatch):
+    """max_results interrompe a paginação sem buscar páginas extras"""
+    payloads = _fake_paginated_deals(monkeypatch)
+    client = HubSpotClient()
+
+    deals = list(client.iter_deals("101", max_results=120))
+    assert len(deals) == 120
+    assert [p["limit"] for p in payloads] == [100, 20]
+
+
+def test_context_reads_every_page(monkeypatch):
+    """get_contact_context não trunca mais em 100 resultados"""
+    _fake_paginated_deals(monkeypatch)
+    client = HubSpotClient()
+    client.batch_associations_supported = False
+    monkeypatch.setattr(client, "get_deal_line_items", lambda deal_id: {"results": []})
+
+    context = client.get_contact_context("101", parallel=False)
+    assert len(context["deals"]) == 250
+    assert context["consolidated_value"] == 250.0
+
+    context = client.get_contact_context("101", parallel=True, max_per_object=30)
+    assert len(context["deals"]) == 30
+
+
+def test_searches_request_context_projection(monkeypatch):
+    """Toda busca do contexto pede só as propriedades de CONTEXT_PROPERTIES"""
+    payloads = {}
+
+    def fake_post(url, headers=None, json=None, **kwargs):
+        object_type = url.split("/objects/")[1].split("/")[0] if "/objects/" in url else "batch"
+        payloads[object_type] = json
+        return FakeResponse({"results": []})
+
+    monkeypatch.setattr(hubspot_module.http_pool.session, "post", fake_post)
+    client = HubSpotClient(use_mirror=False)
+    client.get_contact_context("101", parallel=False)
+
+    for object_type in ("contacts", "deals", "tickets", "emails", "notes"):
+        assert payloads[object_type]["properties"] == hubspot_module.CONTEXT_PROPERTIES[object_type]
+
+    client.search_tickets("101")
+    assert payloads["tickets"]["properties"] == hubspot_module.CONTEXT_PROPERTIES["tickets"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,157 @@
+"""
+Teste offline do espelho local incremental do HubSpot
+"""
+
+import os
+import time
+
+from hubspot_client import HubSpotClient
+from hubspot_mirror import HubSpotMirror
+
+
+def _now_ms(offset_days=0):
+    return str(int((time.time() + offset_days * 86400) * 1000))
+
+
+class FakeCRM:
+    """Dados do CRM fake e registro das consultas feitas pelo sync"""
+
+    def __init__(self):
+        self.objects = {
+            "contacts": [{"id": "101", "properties": {"firstname": "Ana", "lastmodifieddate": "1000"}}],
+            "deals": [
+                {"id": "d1", "properties": {"amount": "100", "createdate": _now_ms(-1), "hs_lastmodifieddate": "1000"}},
+                {"id": "d-antigo", "properties": {"amount": "999", "createdate": _now_ms(-90), "hs_lastmodifieddate": "1000"}},
+            ],
+            "tickets": [
+                {"id": "t1", "properties": {"subject": "churn", "createdate": _now_ms(-2), "hs_lastmodifieddate": "2024-01-01T00:00:00Z"}},
+            ],
+            "emails": [],
+            "notes": [],
+        }
+        self.associations = {"d1": ["101"], "d-antigo": ["101"], "t1": ["101"]}
+        self.watermarks_seen = []
+
+
+def _client(crm: FakeCRM, monkeypatch) -> HubSpotClient:
+    client = HubSpotClient(use_mirror=False)
+
+    def fake_iter_search(object_type, filter_groups, properties=None, max_results=None, sorts=None, **kwargs):
+        prop = filter_groups[0]["filters"][0]["propertyName"]
+        watermark = int(filter_groups[0]["filters"][0]["value"])
+        crm.watermarks_seen.append((object_type, watermark))
+        from hubspot_mirror import _to_millis
+        for obj in crm.objects[object_type]:
+            if _to_millis(obj["properties"].get(prop)) >= watermark:
+                yield obj
+
+    def fake_batch_read(from_object, to_object, ids):
+        if to_object == "line_items":
+            return {i: [{"toObjectId": f"li-{i}"}] for i in ids}
+        return {i: [{"toObjectId": c} for c in crm.associations.get(i, [])] for i in ids}
+
+    monkeypatch.setattr(client, "iter_search", fake_iter_search)
+    monkeypatch.setattr(client, "batch_read_associations", fake_batch_read)
+    return client
+
+
+def test_context_served_from_mirror(tmp_path, monkeypatch):
+    crm = FakeCRM()
+    mirror = HubSpotMirror(str(tmp_path / "mirror.db"), client=_client(crm, monkeypatch))
+
+    assert mirror.get_contact_context("101") is None  # nunca sincronizado
+
+    assert mirror.sync()["deals"] == 2
+    context = mirror.get_contact_context("101", days_back=30)
+
+    assert context["contact"]["properties"]["firstname"] == "Ana"
+    assert [d["id"] for d in context["deals"]] == ["d1"]  # d-antigo fora da janela
+    assert context["consolidated_value"] == 100.0
+    assert context["line_items"] == [{"toObjectId": "li-d1"}]
+    assert len(context["risks"]) == 1
+    assert mirror.get_contact_context("999") is None
+
+
+def test_incremental_sync_uses_watermark(tmp_path, monkeypatch):
+    crm = FakeCRM()
+    mirror = HubSpotMirror(str(tmp_path / "mirror.db"), client=_client(crm, monkeypatch))
+    mirror.sync()
+
+    crm.objects["deals"].append(
+        {"id": "d2", "properties": {"amount": "50", "createdate": _now_ms(-1), "hs_lastmodifieddate": "5000"}}
+    )
+    crm.associations["d2"] = ["101"]
+    crm.watermarks_seen.clear()
+
+    updated = mirror.sync()
+    assert ("deals", 1000) in crm.watermarks_seen
+    assert updated["deals"] == 3  # empate no watermark + o novo (upsert idempotente)
+    assert mirror.get_contact_context("101")["consolidated_value"] == 150.0
+
+    crm.watermarks_seen.clear()
+    mirror.sync()
+    assert ("deals", 5000) in crm.watermarks_seen
+
+
+def test_stale_mirror_falls_back(tmp_path, monkeypatch):
+    crm = FakeCRM()
+    mirror = HubSpotMirror(str(tmp_path / "mirror.db"), client=_client(crm, monkeypatch), max_staleness=0.05)
+    mirror.sync()
+    time.sleep(0.1)
+    assert mirror.get_contact_context("101") is None
+
+
+def test_association_failure_keeps_watermark(tmp_path, monkeypatch):
+    crm = FakeCRM()
+    client = _client(crm, monkeypatch)
+    mirror = HubSpotMirror(str(tmp_path / "mirror.db"), client=client)
+    mirror.sync()
+
+    crm.objects["deals"].append(
+        {"id": "d2", "properties": {"amount": "50", "createdate": _now_ms(-1), "hs_lastmodifieddate": "5000"}}
+    )
+    crm.associations["d2"] = ["101"]
+    working_batch_read = client.batch_read_associations
+    monkeypatch.setattr(client, "batch_read_associations", lambda *args: None)
+    mirror.sync()
+
+    # Lote sem associações não foi gravado nem avançou o watermark
+    assert mirror.get_contact_context("101")["consolidated_value"] == 100.0
+
+    monkeypatch.setattr(client, "batch_read_associations", working_batch_read)
+    crm.watermarks_seen.clear()
+    mirror.sync()
+    assert ("deals", 1000) in crm.watermarks_seen
+    assert mirror.get_contact_context("101")["consolidated_value"] == 150.0
+
+
+def test_webhook_deletion_and_association_change(tmp_path, monkeypatch):
+    crm = FakeCRM()
+    mirror = HubSpotMirror(str(tmp_path / "mirror.db"), client=_client(crm, monkeypatch))
+    mirror.sync()
+
+    mirror.apply_crm_events([{"subscriptionType": "ticket.deletion", "objectId": "t1"}])
+    assert mirror.get_contact_context("101")["tickets"] == []
+
+    crm.associations["d1"] = []
+    mirror.apply_crm_events([{
+        "subscriptionType": "contact.associationChange",
+        "associationType": "CONTACT_TO_DEAL",
+        "fromObjectId": 101,
+        "toObjectId": "d1"
+    }])
+    assert mirror.get_contact_context("101")["deals"] == []
+
+
+def test_mirror_file_opens_lazily(tmp_path):
+    path = tmp_path / "dados" / "mirror.db"
+    mirror = HubSpotMirror(str(path))
+    assert not os.path.exists(path)
+
+    assert mirror.is_fresh() is False
+    assert os.path.exists(path)
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,222 @@
+"""
+Teste offline do agendador de requisições ao HubSpot
+Rate limit, Retry-After em 429, prioridade interativa e contexto incompleto
+"""
+
+import threading
+import time
+
+import hubspot_client as hubspot_module
+from agents.context_collector import ContextCollectorAgent
+from conftest import FakeResponse
+from deadline import deadline_scope
+from hubspot_client import HubSpotClient
+from hubspot_scheduler import (
+    HubSpotDeadlineExceeded,
+    HubSpotQuotaExceeded,
+    HubSpotRequestScheduler,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+)
+
+
+class FakeSession:
+    """Sessão que devolve as respostas da fila em ordem"""
+
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+        self.instantes = []
+        self.timeouts = []
+
+    def post(self, url, **kwargs):
+        self.instantes.append(time.monotonic())
+        self.timeouts.append(kwargs.get("timeout"))
+        return self.respostas.pop(0)
+
+
+def test_rate_limit_spaces_requests():
+    """Com balde de 1 token a 20/s, 5 requisições levam ~0.2s"""
+    scheduler = HubSpotRequestScheduler(rate_per_second=20, burst=1)
+    session = FakeSession([FakeResponse() for _ in range(5)])
+
+    inicio = time.monotonic()
+    for _ in range(5):
+        scheduler.request(session, "POST", "http://hubspot/x")
+
+    assert time.monotonic() - inicio >= 0.18
+
+
+def test_429_honors_retry_after():
+    """429 pausa o agendador pelo Retry-After e a requisição é refeita"""
+    scheduler = HubSpotRequestScheduler(rate_per_second=100, max_retries=2)
+    session = FakeSession([
+        FakeResponse(status_code=429, headers={"Retry-After": "0.3"}),
+        FakeResponse({"ok": True}),
+    ])
+
+    response = scheduler.request(session, "POST", "http://hubspot/x")
+
+    assert response.json() == {"ok": True}
+    assert session.instantes[1] - session.instantes[0] >= 0.3
+    stats = scheduler.stats()
+    assert stats["throttled_429"] == 1
+    assert stats["retries"] == 1
+
+
+def test_retries_exhausted_returns_last_response():
+    scheduler = HubSpotRequestScheduler(rate_per_second=100, max_retries=2, backoff_base=0.01)
+    session = FakeSession([FakeResponse(status_code=503) for _ in range(3)])
+
+    response = scheduler.request(session, "POST", "http://hubspot/x")
+
+    assert response.status_code == 503
+    assert scheduler.stats()["failures"] == 1
+    assert session.respostas == []
+
+
+def test_interactive_jumps_bulk_queue():
+    """Requisição interativa passa na frente das que estão esperando em lote"""
+    scheduler = HubSpotRequestScheduler(rate_per_second=10, burst=1)
+    scheduler.acquire(PRIORITY_BULK)  # esvazia o balde
+    ordem = []
+
+    def worker(prioridade, nome):
+        scheduler.acquire(prioridade)
+        ordem.append(nome)
+
+    threads = [threading.Thread(target=worker, args=(PRIORITY_BULK, f"bulk{i}")) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    interativa = threading.Thread(target=worker, args=(PRIORITY_INTERACTIVE, "interativa"))
+    interativa.start()
+
+    for thread in threads + [interativa]:
+        thread.join(timeout=5)
+
+    assert ordem[0] == "interativa"
+
+
+def test_bulk_cannot_use_interactive_reserve():
+    scheduler = HubSpotRequestScheduler(rate_per_second=1000, daily_quota=10, bulk_daily_reserve=0.2)
+
+    for _ in range(8):
+        scheduler.acquire(PRIORITY_BULK)
+
+    try:
+        scheduler.acquire(PRIORITY_BULK)
+        assert False, "bulk deveria ser recusado"
+    except HubSpotQuotaExceeded:
+        pass
+
+    scheduler.acquire(PRIORITY_INTERACTIVE)
+    assert scheduler.stats()["daily_used"] == 9
+
+
+def test_shards_split_the_app_rate(monkeypatch):
+    """N workers somados ficam no limite do app do HubSpot"""
+    monkeypatch.setenv("SHARD_COUNT", "4")
+    monkeypatch.setenv("HUBSPOT_RATE_PER_SECOND", "10")
+    monkeypatch.setenv("HUBSPOT_RATE_BURST", "20")
+    monkeypatch.setenv("HUBSPOT_DAILY_QUOTA", "1000")
+
+    scheduler = HubSpotRequestScheduler()
+
+    assert scheduler.rate == 2.5
+    assert scheduler.burst == 5
+    assert scheduler.daily_quota == 250
+
+
+def test_failed_source_marks_context_incomplete(monkeypatch):
+    """Tickets falhando após os retries: contexto sinaliza erro e não é cacheado"""
+    def fake_post(url, **kwargs):
+        if "/tickets/search" in url:
+            return FakeResponse(status_code=503)
+        if "/contacts/search" in url:
+            return FakeResponse({"results": [{"id": "101", "properties": {"firstname": "Ana"}}]})
+        return FakeResponse({"results": []})
+
+    monkeypatch.setattr(hubspot_module.http_pool.session, "post", fake_post)
+    scheduler = HubSpotRequestScheduler(rate_per_second=1000, max_retries=1, backoff_base=0.01)
+
+    collector = ContextCollectorAgent()
+    collector.hubspot = HubSpotClient(use_mirror=False)
+    collector.hubspot.scheduler = scheduler
+
+    context = collector.collect("101")
+
+    assert context["fontes_com_erro"] == ["tickets"]
+    assert len(collector.cache) == 0
+
+
+def test_client_timeout_is_sized_by_deadline():
+    session = FakeSession([FakeResponse({"results": []})])
+    client = HubSpotClient(use_mirror=False)
+    client.session = session
+    client.scheduler = HubSpotRequestScheduler(rate_per_second=1000)
+
+    with deadline_scope(3.0):
+        client.search_contacts()
+
+    assert 0 < session.timeouts[0] <= 3.0
+
+
+def test_spent_budget_skips_request():
+    scheduler = HubSpotRequestScheduler(rate_per_second=1000)
+    session = FakeSession([FakeResponse()])
+
+    with deadline_scope(0.01):
+        try:
+            scheduler.request(session, "POST", "http://hubspot/x", timeout=10)
+            assert False, "deveria abortar antes de enviar"
+        except HubSpotDeadlineExceeded:
+            pass
+
+    assert session.instantes == []
+    assert scheduler.stats()["deadline_aborts"] == 1
+
+
+def test_parallel_fan_out_keeps_deadline():
+    """Threads do pool recebem o deadline de quem chamou"""
+    timeouts = []
+    lock = threading.Lock()
+
+    class RecordingSession:
+        def post(self, url, **kwargs):
+            with lock:
+                timeouts.append(kwargs.get("timeout"))
+            return FakeResponse({"results": []})
+
+        get = post
+
+    client = HubSpotClient(use_mirror=False)
+    client.session = RecordingSession()
+    client.scheduler = HubSpotRequestScheduler(rate_per_second=1000)
+
+    with deadline_scope(3.0):
+        client.get_contact_context("101", parallel=True)
+
+    assert len(timeouts) >= 5
+    assert all(0 < timeout <= 3.0 for timeout in timeouts)
+
+
+def test_retry_after_pause_beyond_deadline_aborts():
+    """Pausa de um 429 maior que o orçamento: desiste em vez de esperar"""
+    scheduler = HubSpotRequestScheduler(rate_per_second=1000)
+    scheduler.pause(30)
+
+    with deadline_scope(2.0):
+        try:
+            scheduler.acquire(PRIORITY_INTERACTIVE)
+            assert False, "deveria abortar sem esperar a pausa"
+        except HubSpotDeadlineExceeded:
+            pass
+
+    stats = scheduler.stats()
+    assert stats["deadline_aborts"] == 1
+    assert stats["waiting"] == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
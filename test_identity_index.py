@@ -0,0 +1,82 @@
+"""
+Teste offline do índice de identidade chat_id → contato (backend SQLite)
+"""
+
+import os
+
+import pytest
+
+from services.identity_index import IdentityIndex, SQLiteIdentityIndex
+from services.cliente_service import ClienteService
+
+
+def test_put_get_and_persistence(tmp_path):
+    """Vínculo sobrevive à recriação do índice (novo processo)"""
+    path = str(tmp_path / "identity.db")
+    index = SQLiteIdentityIndex(path)
+    index.put("555", "101", email="ana@exemplo.com",
+              cliente={"id": "101", "properties": {"firstname": "Ana"}})
+
+    reaberto = SQLiteIdentityIndex(path)
+    entry = reaberto.get("555")
+    assert entry["contact_id"] == "101"
+    assert entry["cliente"]["properties"]["firstname"] == "Ana"
+    assert reaberto.get("999") is None
+
+    reaberto.delete("555")
+    assert SQLiteIdentityIndex(path).get("555") is None
+
+
+def test_bulk_import(tmp_path):
+    """Importação em lote ignora linhas incompletas"""
+    index = SQLiteIdentityIndex(str(tmp_path / "identity.db"))
+    rows = [{"chat_id": str(i), "contact_id": str(1000 + i)} for i in range(1200)]
+    rows.append({"chat_id": "sem-contato"})
+
+    assert index.bulk_import(rows, batch_size=500) == 1200
+    assert index.get("1199")["contact_id"] == "2199"
+    assert index.get("sem-contato") is None
+
+
+def test_cliente_service_uses_index(tmp_path, monkeypatch):
+    """buscar_por_chat_id resolve sem nenhuma chamada HTTP"""
+    service = ClienteService()
+    service.identity_index = SQLiteIdentityIndex(str(tmp_path / "identity.db"))
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("não deveria chamar o HubSpot")
+
+    monkeypatch.setattr(service, "session", type("S", (), {"post": staticmethod(no_network)})())
+
+    assert service.buscar_por_chat_id("777") is None
+
+    service.vincular_chat_id("777", {
+        "id": "102",
+        "properties": {"firstname": "Bruno", "email": "bruno@exemplo.com"},
+        "contexto": {"deals": []}
+    })
+    cliente = service.buscar_por_chat_id("777")
+    assert cliente == {"id": "102", "properties": {"firstname": "Bruno", "email": "bruno@exemplo.com"}}
+
+
+def test_sqlite_file_is_opened_lazily(tmp_path):
+    """Criar o índice (singleton no import) não toca o disco"""
+    path = tmp_path / "dados" / "identity.db"
+    index = SQLiteIdentityIndex(str(path))
+    assert not os.path.exists(path)
+
+    index.put("1", "10")
+    assert os.path.exists(path)
+
+
+def test_backend_must_implement_storage():
+    class SemBackend(IdentityIndex):
+        pass
+
+    with pytest.raises(TypeError):
+        SemBackend()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
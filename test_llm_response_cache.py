@@ -0,0 +1,94 @@
+"""
+Teste offline do cache de respostas do LLM (memória + SQLite)
+"""
+
+import asyncio
+import os
+import time
+
+from agents.llm.response_cache import LLMResponseCache
+from agents.llm.tess_llm import TessLLM
+from tess_client import FALLBACK_TEXT
+
+
+def _cache(tmp_path, **kwargs):
+    return LLMResponseCache(path=str(tmp_path / "llm_cache.db"), **kwargs)
+
+
+def test_key_normalizes_prompt_and_temperature():
+    key = LLMResponseCache.make_key("39004", "Nota  10\n sem feedback ", 0.9, 250)
+
+    assert key == LLMResponseCache.make_key("39004", "Nota 10 sem feedback", 0.8, 250)
+    assert key != LLMResponseCache.make_key("39004", "Nota 10 sem feedback", 0.2, 250)
+    assert key != LLMResponseCache.make_key("39004", "Nota 10 sem feedback", 0.9, 300)
+    assert key != LLMResponseCache.make_key("40000", "Nota 10 sem feedback", 0.9, 250)
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("k", "resposta")
+
+    reaberto = _cache(tmp_path)
+    assert reaberto.get("k") == "resposta"
+    assert reaberto.get("k") == "resposta"
+
+    stats = reaberto.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hit_rate"] == 1.0
+
+
+def test_disk_tier_opens_lazily(tmp_path):
+    path = tmp_path / "dados" / "llm.db"
+    cache = LLMResponseCache(path=str(path))
+    assert not os.path.exists(path)
+
+    cache.set("k", "resposta")
+    assert os.path.exists(path)
+
+
+def test_entries_expire(tmp_path):
+    cache = _cache(tmp_path, ttl=0.05)
+    cache.set("k", "resposta")
+    time.sleep(0.1)
+
+    assert cache.get("k") is None
+    assert cache.purge_expired() == 1
+
+
+class FakeTess:
+    def __init__(self, resposta="Obrigado pela nota!"):
+        self.resposta = resposta
+        self.chamadas = 0
+
+    def generate(self, prompt, max_tokens, temperature, agent_id=None, raise_on_error=False):
+        self.chamadas += 1
+        return self.resposta
+
+    async def agenerate(self, prompt, max_tokens, temperature, agent_id=None, raise_on_error=False):
+        return self.generate(prompt, max_tokens, temperature, agent_id)
+
+
+def test_tess_llm_skips_network_on_repeat(tmp_path):
+    llm = TessLLM(temperature=0.9, max_tokens=250, response_cache=_cache(tmp_path))
+    llm.tess_client = FakeTess()
+
+    assert llm.invoke("Score NPS: 10/10, sem feedback") == "Obrigado pela nota!"
+    assert llm.invoke("Score NPS: 10/10,  sem feedback") == "Obrigado pela nota!"
+    assert asyncio.run(llm.ainvoke("Score NPS: 10/10, sem feedback")) == "Obrigado pela nota!"
+    assert llm.tess_client.chamadas == 1
+
+
+def test_fallback_text_is_not_cached(tmp_path):
+    llm = TessLLM(response_cache=_cache(tmp_path))
+    llm.tess_client = FakeTess(resposta=FALLBACK_TEXT)
+
+    llm.invoke("prompt")
+    llm.invoke("prompt")
+    assert llm.tess_client.chamadas == 2
+    assert llm.response_cache.stats()["writes"] == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,77 @@
+"""
+Teste offline da resposta NPS combinada (uma chamada estruturada ao LLM)
+"""
+
+import asyncio
+import json
+
+from agents.nps_answer import NPSAnswerAgent
+
+
+class FakeLLM:
+    def __init__(self, resposta):
+        self.resposta = resposta
+        self.chamadas = 0
+
+    def invoke(self, prompt):
+        self.chamadas += 1
+        if isinstance(self.resposta, Exception):
+            raise self.resposta
+        return self.resposta
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+def _agent(resposta):
+    agent = NPSAnswerAgent()
+    agent.llm = FakeLLM(resposta)
+    agent._log_answer = lambda *args, **kwargs: None
+    return agent
+
+
+def test_single_call_fills_all_fields():
+    raw = "```json\n" + json.dumps({
+        "sentimento_geral": "positivo",
+        "nivel_satisfacao": 9,
+        "risco_churn": "BAIXO",
+        "justificativa": "Elogiou o suporte",
+        "resposta": "Que bom saber, Ana! Obrigado pela nota.",
+        "resumo_executivo": "🟢 Promotor - elogio ao suporte. Convidar para case."
+    }) + "\n```"
+    agent = _agent(raw)
+
+    result = asyncio.run(agent.aanswer(9, "suporte excelente", {"properties": {"firstname": "Ana"}}))
+
+    assert agent.llm.chamadas == 1
+    assert result["campos_fallback"] == []
+    assert result["sentimento"]["sentimento_geral"] == "POSITIVO"
+    assert result["resposta"].startswith("Que bom saber, Ana")
+    assert result["resumo_executivo"].startswith("🟢 Promotor")
+
+
+def test_invalid_fields_fall_back_individually():
+    raw = json.dumps({
+        "sentimento_geral": "TALVEZ",
+        "resposta": "Sinto muito pelo atendimento, vamos resolver.",
+        "resumo_executivo": ""
+    })
+    result = _agent(raw).answer(3, "o atendimento demorou muito")
+
+    assert result["campos_fallback"] == ["sentimento", "resumo_executivo"]
+    assert result["sentimento"]["sentimento_geral"] == "NEGATIVO"
+    assert result["resposta"] == "Sinto muito pelo atendimento, vamos resolver."
+    assert "DETRATOR" in result["resumo_executivo"]
+
+
+def test_llm_failure_uses_all_fallbacks():
+    result = _agent(RuntimeError("Tess fora")).answer(10, "adorei")
+
+    assert result["campos_fallback"] == ["sentimento", "resposta", "resumo_executivo"]
+    assert result["sentimento"]["sentimento_geral"] == "POSITIVO"
+    assert result["resposta"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,126 @@
+"""
+Teste offline da reconstrução de sessões a partir de conversation_messages
+(replay das linhas, snapshots periódicos e cache no session store)
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from conversation_manager import ConversationManager, ConversationState
+from session_rehydration import rebuild_record, snapshot_message
+from session_store import InMemorySessionStore
+from supabase_client import supabase_client
+
+INICIO = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+
+
+def _rows(*specs):
+    """Linhas no formato do Supabase, da mais recente para a mais antiga"""
+    rows = []
+    for i, (sender, text, state, score, sentiment) in enumerate(specs):
+        rows.append({
+            "sender": sender,
+            "message_text": text,
+            "conversation_state": state,
+            "nps_score": score,
+            "sentiment": sentiment,
+            "metadata": {},
+            "created_at": (INICIO + timedelta(seconds=i)).isoformat()
+        })
+    return list(reversed(rows))
+
+
+CONVERSA = (
+    ("user", "/start", "idle", None, None),
+    ("system", "[STATE_TRANSITION] idle → waiting_confirmation", "waiting_confirmation", None, None),
+    ("bot", "Olá! Tudo bem?", "waiting_confirmation", None, None),
+    ("user", "sim", "waiting_confirmation", None, None),
+    ("system", "[STATE_TRANSITION] waiting_confirmation → waiting_score", "waiting_score", None, None),
+    ("bot", "Por favor, atribua uma nota", "waiting_score", None, None),
+    ("user", "9, atendimento ótimo", "waiting_score", None, None),
+    ("system", "[STATE_TRANSITION] waiting_score → completed", "completed", None, None),
+    ("bot", "Que bom!", "completed", 9, None),
+    ("system", "[SENTIMENT] POSITIVO", "completed", 9, "POSITIVO"),
+)
+
+
+def test_rebuild_replays_the_log():
+    record = rebuild_record("42", _rows(*CONVERSA))
+
+    assert record["state"] == "completed"
+    assert record["nps_score"] == 9
+    assert record["feedback_text"] == "9, atendimento ótimo"
+    assert record["sentiment"] == "POSITIVO"
+    assert [m["sender"] for m in record["history"]] == ["user", "bot", "user", "bot", "user", "bot"]
+    assert rebuild_record("42", []) is None
+
+
+def test_rebuild_starts_from_latest_snapshot():
+    snapshot = snapshot_message({
+        "chat_id": "42", "state": "completed", "nps_score": 3, "feedback_text": "demorou",
+        "sentiment": "NEGATIVO", "created_at": INICIO.isoformat(), "manual_mode": False,
+        "cliente_identificado": True, "dados_cliente": {"id": "101", "properties": {"firstname": "Ana"}}
+    })
+    rows = _rows(
+        ("system", "[STATE_TRANSITION] idle → waiting_score", "waiting_score", None, None),
+        ("system", snapshot["message_text"], "completed", 3, "NEGATIVO"),
+        ("user", "obrigado", "completed", 3, "NEGATIVO"),
+        ("bot", "Sua avaliação já foi registrada", "completed", 3, "NEGATIVO"),
+    )
+    rows[2]["metadata"] = snapshot["metadata"]
+
+    record = rebuild_record("42", rows)
+
+    assert record["state"] == "completed"
+    assert record["feedback_text"] == "demorou"
+    assert record["dados_cliente"]["properties"]["firstname"] == "Ana"
+    assert len(record["history"]) == 2
+
+
+def test_manager_rehydrates_once_and_caches(monkeypatch):
+    calls = []
+
+    def fake_tail(chat_id, limit=100):
+        calls.append((chat_id, limit))
+        return _rows(*CONVERSA)
+
+    monkeypatch.setattr(supabase_client, "fetch_conversation_tail", fake_tail)
+    store = InMemorySessionStore(ttl=60)
+    manager = ConversationManager(session_store=store)
+
+    session = manager.load_session("42")
+    manager.save_session("42")
+    assert session.state == ConversationState.COMPLETED
+    assert session.nps_score == 9
+
+    # Outro worker (cache vazio): o session store atende, sem reler o log
+    outro = ConversationManager(session_store=store)
+    assert outro.load_session("42").state == ConversationState.COMPLETED
+    assert len(calls) == 1
+    assert manager.session_stats()["rehydration"]["rehydrated"] == 1
+
+
+def test_snapshot_is_written_every_n_rows(monkeypatch):
+    logged = []
+    monkeypatch.setattr(supabase_client, "log_conversation_message", lambda **kwargs: logged.append(kwargs))
+    manager = ConversationManager(session_store=InMemorySessionStore(ttl=60))
+    manager.snapshot_every = 3
+
+    session = manager.get_session("7")
+    session.state = ConversationState.WAITING_FEEDBACK
+    session.nps_score = 6
+    for n in range(3):
+        manager._log_message(chat_id="7", message_text=f"msg {n}", sender="user",
+                             conversation_state=session.state.value, nps_score=6)
+    manager.save_session("7")
+
+    assert logged[-1]["message_text"] == "[SNAPSHOT] waiting_feedback"
+    assert session.rows_since_snapshot == 0
+
+    record = rebuild_record("7", list(reversed(logged)))
+    assert record["state"] == "waiting_feedback"
+    assert record["nps_score"] == 6
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,197 @@
+"""
+Teste offline do session store (serialização compacta, TTL e versão otimista)
+e da memória das sessões (buffer circular, sweeper, limites LRU)
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from conversation_manager import (
+    SESSION_HISTORY_LIMIT,
+    ConversationManager,
+    ConversationSession,
+    ConversationState,
+    compact_cliente,
+)
+from session_store import (
+    InMemorySessionStore,
+    SQLiteSessionStore,
+    SessionVersionConflict,
+    decode_session,
+    encode_session,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemorySessionStore(ttl=60)
+    return SQLiteSessionStore(path=str(tmp_path / "sessions.db"), ttl=60)
+
+
+def test_compact_encoding_roundtrip():
+    pequeno = {"chat_id": "1", "state": "idle"}
+    grande = {"chat_id": "1", "history": [{"text": "mensagem repetida " * 10}] * 20}
+
+    assert encode_session(pequeno)[:1] == b"j"
+    assert encode_session(grande)[:1] == b"z"
+    assert decode_session(encode_session(grande)) == grande
+
+
+def test_optimistic_versioning(store):
+    assert store.load("1") is None
+    assert store.save("1", {"state": "idle"}, 0) == 1
+
+    dados, versao = store.load("1")
+    assert (dados, versao) == ({"state": "idle"}, 1)
+
+    assert store.save("1", {"state": "waiting_score"}, 1) == 2
+    with pytest.raises(SessionVersionConflict):
+        store.save("1", {"state": "completed"}, 1)
+    with pytest.raises(SessionVersionConflict):
+        store.save("1", {"state": "completed"}, 0)
+
+    assert store.stats()["conflicts"] == 2
+
+
+def test_sessions_expire(tmp_path):
+    for store in (InMemorySessionStore(ttl=0.05), SQLiteSessionStore(path=str(tmp_path / "s.db"), ttl=0.05)):
+        store.save("1", {"state": "idle"}, 0)
+        time.sleep(0.1)
+        assert store.load("1") is None
+        assert store.save("1", {"state": "idle"}, 0) == 1
+
+
+def test_sqlite_store_opens_lazily(tmp_path):
+    """Criar o store (no import do conversation_manager) não toca o disco"""
+    path = tmp_path / "dados" / "sessions.db"
+    store = SQLiteSessionStore(str(path))
+    assert not os.path.exists(path)
+
+    store.save("1", {"state": "idle"}, 0)
+    assert os.path.exists(path)
+    assert store.load("1")[0] == {"state": "idle"}
+
+
+def test_workers_share_sessions_through_store(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = ConversationManager(session_store=SQLiteSessionStore(path=path))
+    worker_b = ConversationManager(session_store=SQLiteSessionStore(path=path))
+
+    sessao = worker_a.get_session("7")
+    sessao.state = ConversationState.WAITING_SCORE
+    sessao.add_message("user", "/start")
+    worker_a.save_session("7")
+
+    recarregada = worker_b.load_session("7")
+    assert recarregada.state == ConversationState.WAITING_SCORE
+    assert [(m["sender"], m["text"]) for m in recarregada.messages_history] == [("user", "/start")]
+
+
+def test_conflict_merges_new_messages_and_changed_fields(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = ConversationManager(session_store=SQLiteSessionStore(path=path))
+    worker_b = ConversationManager(session_store=SQLiteSessionStore(path=path))
+    worker_a.get_session("8")
+    worker_a.save_session("8")
+
+    a = worker_a.load_session("8")
+    b = worker_b.load_session("8")
+
+    b.state = ConversationState.COMPLETED
+    b.add_message("bot", "obrigado")
+    worker_b.save_session("8")
+
+    a.sentiment = "POSITIVO"
+    a.add_message("system", "[SENTIMENT] POSITIVO")
+    worker_a.save_session("8")
+
+    final = ConversationManager(session_store=SQLiteSessionStore(path=path)).load_session("8")
+    assert final.version == 3
+    assert final.state == ConversationState.COMPLETED
+    assert final.sentiment == "POSITIVO"
+    assert [m["text"] for m in final.messages_history] == ["obrigado", "[SENTIMENT] POSITIVO"]
+
+
+def test_history_is_a_bounded_ring_buffer():
+    sessao = ConversationSession("9")
+    for n in range(SESSION_HISTORY_LIMIT + 10):
+        sessao.add_message("user", str(n))
+
+    assert len(sessao.messages_history) == SESSION_HISTORY_LIMIT
+    assert sessao.messages_history[0]["text"] == "10"
+    assert not hasattr(sessao, "__dict__")
+
+
+def test_sweeper_uses_idle_ttl_per_state():
+    manager = ConversationManager(session_store=InMemorySessionStore(ttl=60))
+    manager.idle_ttls[ConversationState.COMPLETED] = 0.05
+
+    concluida = manager.get_session("1")
+    concluida.state = ConversationState.COMPLETED
+    aguardando = manager.get_session("2")
+    aguardando.state = ConversationState.WAITING_SCORE
+    manager._active["3"] = 1
+    manager.get_session("3").state = ConversationState.COMPLETED
+    time.sleep(0.1)
+
+    assert manager.sweep_sessions()["evicted_idle"] == 1
+    assert list(manager.sessions) == ["2", "3"]
+
+
+def test_session_caps_evict_least_recently_used():
+    store = InMemorySessionStore(ttl=60, max_entries=2)
+    manager = ConversationManager(session_store=store)
+    manager.max_cached_sessions = 2
+
+    for chat_id in ("1", "2", "3"):
+        manager.get_session(chat_id)
+        manager.save_session(chat_id)
+
+    assert list(manager.sessions) == ["2", "3"]
+    assert len(store) == 2
+    assert store.load("1") is None
+    assert store.stats()["evicted"] == 1
+
+
+def test_session_keeps_only_needed_client_fields():
+    cliente = {"id": "101", "properties": {"firstname": "Ana", "phone": "11"}, "contexto": {"deals": [1] * 100}}
+
+    assert compact_cliente(cliente) == {"id": "101", "properties": {"firstname": "Ana"}}
+
+
+def test_identification_skips_context_fetch_and_event_loop():
+    """Identificar o cliente não busca o contexto completo nem bloqueia o loop"""
+    threads = []
+
+    class FakeClienteService:
+        def buscar_por_chat_id(self, chat_id):
+            threads.append(threading.current_thread())
+            return None
+
+        def buscar_por_email(self, email):
+            threads.append(threading.current_thread())
+            return {"id": "101", "properties": {"firstname": "Ana", "email": email}}
+
+        def vincular_chat_id(self, chat_id, cliente):
+            threads.append(threading.current_thread())
+
+        def coletar_contexto(self, contact_id):
+            raise AssertionError("contexto não deveria ser coletado na identificação")
+
+    manager = ConversationManager(InMemorySessionStore())
+    manager.cliente_service = FakeClienteService()
+
+    cliente = asyncio.run(manager._tentar_identificar_cliente("1", "ana@exemplo.com"))
+
+    assert cliente["id"] == "101"
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-v"]))
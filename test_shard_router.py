@@ -0,0 +1,109 @@
+"""
+Teste offline do roteamento de chats por hash consistente e da frente HTTP
+do modo multi-processo (workers simulados com httpx.MockTransport)
+"""
+
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from shard_router import BROADCAST_HEADER, HashRing, extract_chat_id, shard_names
+from sharded_server import create_front_app
+
+CHATS = [str(100000 + n) for n in range(20000)]
+
+
+def test_ring_is_balanced_and_stable():
+    ring = HashRing(shard_names(4))
+    counts = ring.distribution(CHATS)
+
+    assert all(3500 < count < 6500 for count in counts.values())
+    # Mesmo chat, mesmo shard, em outra instância (outro processo)
+    assert ring.node_for("555") == HashRing(shard_names(4)).node_for("555")
+
+
+def test_adding_a_shard_moves_few_chats():
+    before = HashRing(shard_names(4))
+    after = HashRing(shard_names(5))
+
+    moved = sum(before.node_for(chat) != after.node_for(chat) for chat in CHATS)
+    assert moved < len(CHATS) * 0.3
+    assert all(after.node_for(chat) == "shard-4" for chat in CHATS if before.node_for(chat) != after.node_for(chat))
+
+
+def test_extract_chat_id():
+    assert extract_chat_id(json.dumps({"message": {"chat": {"id": 42}, "text": "oi"}}).encode()) == "42"
+    assert extract_chat_id(json.dumps({"chat_id": "7", "message": "olá"}).encode()) == "7"
+    assert extract_chat_id(b"") is None
+    assert extract_chat_id(b"nao-e-json") is None
+
+
+def _worker(name, seen, broadcasts=None):
+    def handler(request: httpx.Request):
+        seen.append((name, request.url.path, request.headers.get("x-telegram-bot-api-secret-token")))
+        if broadcasts is not None:
+            broadcasts.append((name, request.headers.get(BROADCAST_HEADER)))
+        return httpx.Response(200, json={"status": "processed", "shard": name})
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://shard")
+
+
+def test_front_forwards_each_chat_to_its_owner():
+    ring = HashRing(shard_names(3))
+    seen = []
+    clients = {name: _worker(name, seen) for name in ring.nodes}
+
+    with TestClient(create_front_app(ring, clients)) as client:
+        for chat_id in ("11", "22", "33", "11"):
+            response = client.post(
+                "/telegram/webhook",
+                json={"message": {"chat": {"id": int(chat_id)}, "text": "9"}},
+                headers={"X-Telegram-Bot-Api-Secret-Token": "segredo"}
+            )
+            assert response.json()["shard"] == ring.node_for(chat_id)
+
+        metrics = client.get("/metrics/shards").json()
+
+    assert [shard for shard, _, _ in seen] == [ring.node_for(c) for c in ("11", "22", "33", "11")]
+    assert all(path == "/telegram/webhook" and secret == "segredo" for _, path, secret in seen)
+    assert sum(item["forwarded"] for item in metrics["forwarding"].values()) == 4
+
+
+def test_cache_invalidation_reaches_every_shard():
+    """Webhook do HubSpot e invalidate limpam o cache de todos os workers"""
+    ring = HashRing(shard_names(3))
+    seen, broadcasts = [], []
+    clients = {name: _worker(name, seen, broadcasts) for name in ring.nodes}
+
+    with TestClient(create_front_app(ring, clients)) as client:
+        for path in ("/hubspot/webhook", "/nps/context/101/invalidate"):
+            broadcasts.clear()
+            response = client.post(path, json=[{"objectId": 101}], headers={BROADCAST_HEADER: "1"})
+
+            assert response.status_code == 200
+            assert sorted(name for name, _ in broadcasts) == sorted(ring.nodes)
+            # Só um shard recebe o original (e atualiza o espelho)
+            assert [marca for _, marca in broadcasts].count(None) == 1
+
+        client.get("/contacts")
+
+    assert sum(1 for _, path, _ in seen if path == "/contacts") == 1
+
+
+def test_front_returns_503_when_worker_is_down():
+    def down(request):
+        raise httpx.ConnectError("socket ausente")
+
+    ring = HashRing(shard_names(1))
+    clients = {"shard-0": httpx.AsyncClient(transport=httpx.MockTransport(down), base_url="http://shard")}
+
+    with TestClient(create_front_app(ring, clients)) as client:
+        response = client.post("/telegram/webhook", json={"message": {"chat": {"id": 1}, "text": "oi"}})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,94 @@
+"""
+Teste offline do single-flight (deduplicação de coletas de contexto em andamento)
+"""
+
+import asyncio
+import threading
+import time
+
+import hubspot_client as hubspot_module
+from agents.context_collector import ContextCollectorAgent
+from hubspot_client import HubSpotClient
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    execucoes = []
+
+    def lento(valor):
+        execucoes.append(valor)
+        time.sleep(0.2)
+        return {"valor": valor}
+
+    resultados = []
+    threads = [
+        threading.Thread(target=lambda: resultados.append(flights.do("k", lento, 1)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert execucoes == [1]
+    assert all(r is resultados[0] for r in resultados)
+    assert flights.stats()["shared"] == 4
+    assert flights.in_flight() == 0
+
+    # Terminada a chamada, a próxima executa de novo (não é cache)
+    flights.do("k", lento, 2)
+    assert execucoes == [1, 2]
+
+
+def test_error_is_propagated_to_waiters():
+    flights = SingleFlight()
+    erros = []
+
+    def falha():
+        time.sleep(0.1)
+        raise ValueError("crm fora")
+
+    def chamar():
+        try:
+            flights.do("k", falha)
+        except ValueError as e:
+            erros.append(str(e))
+
+    threads = [threading.Thread(target=chamar) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == ["crm fora"] * 3
+    assert flights.stats()["executions"] == 1
+
+
+def test_simultaneous_acollect_hits_crm_once(monkeypatch, fake_response):
+    """Dashboard e bot pedindo o mesmo contato ao mesmo tempo: uma busca no HubSpot"""
+    chamadas = []
+    lock = threading.Lock()
+
+    def fake_post(url, **kwargs):
+        time.sleep(0.1)
+        with lock:
+            chamadas.append(url)
+        return fake_response({"results": []})
+
+    monkeypatch.setattr(hubspot_module.http_pool.session, "post", fake_post)
+    collector = ContextCollectorAgent()
+    collector.hubspot = HubSpotClient(use_mirror=False)
+
+    async def run():
+        return await asyncio.gather(*[collector.acollect("555", use_cache=False) for _ in range(4)])
+
+    contextos = asyncio.run(run())
+
+    assert len(contextos) == 4
+    assert sum(1 for url in chamadas if "/contacts/search" in url) == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,186 @@
+"""
+Teste offline da fila de tarefas pós-resposta (workers, retries, spillover)
+"""
+
+import asyncio
+import os
+import threading
+
+from task_queue import BackgroundTaskQueue
+
+
+def _queue(tmp_path, **kwargs):
+    kwargs.setdefault("retry_delay", 0.01)
+    return BackgroundTaskQueue(name="teste", spill_path=str(tmp_path / "tasks.db"), **kwargs)
+
+
+def test_enqueue_returns_false_when_not_running(tmp_path):
+    queue = _queue(tmp_path)
+    queue.register("noop", lambda: None)
+
+    assert queue.enqueue("noop") is False
+
+
+def test_jobs_run_after_caller_returns(tmp_path):
+    queue = _queue(tmp_path)
+    feitos = []
+
+    async def avaliar(chat_id, score):
+        await asyncio.sleep(0.05)
+        feitos.append((chat_id, score))
+
+    queue.register("avaliar", avaliar)
+    queue.register("log", lambda texto: feitos.append(texto))
+
+    async def run():
+        await queue.start()
+        assert queue.enqueue("avaliar", chat_id="1", score=9)
+        assert queue.enqueue("log", texto="oi")
+        resposta_enviada = list(feitos)
+        await queue.join()
+        await queue.stop()
+        return resposta_enviada
+
+    assert asyncio.run(run()) == []
+    assert sorted(map(str, feitos)) == sorted(["('1', 9)", "oi"])
+    assert queue.stats()["completed"] == 2
+
+
+def test_failures_retry_then_dead_letter(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    tentativas = []
+
+    def quebra():
+        tentativas.append(1)
+        raise RuntimeError("supabase fora")
+
+    queue.register("quebra", quebra)
+
+    async def run():
+        await queue.start()
+        queue.enqueue("quebra")
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(run())
+    stats = queue.stats()
+
+    assert len(tentativas) == 2
+    assert stats["retried"] == 1
+    assert stats["dead_total"] == 1
+    assert "supabase fora" in stats["last_error"]
+
+
+def test_overflow_spills_to_disk_and_resumes_on_restart(tmp_path):
+    feitos = []
+
+    async def lento(n):
+        await asyncio.sleep(0.05)
+        feitos.append(n)
+
+    async def primeira_execucao():
+        queue = _queue(tmp_path, workers=1, max_size=2)
+        queue.register("lento", lento)
+        await queue.start()
+        for n in range(6):
+            assert queue.enqueue("lento", n=n)
+        spilled = queue.stats()["spilled"]
+        await queue.stop(timeout=0.01)
+        return spilled, queue.stats()["spilled_pending"]
+
+    spilled, pendentes = asyncio.run(primeira_execucao())
+    assert spilled >= 4
+    assert pendentes + len(feitos) == 6
+
+    async def segunda_execucao():
+        queue = _queue(tmp_path, workers=1, max_size=2)
+        queue.register("lento", lento)
+        await queue.start()
+        while queue.stats()["spilled_pending"] or queue.stats()["depth"]:
+            await queue.join()
+        await queue.stop()
+
+    asyncio.run(segunda_execucao())
+    assert sorted(feitos) == list(range(6))
+
+
+def test_shutdown_during_retry_backoff_spills_task(tmp_path):
+    """stop() no meio do backoff de uma nova tentativa não perde a tarefa"""
+    tentativas = []
+
+    def falha_uma_vez():
+        tentativas.append(1)
+        if len(tentativas) == 1:
+            raise RuntimeError("timeout no HubSpot")
+
+    async def primeira_execucao():
+        queue = _queue(tmp_path, retry_delay=5)
+        queue.register("falha_uma_vez", falha_uma_vez)
+        await queue.start()
+        queue.enqueue("falha_uma_vez")
+        while not queue.stats()["retried"]:
+            await asyncio.sleep(0.01)
+        await queue.stop(timeout=0.1)
+        return queue.stats()
+
+    stats = asyncio.run(primeira_execucao())
+    assert stats["spilled_pending"] == 1
+    assert stats["dead_total"] == 0
+
+    async def segunda_execucao():
+        queue = _queue(tmp_path)
+        queue.register("falha_uma_vez", falha_uma_vez)
+        await queue.start()
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(segunda_execucao())
+    assert len(tentativas) == 2
+
+
+def test_spill_file_opens_on_start(tmp_path):
+    """Criar a fila (singleton no import) não toca o disco"""
+    path = tmp_path / "dados" / "tasks.db"
+    queue = BackgroundTaskQueue(name="teste", spill_path=str(path))
+    assert not os.path.exists(path)
+    assert queue.stats()["spilled_pending"] == 0
+
+    async def run():
+        await queue.start()
+        await queue.stop()
+
+    asyncio.run(run())
+    assert os.path.exists(path)
+
+
+def test_shared_spill_file_restores_each_task_once(tmp_path):
+    """Dois processos (workers de shards) no mesmo arquivo não retomam a mesma tarefa"""
+    queues = [_queue(tmp_path, max_size=10) for _ in range(2)]
+    for n in range(200):
+        queues[0]._spill("lento", {"n": n}, 0)
+
+    retomadas = [[], []]
+    barreira = threading.Barrier(2)
+
+    def drenar(indice):
+        queue = queues[indice]
+        queue._queue = asyncio.Queue(maxsize=queue.max_size)
+        barreira.wait()
+        while queue._restore_spilled():
+            while not queue._queue.empty():
+                retomadas[indice].append(queue._queue.get_nowait()[1]["n"])
+
+    threads = [threading.Thread(target=drenar, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    todas = retomadas[0] + retomadas[1]
+    assert sorted(todas) == list(range(200))
+    assert retomadas[0] == sorted(retomadas[0])
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,95 @@
+"""
+Teste offline do caminho async da Tess (TessClient.agenerate / TessLLM.ainvoke)
+Usa httpx.MockTransport no AsyncClient compartilhado, sem rede
+"""
+
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from agents.llm.tess_llm import TessLLM
+from conversation_manager import ConversationManager, ConversationState
+from session_store import InMemorySessionStore
+from tess_client import FALLBACK_TEXT, TessClient
+
+
+async def _resposta_lenta(request):
+    await asyncio.sleep(0.2)
+    return httpx.Response(200, json={"choices": [{"message": {"content": " oi \n"}}]})
+
+
+def test_agenerate_does_not_block_event_loop(install_tess_mock):
+    """50 chamadas de 200ms em paralelo terminam em bem menos que 50 x 200ms"""
+    async def run():
+        install_tess_mock(_resposta_lenta)
+        client = TessClient()
+        inicio = time.monotonic()
+        respostas = await asyncio.gather(*[client.agenerate(f"prompt {i}") for i in range(50)])
+        return respostas, time.monotonic() - inicio
+
+    respostas, duracao = asyncio.run(run())
+
+    assert respostas == ["oi"] * 50
+    assert duracao < 2.0
+
+
+def test_agenerate_payload_matches_sync(install_tess_mock):
+    capturado = {}
+
+    async def handler(request):
+        capturado["url"] = str(request.url)
+        capturado["body"] = request.read()
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    async def run():
+        install_tess_mock(handler)
+        return await TessClient().agenerate("olá", max_tokens=50, temperature=0.9, agent_id="123")
+
+    assert asyncio.run(run()) == "ok"
+    assert capturado["url"].endswith("/agents/123/openai/chat/completions")
+
+    url, payload = TessClient()._build_chat_request("olá", 50, 0.9, "123")
+    assert capturado["url"] == url
+    assert httpx.Request("POST", url, json=payload).read() == capturado["body"]
+
+
+def test_agenerate_http_error_returns_fallback(install_tess_mock):
+    async def handler(request):
+        return httpx.Response(500, text="erro interno")
+
+    async def run():
+        install_tess_mock(handler)
+        return await TessClient().agenerate("olá")
+
+    assert asyncio.run(run()) == FALLBACK_TEXT
+
+
+def test_tess_llm_ainvoke_uses_async_path(install_tess_mock):
+    async def run():
+        install_tess_mock(_resposta_lenta)
+        llm = TessLLM(temperature=0.7, max_tokens=100, use_cache=False)
+        return await asyncio.gather(*[llm.ainvoke("teste") for _ in range(10)])
+
+    assert asyncio.run(run()) == ["oi"] * 10
+
+
+def test_missing_score_reply_uses_async_path(install_tess_mock):
+    """Sem nota na mensagem: o pedido de nota sai pelo httpx async, não por requests"""
+    async def handler(request):
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Entendi! Qual nota de 0 a 10?"}}]})
+
+    async def run():
+        install_tess_mock(handler)
+        manager = ConversationManager(InMemorySessionStore())
+        manager.transition_state("1", ConversationState.WAITING_SCORE)
+        # Texto único: não reaproveita resposta do cache de LLM
+        return await manager._handle_waiting_score("1", f"não sei dizer {uuid.uuid4()}")
+
+    assert asyncio.run(run()) == "Entendi! Qual nota de 0 a 10?"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))
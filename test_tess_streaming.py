@@ -0,0 +1,191 @@
+"""
+Teste offline do streaming da Tess (SSE) e da resposta progressiva no Telegram
+"""
+
+import asyncio
+import json
+
+import httpx
+
+from agents.empathetic_response import EmpatheticResponseGenerator
+from deadline import deadline_scope
+import telegram_client as telegram_module
+from tess_client import FALLBACK_TEXT, TessClient
+from telegram_client import TelegramClient, TelegramStreamingReply
+
+
+def _sse(*trechos):
+    linhas = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": trecho}}]})
+        for trecho in trechos
+    ]
+    linhas.append("data: [DONE]")
+    return "\n\n".join(linhas) + "\n\n"
+
+
+def test_astream_yields_sse_chunks(install_tess_mock):
+    payloads = []
+
+    async def handler(request):
+        payloads.append(json.loads(request.read()))
+        return httpx.Response(200, text=_sse("Olá", ", Ana", "!"),
+                              headers={"Content-Type": "text/event-stream"})
+
+    async def run():
+        install_tess_mock(handler)
+        return [chunk async for chunk in TessClient().astream("oi")]
+
+    assert asyncio.run(run()) == ["Olá", ", Ana", "!"]
+    assert payloads[0]["stream"] is True
+
+
+def test_astream_error_yields_fallback(install_tess_mock):
+    async def handler(request):
+        return httpx.Response(503, text="indisponível")
+
+    async def run():
+        install_tess_mock(handler)
+        return [chunk async for chunk in TessClient().astream("oi")]
+
+    assert asyncio.run(run()) == [FALLBACK_TEXT]
+
+
+def test_astream_stops_at_deadline(install_tess_mock):
+    """Tess trava no meio do stream: o stream termina no fim do orçamento"""
+    async def trava_depois_do_primeiro():
+        yield _sse("Olá").split("data: [DONE]")[0].encode()
+        await asyncio.sleep(30)
+
+    async def handler(request):
+        return httpx.Response(200, content=trava_depois_do_primeiro(),
+                              headers={"Content-Type": "text/event-stream"})
+
+    async def run():
+        install_tess_mock(handler)
+        with deadline_scope(1.5):
+            return await asyncio.wait_for(_collect(TessClient().astream("oi")), timeout=10)
+
+    async def _collect(stream):
+        return [chunk async for chunk in stream]
+
+    assert asyncio.run(run()) == ["Olá"]
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.eventos = []
+
+    async def send_message_returning_id(self, chat_id, text, parse_mode=None):
+        self.eventos.append(("send", text))
+        return 77
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        assert message_id == 77
+        self.eventos.append(("edit", text))
+        return True
+
+    async def send_message(self, chat_id, text):
+        self.eventos.append(("send_final", text))
+        return True
+
+
+def test_streaming_reply_sends_then_throttles_edits():
+    telegram = FakeTelegram()
+    reply = TelegramStreamingReply(telegram, 1, edit_interval=60, min_first_chars=5)
+
+    async def run():
+        await reply.update("Oi")                    # curto demais: ainda não envia
+        await reply.update("Oi, Ana")               # primeira mensagem
+        await reply.update("Oi, Ana! Obrigado")     # dentro do intervalo: sem edição
+        await reply.finish("Oi, Ana! Obrigado pela nota.")
+
+    asyncio.run(run())
+
+    assert telegram.eventos == [("send", "Oi, Ana"), ("edit", "Oi, Ana! Obrigado pela nota.")]
+    assert reply.finished and reply.delivered
+
+
+def test_streaming_reply_reports_failed_final_edit():
+    """Edição final falhou: o cliente só viu a parcial, quem chamou reenvia"""
+    telegram = FakeTelegram()
+
+    async def edit_fails(chat_id, message_id, text):
+        telegram.eventos.append(("edit_failed", text))
+        return False
+
+    telegram.edit_message_text = edit_fails
+    reply = TelegramStreamingReply(telegram, 1, edit_interval=60, min_first_chars=2)
+
+    async def run():
+        await reply.update("Oi, Ana")
+        return await reply.finish("Oi, Ana! Obrigado pela nota."), await reply.finish("de novo")
+
+    assert asyncio.run(run()) == (False, False)
+    assert reply.finished and not reply.delivered
+
+
+def test_streaming_reply_without_chunks_sends_once():
+    telegram = FakeTelegram()
+    reply = TelegramStreamingReply(telegram, 1)
+
+    asyncio.run(reply.finish("Resposta de fallback"))
+
+    assert telegram.eventos == [("send_final", "Resposta de fallback")]
+
+
+def test_empathetic_stream_feeds_sink(install_tess_mock):
+    async def handler(request):
+        return httpx.Response(200, text=_sse("Que bom, ", "obrigado ", "pela nota 10!"))
+
+    telegram = FakeTelegram()
+    reply = TelegramStreamingReply(telegram, 1, edit_interval=0, min_first_chars=1)
+
+    async def run():
+        install_tess_mock(handler)
+        generator = EmpatheticResponseGenerator()
+        generator.llm.response_cache = None
+        texto = await generator.astream_response(10, "adorei", on_partial=reply.update)
+        await reply.finish(texto)
+        return texto
+
+    assert asyncio.run(run()) == "Que bom, obrigado pela nota 10!"
+    assert telegram.eventos[0] == ("send", "Que bom,")
+    assert telegram.eventos[-1] == ("edit", "Que bom, obrigado pela nota 10!")
+
+
+
+def test_streaming_edits_reuse_one_http_client(monkeypatch):
+    """Envio e edições do streaming saem pelo mesmo AsyncClient do loop"""
+    requisicoes = []
+    clientes = []
+
+    def handler(request):
+        requisicoes.append(request.url.path.rsplit("/", 1)[-1])
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 7}})
+
+    class MockAsyncClient(httpx.AsyncClient):
+        def __init__(self, **kwargs):
+            super().__init__(transport=httpx.MockTransport(handler))
+            clientes.append(self)
+
+    monkeypatch.setattr(telegram_module.httpx, "AsyncClient", MockAsyncClient)
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "teste")
+    reply = TelegramStreamingReply(TelegramClient(), 1, edit_interval=0, min_first_chars=1)
+
+    async def run():
+        for texto in ("Oi", "Oi, Ana", "Oi, Ana!", "Oi, Ana! Obrigado"):
+            await reply.update(texto)
+        await reply.finish("Oi, Ana! Obrigado pela nota.")
+        aberto = not clientes[0].is_closed
+        await telegram_module.close_async_http_client()
+        return aberto
+
+    assert asyncio.run(run()) is True
+    assert requisicoes == ["sendMessage"] + ["editMessageText"] * 4
+    assert len(clientes) == 1
+    assert clientes[0].is_closed
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-v"]))